@@ -0,0 +1,118 @@
+"""SQLite 엔진 프로필 동시성 벤치마크
+
+프로필마다 새 DB 파일을 만들고, 쓰기 작업(save_emotion: 감정 기록 + 감정 상태 upsert)과
+읽기 작업(read_emotion_state: /chat이 캐시에 없는 사용자의 감정 상태를 읽는 경로)을 동시에 돌려 처리량, 지연 시간, lock 오류 수를 비교한다.
+프로필 이름 뒤에 "+echo"를 붙이면 SQL 로그를 켠 상태를 측정한다 (출력은 /dev/null로 보냄).
+
+    python bench/db_profile_bench.py --profiles default+echo,default,wal --writers 16 --readers 32
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "bench")  # src.settings import 조건 (실제 호출 없음)
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src import emotion
+from src.emotion import EMOTION_LABELS, emotion_states, read_emotion_state, save_emotion
+from src.models import Base
+from src.db import create_db_engine, uses_read_pool
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def worker(session_factory, operation, users, deadline, latencies, errors):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        user_name = f"user{rng.randrange(users)}"
+        started = time.perf_counter()
+        try:
+            async with session_factory() as db:
+                await operation(user_name, db, rng)
+        except Exception as e:
+            key = type(e).__name__ + (" (locked)" if "locked" in str(e) else "")
+            errors[key] = errors.get(key, 0) + 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def write(user_name, db, rng):
+    await save_emotion(user_name, rng.choice(EMOTION_LABELS), db)
+
+
+async def read(user_name, db, rng):
+    await read_emotion_state(user_name) # 캐시를 거치지 않고 읽기 pool에서 직접 조회
+
+
+async def run_profile(name, args):
+    profile, _, option = name.partition("+")
+    path = os.path.join(tempfile.mkdtemp(prefix="db_profile_bench_"), "bench.db")
+    url = f"sqlite+aiosqlite:///{path}"
+
+    # echo 로그 핸들러는 엔진 생성 시점의 stdout에 붙으므로 생성할 때 /dev/null로 돌려 둔다
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        engine = create_db_engine(url, profile=profile, echo=option == "echo")
+        read_engine = (
+            create_db_engine(url, profile=profile, read_only=True, echo=option == "echo")
+            if uses_read_pool(url, profile) else engine
+        )
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        ReadSession = sessionmaker(bind=read_engine, class_=AsyncSession, expire_on_commit=False)
+        emotion.ReadSessionLocal = ReadSession # 감정 상태 조회가 이 프로필의 읽기 pool을 쓰도록
+        emotion_states.clear()
+
+        write_latencies, read_latencies, errors = [], [], {}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(worker(Session, write, args.users, deadline, write_latencies, errors) for _ in range(args.writers)),
+            *(worker(ReadSession, read, args.users, deadline, read_latencies, errors) for _ in range(args.readers)),
+        )
+
+        if read_engine is not engine:
+            await read_engine.dispose()
+        await engine.dispose()
+
+    for kind, latencies in (("write", write_latencies), ("read", read_latencies)):
+        print(
+            f"{name:>14} {kind:>6} {len(latencies) / args.duration:>9.0f}"
+            f" {statistics.median(latencies) if latencies else 0:>8.2f}"
+            f" {percentile(latencies, 0.95):>8.2f} {percentile(latencies, 0.99):>8.2f}",
+            flush=True,
+        )
+    if errors:
+        print(f"{'':>14} errors: {errors}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="default+echo,default,wal", help="비교할 프로필 (쉼표 구분)")
+    parser.add_argument("--writers", type=int, default=16, help="동시 쓰기 작업 수")
+    parser.add_argument("--readers", type=int, default=32, help="동시 읽기 작업 수")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=10.0, help="프로필별 측정 시간 (초)")
+    args = parser.parse_args()
+
+    print(f"{'profile':>14} {'kind':>6} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in args.profiles.split(","):
+        await run_profile(name, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
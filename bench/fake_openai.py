@@ -0,0 +1,148 @@
+"""OpenAI API 대역 서버 (벤치마크 전용)
+
+ChatOpenAI / OpenAIEmbeddings / openai.chat.completions 가 쓰는 엔드포인트만 흉내 낸다.
+응답 지연(첫 토큰까지), 토큰 생성 속도, 임베딩 지연을 설정할 수 있어서
+OpenAI 키나 네트워크 없이 앱 자체의 처리량을 잴 수 있다.
+
+    python bench/fake_openai.py --port 8900 --latency-ms 300 --tokens-per-sec 50
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_BASE=http://127.0.0.1:8900/v1 uvicorn src.app:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+REPLY = "그랬구나, 오늘 하루 정말 고생 많았어. 잠깐 쉬면서 따뜻한 차 한 잔 어때? 내가 옆에서 들어줄게."
+MAIN_EMOTIONS = ["긍정", "부정", "중립"]
+
+config = {
+    "latency_ms": 300.0,
+    "tokens_per_sec": 50.0,
+    "reply_tokens": 40,
+    "embedding_latency_ms": 20.0,
+    "dim": 1536,
+}
+app = FastAPI(title="fake-openai")
+
+
+def count_tokens(text):
+    # 한국어 기준 대략 글자 2개당 1토큰
+    return max(1, len(text) // 2)
+
+
+def reply_for(messages):
+    """main.py의 감정 분석 프롬프트에는 정해진 라벨 중 하나로 답한다"""
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    if all(label in system for label in MAIN_EMOTIONS):
+        user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+        return MAIN_EMOTIONS[int(hashlib.md5(user.encode("utf-8")).hexdigest(), 16) % 3], 1
+    tokens = REPLY.split()
+    words = (tokens * (config["reply_tokens"] // len(tokens) + 1))[:config["reply_tokens"]]
+    return " ".join(words), len(words)
+
+
+def embed(item):
+    """텍스트(또는 토큰 id 목록)마다 항상 같은 단위 벡터"""
+    key = item if isinstance(item, str) else json.dumps(item)
+    seed = int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(config["dim"]).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-4")
+    content, completion_tokens = reply_for(messages)
+    usage = {
+        "prompt_tokens": sum(count_tokens(m.get("content") or "") for m in messages),
+        "completion_tokens": completion_tokens,
+    }
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    token_delay = 1 / config["tokens_per_sec"] if config["tokens_per_sec"] > 0 else 0
+
+    if not body.get("stream"):
+        await asyncio.sleep(config["latency_ms"] / 1000 + completion_tokens * token_delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    def chunk(delta, finish_reason=None, **extra):
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            **extra,
+        }, ensure_ascii=False) + "\n\n"
+
+    async def events():
+        await asyncio.sleep(config["latency_ms"] / 1000)
+        yield chunk({"role": "assistant", "content": ""})
+        for i, word in enumerate(content.split(" ")):
+            yield chunk({"content": word if i == 0 else " " + word})
+            await asyncio.sleep(token_delay)
+        yield chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk(None, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    await asyncio.sleep(config["embedding_latency_ms"] / 1000)
+    data = [{"object": "embedding", "index": i, "embedding": embed(item)} for i, item in enumerate(inputs)]
+    tokens = sum(count_tokens(item) if isinstance(item, str) else len(item) for item in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"], help="첫 토큰까지 지연")
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"], help="응답 토큰 생성 속도 (0이면 지연 없음)")
+    parser.add_argument("--reply-tokens", type=int, default=config["reply_tokens"], help="채팅 응답 토큰 수")
+    parser.add_argument("--embedding-latency-ms", type=float, default=config["embedding_latency_ms"])
+    parser.add_argument("--dim", type=int, default=config["dim"], help="임베딩 차원")
+    args = parser.parse_args()
+
+    config.update(
+        latency_ms=args.latency_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        embedding_latency_ms=args.embedding_latency_ms,
+        dim=args.dim,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
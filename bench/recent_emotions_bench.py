@@ -0,0 +1,131 @@
+"""최근 감정 기록 쿼리 벤치마크 (감정 상태 backfill 쿼리): 테이블이 커져도 조회 시간이 일정한지 확인
+
+src/models.py의 EmotionHistory 스키마(epoch 초 + (user_name, timestamp) 인덱스)와
+마이그레이션 이전 스키마(문자열 timestamp, id 인덱스만)에 같은 데이터를 채워 가며
+단계별로 `WHERE user_name = ? ORDER BY timestamp DESC LIMIT 5` 지연 시간을 잰다.
+
+    python bench/recent_emotions_bench.py --sizes 100000,1000000,10000000,30000000
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENAI_API_KEY", "bench")  # src.settings import 조건 (실제 호출 없음)
+
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from src.emotion import EMOTION_LABELS
+from src.models import EmotionHistory
+
+LEGACY_DDL = """
+CREATE TABLE emotion_history_legacy (
+    id INTEGER NOT NULL PRIMARY KEY,
+    user_name VARCHAR NOT NULL,
+    emotion VARCHAR NOT NULL,
+    timestamp VARCHAR NOT NULL
+);
+CREATE INDEX ix_emotion_history_legacy_id ON emotion_history_legacy (id);
+"""
+LEGACY_QUERY = (
+    "SELECT emotion, timestamp FROM emotion_history_legacy "
+    "WHERE user_name = ? ORDER BY timestamp DESC LIMIT 5"
+)
+
+
+def current_schema():
+    table = EmotionHistory.__table__
+    dialect = sqlite.dialect()
+    ddl = [str(CreateTable(table).compile(dialect=dialect))]
+    ddl += [str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes]
+    query = str(
+        select(EmotionHistory.emotion, EmotionHistory.timestamp)
+        .where(EmotionHistory.user_name == "?")
+        .order_by(EmotionHistory.timestamp.desc(), EmotionHistory.id.desc())
+        .limit(5)
+        .compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    ).replace("'?'", "?")
+    return ddl, " ".join(query.split())
+
+
+def fill(conn, table, start, stop, users, started_at, legacy):
+    """[start, stop) 구간의 행을 시간 순서대로 추가 (사용자는 무작위)"""
+    rng = random.Random(start)
+
+    def rows():
+        for i in range(start, stop):
+            timestamp = started_at + i // 10  # 초당 10건
+            if legacy:
+                timestamp = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+            yield (f"user{rng.randrange(users)}", rng.choice(EMOTION_LABELS), timestamp)
+
+    conn.executemany(f"INSERT INTO {table} (user_name, emotion, timestamp) VALUES (?, ?, ?)", rows())
+    conn.commit()
+
+
+def measure(conn, query, users, queries):
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(queries):
+        user_name = f"user{rng.randrange(users)}"
+        started = time.perf_counter()
+        conn.execute(query, (user_name,)).fetchall()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="측정할 테이블 크기 (쉼표 구분, 오름차순)")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200, help="크기별 조회 횟수")
+    parser.add_argument("--legacy-max", type=int, default=1000000, help="이 크기까지만 이전 스키마도 측정 (full scan이라 느림)")
+    parser.add_argument("--db", help="SQLite 파일 경로 (기본: 임시 파일)")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="emotion_bench_"), "bench.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    ddl, query = current_schema()
+    for statement in ddl:
+        conn.execute(statement)
+    conn.executescript(LEGACY_DDL)
+
+    print(f"DB: {path}")
+    print(f"query: {query}")
+    print(f"plan:  {conn.execute('EXPLAIN QUERY PLAN ' + query, ('user0',)).fetchall()}")
+    print(f"plan (legacy): {conn.execute('EXPLAIN QUERY PLAN ' + LEGACY_QUERY, ('user0',)).fetchall()}")
+    print()
+    print(f"{'rows':>12} {'p50 ms':>9} {'p95 ms':>9} {'legacy p50':>11} {'legacy p95':>11}")
+
+    started_at = int(time.time()) - 10 * 365 * 24 * 3600
+    filled = 0
+    for size in sizes:
+        fill(conn, "emotion_history", filled, size, args.users, started_at, legacy=False)
+        p50, p95 = measure(conn, query, args.users, args.queries)
+
+        legacy = ""
+        if size <= args.legacy_max:
+            fill(conn, "emotion_history_legacy", filled, size, args.users, started_at, legacy=True)
+            legacy_p50, legacy_p95 = measure(conn, LEGACY_QUERY, args.users, min(args.queries, 20))
+            legacy = f"{legacy_p50:>11.3f} {legacy_p95:>11.3f}"
+        filled = size
+        print(f"{size:>12,} {p50:>9.3f} {p95:>9.3f} {legacy}", flush=True)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
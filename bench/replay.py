@@ -0,0 +1,365 @@
+"""실제 대화 기록 재생 부하 도구: 저장된 DB의 사용자 발화를 익명화해서 /chat 으로 다시 보낸다
+
+    python bench/replay.py --source client.db --speed 60 --turns 20
+    python bench/replay.py --source client.db --url http://127.0.0.1:8000 --no-seed --speed 0
+
+원본 DB(읽기 전용)의 chat_messages / memory.chat_history JSON 과 emotion_history 를 읽어서
+- 사용자 이름은 해시로, 이메일/URL/전화번호/긴 숫자는 자리표시자로 바꾸고
+  (--scramble 이면 글자 자체를 고정 치환해서 길이와 반복 문구만 남김)
+- 사용자별 마지막 --turns 개 발화만 재생하고, 그 이전 대화와 감정 기록은 대상 DB에 미리 넣는다
+  (재생 시작 시 이미 긴 기록을 가진 사용자를 재현, 넣은 뒤 /admin/rebuild_index 시간도 측정)
+- 원래 발화 간격을 --speed 배 빠르게 (0이면 간격 없이), --max-gap 초로 상한을 두고 재생한다.
+  같은 사용자의 다음 발화는 이전 응답을 받은 뒤에 보낸다.
+
+결과는 요청 시점의 사용자 기록 길이(메시지 수) 구간별 지연 시간으로 출력한다.
+세션 캐시에 없는 첫 요청(cold: load_memory + shard 로드)과 이후 요청(warm)을 나눠서 보여 주고,
+app 대상이면 재생 전후 /metrics 차이로 단계별 평균 시간(load/save_memory, RAG 등)도 출력한다.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from run_bench import BENCH_ADMIN_TOKEN, SCENARIOS, bench_db_path, start_stack, stop_processes, wait_stack
+
+HISTORY_BUCKETS = [(0, 0), (1, 9), (10, 99), (100, 999), (1000, None)]
+REPORT_STAGES = ["chat_session", "load_emotion_state", "save_emotion", "rag_load_shard", "rag_embed", "rag_search", "llm", "save_memory", "rag_index_add"]
+
+PII_PATTERNS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"https?://\S+"), "<url>"),
+    (re.compile(r"(?<!\d)01[016789]-?\d{3,4}-?\d{4}(?!\d)"), "<phone>"),
+    (re.compile(r"\d{4,}"), lambda m: "0" * len(m.group())),
+]
+HANGUL_FIRST, HANGUL_COUNT = 0xAC00, 11172
+
+
+class Anonymizer:
+    """salt 기준 고정 치환: 같은 입력은 항상 같은 출력 (반복 문구, 길이 분포 유지)"""
+    def __init__(self, salt, scramble=False):
+        self.salt = salt
+        self.scramble = scramble
+        rng = random.Random(salt)
+        self.hangul = list(range(HANGUL_COUNT))
+        rng.shuffle(self.hangul)
+        self.latin = {}
+        for alphabet in ("abcdefghijklmnopqrstuvwxyz", "ABCDEFGHIJKLMNOPQRSTUVWXYZ"):
+            shuffled = rng.sample(alphabet, len(alphabet))
+            self.latin.update(zip(alphabet, shuffled))
+
+    def user(self, user_name):
+        return "replay-" + hashlib.sha256(f"{self.salt}:{user_name}".encode("utf-8")).hexdigest()[:12]
+
+    def text(self, text):
+        for pattern, replacement in PII_PATTERNS:
+            text = pattern.sub(replacement, text)
+        if self.scramble:
+            text = "".join(self._char(ch) for ch in text)
+        return text
+
+    def _char(self, ch):
+        code = ord(ch) - HANGUL_FIRST
+        if 0 <= code < HANGUL_COUNT:
+            return chr(HANGUL_FIRST + self.hangul[code])
+        return self.latin.get(ch, ch)
+
+
+def parse_timestamp(value):
+    """epoch 초(마이그레이션 이후) 또는 "%Y-%m-%d %H:%M:%S" 문자열(이전 스키마)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def load_source(path):
+    """원본 DB → ({user: [(role, content, created_at | None), ...]}, {user: [(emotion, epoch 초), ...]})"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    history = defaultdict(list)
+    if "chat_messages" in tables:
+        for user_name, role, content, created_at in conn.execute(
+            "SELECT user_name, role, content, created_at FROM chat_messages ORDER BY user_name, seq"
+        ):
+            history[user_name].append((role, content, created_at))
+    if "memory" in tables:
+        # chat_messages로 옮기지 않은 사용자만 JSON blob에서 읽음 (시각 정보 없음)
+        for user_name, chat_history in conn.execute("SELECT user_name, chat_history FROM memory"):
+            if user_name in history:
+                continue
+            try:
+                messages = json.loads(chat_history)
+            except json.JSONDecodeError:
+                continue
+            history[user_name] = [
+                (msg["type"], msg["content"], None)
+                for msg in messages if msg.get("type") in ("HumanMessage", "AIMessage") and msg.get("content")
+            ]
+
+    emotions = defaultdict(list)
+    if "emotion_history" in tables:
+        for user_name, emotion, timestamp in conn.execute(
+            "SELECT user_name, emotion, timestamp FROM emotion_history ORDER BY user_name, timestamp, id"
+        ):
+            emotions[user_name].append((emotion, parse_timestamp(timestamp)))
+    conn.close()
+    return history, emotions
+
+
+def turn_times(messages, emotions, default_gap):
+    """사용자 발화(HumanMessage)마다 원래 시각 추정
+
+    chat_messages.created_at을 쓰되, 마이그레이션으로 여러 발화가 같은 시각을 가진 경우와 JSON blob은
+    /chat 이 발화마다 남기는 emotion_history 시각을 뒤에서부터 맞춰 쓰고, 그것도 없으면 default_gap 간격으로 채운다.
+    """
+    created = [created_at for role, _, created_at in messages if role == "HumanMessage"]
+    duplicated = {t for t, count in Counter(created).items() if t is not None and count > 1}
+    times = [None if t is None or t in duplicated else float(t) for t in created]
+
+    emotion_times = [timestamp for _, timestamp in emotions]
+    offset = len(emotion_times) - len(times)
+    for i, t in enumerate(times):
+        if t is None and 0 <= offset + i < len(emotion_times):
+            times[i] = emotion_times[offset + i]
+
+    next_time = time.time()
+    for i in reversed(range(len(times))):
+        if times[i] is None or times[i] > next_time:
+            times[i] = next_time - default_gap
+        next_time = times[i]
+    return times
+
+
+def build_plan(history, emotions, anonymizer, args):
+    """재생할 발화 목록과 대상 DB에 미리 넣을 기록"""
+    rng = random.Random(args.seed)
+    users = sorted(set(history) | set(emotions))
+    if args.max_users and len(users) > args.max_users:
+        users = sorted(rng.sample(users, args.max_users))
+
+    turns, seed_messages, seed_emotions = [], [], []
+    for user_name in users:
+        messages = history.get(user_name, [])
+        user_emotions = emotions.get(user_name, [])
+        times = turn_times(messages, user_emotions, args.default_gap)
+        human_indexes = [i for i, (role, _, _) in enumerate(messages) if role == "HumanMessage"]
+        replayed = human_indexes[-args.turns:] if args.turns else human_indexes
+        if not replayed:
+            continue
+        anonymous = anonymizer.user(user_name)
+        first = replayed[0]
+        start_time = times[len(human_indexes) - len(replayed)]
+
+        seed_messages.extend(
+            (anonymous, seq, role, anonymizer.text(content), start_time)
+            for seq, (role, content, _) in enumerate(messages[:first])
+        )
+        seed_emotions.extend((anonymous, emotion, int(t)) for emotion, t in user_emotions if t < start_time)
+        for n, index in enumerate(replayed):
+            turns.append({
+                "user": anonymous,
+                "text": anonymizer.text(messages[index][1]),
+                "time": times[len(human_indexes) - len(replayed) + n],
+                "history": first,  # 재생 시작 시점의 기록 길이 (메시지 수)
+            })
+
+    turns.sort(key=lambda turn: turn["time"])
+    if args.max_requests:
+        turns = turns[:args.max_requests]
+    return turns, seed_messages, seed_emotions
+
+
+def schedule(turns, speed, max_gap):
+    """원래 간격을 speed 배로 줄이고 max_gap으로 상한을 둔 상대 시각(초)"""
+    offset, previous = 0.0, None
+    for turn in turns:
+        if previous is not None and speed > 0:
+            offset += min((turn["time"] - previous) / speed, max_gap)
+        previous = turn["time"]
+        turn["at"] = offset
+
+
+def seed_target(db_path, seed_messages, seed_emotions):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.executemany(
+        "INSERT INTO chat_messages (user_name, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)", seed_messages
+    )
+    conn.executemany("INSERT INTO emotion_history (user_name, emotion, timestamp) VALUES (?, ?, ?)", seed_emotions)
+    conn.commit()
+    conn.close()
+
+
+async def stage_totals(client):
+    """/metrics 의 chatbot_stage_seconds → {stage: (sum, count)}"""
+    totals = defaultdict(lambda: [0.0, 0])
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    for line in response.text.splitlines():
+        match = re.match(r'chatbot_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)', line)
+        if match:
+            kind, stage, value = match.groups()
+            totals[stage][kind == "count"] += float(value)
+    return totals
+
+
+async def replay(client, turns, make_body, concurrency):
+    """발화별 (요청 시점 기록 길이, cold 여부, 지연 ms | None)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    previous = {}  # user -> 직전 발화 task (같은 사용자는 순서대로)
+    history = {}  # user -> 현재 기록 길이
+    results = []
+    started = time.perf_counter()
+
+    async def send(turn, wait_for):
+        delay = turn["at"] - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if wait_for is not None:
+            await wait_for
+        user = turn["user"]
+        cold = user not in history
+        length = history.setdefault(user, turn["history"])
+        async with semaphore:
+            request_started = time.perf_counter()
+            try:
+                response = await client.post("/chat", json=make_body(user, turn["text"]))
+                response.raise_for_status()
+            except httpx.HTTPError:
+                results.append((length, cold, None))
+                return
+        results.append((length, cold, (time.perf_counter() - request_started) * 1000))
+        history[user] = length + 2  # Human + AI
+
+    tasks = []
+    for turn in turns:
+        task = asyncio.create_task(send(turn, previous.get(turn["user"])))
+        previous[turn["user"]] = task
+        tasks.append(task)
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - started
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+
+def print_report(results):
+    print(f"{'history':>10} {'kind':>5} {'n':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for low, high in HISTORY_BUCKETS:
+        label = f"{low}" if low == high else f"{low}-{high}" if high else f"{low}+"
+        for kind, cold in (("cold", True), ("warm", False)):
+            bucket = [
+                latency for length, is_cold, latency in results
+                if is_cold == cold and length >= low and (high is None or length <= high)
+            ]
+            if not bucket:
+                continue
+            ok = sorted(latency for latency in bucket if latency is not None)
+            p50 = f"{statistics.median(ok):.1f}" if ok else "-"
+            p95 = f"{percentile(ok, 0.95):.1f}" if ok else "-"
+            p99 = f"{percentile(ok, 0.99):.1f}" if ok else "-"
+            print(f"{label:>10} {kind:>5} {len(bucket):>6} {len(bucket) - len(ok):>5} {p50:>9} {p95:>9} {p99:>9}")
+
+
+def print_stages(before, after):
+    print(f"\n{'stage':>20} {'calls':>7} {'mean ms':>9}")
+    for stage in REPORT_STAGES:
+        total = after.get(stage, (0.0, 0))[0] - before.get(stage, (0.0, 0))[0]
+        count = after.get(stage, (0.0, 0))[1] - before.get(stage, (0.0, 0))[1]
+        if count:
+            print(f"{stage:>20} {int(count):>7} {total / count * 1000:>9.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", required=True, help="원본 SQLite DB 파일 (읽기 전용으로 열림)")
+    parser.add_argument("--target", choices=sorted(SCENARIOS), default="app")
+    parser.add_argument("--url", help="이미 실행 중인 대상 서버 (지정하지 않으면 fake OpenAI + 대상 앱을 새 DB로 띄움)")
+    parser.add_argument("--turns", type=int, default=20, help="사용자별로 재생할 마지막 발화 수 (0이면 전부, 이전 기록은 미리 넣음)")
+    parser.add_argument("--no-seed", action="store_true", help="이전 대화/감정 기록을 대상 DB에 넣지 않음")
+    parser.add_argument("--speed", type=float, default=60.0, help="원래 간격 대비 재생 속도 배수 (0이면 간격 없이)")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="재생 간격 상한 (초)")
+    parser.add_argument("--default-gap", type=float, default=30.0, help="시각 정보가 없는 발화 사이 간격 (초)")
+    parser.add_argument("--concurrency", type=int, default=64, help="동시 요청 상한")
+    parser.add_argument("--max-users", type=int, default=0, help="재생할 사용자 수 (0이면 전부, 무작위 추출)")
+    parser.add_argument("--max-requests", type=int, default=0, help="재생할 발화 수 상한 (0이면 전부)")
+    parser.add_argument("--scramble", action="store_true", help="글자를 고정 치환해서 원문을 남기지 않음")
+    parser.add_argument("--salt", default="replay", help="익명화 salt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-latency-ms", type=float, default=300)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=50)
+    parser.add_argument("--fake-embedding-latency-ms", type=float, default=20)
+    parser.add_argument("--env", action="append", default=[], help="대상 앱에 넘길 환경 변수 KEY=VALUE (여러 번 지정 가능)")
+    args = parser.parse_args()
+
+    history, emotions = load_source(args.source)
+    turns, seed_messages, seed_emotions = build_plan(history, emotions, Anonymizer(args.salt, args.scramble), args)
+    if not turns:
+        raise SystemExit(f"{args.source}: 재생할 사용자 발화가 없습니다.")
+    schedule(turns, args.speed, args.max_gap)
+    seeding = not args.no_seed and args.target == "app" and not args.url
+    if not seeding:
+        for turn in turns:
+            turn["history"] = 0
+    print(
+        f"사용자 {len({turn['user'] for turn in turns})}명, 발화 {len(turns)}개, 재생 시간 약 {turns[-1]['at']:.0f}초"
+        + (f", 미리 넣을 메시지 {len(seed_messages)}개 / 감정 {len(seed_emotions)}개" if seeding else "")
+    )
+
+    processes = ()
+    workdir = None
+    app_url = args.url
+    try:
+        if not args.url:
+            workdir = tempfile.mkdtemp(prefix=f"replay_{args.target}_")
+            fake, server, fake_url, app_url = start_stack(
+                args.target, workdir, args.fake_latency_ms, args.fake_tokens_per_sec, args.fake_embedding_latency_ms, args.env
+            )
+            processes = (server, fake)
+            await wait_stack(fake, server, fake_url, app_url, args.target)
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=app_url, timeout=300, limits=limits) as client:
+            if seeding:
+                # 앱이 시작하면서 만든 테이블에 직접 넣고, 인덱스 재생성으로 기록 크기별 빌드 시간 측정
+                seed_target(bench_db_path(workdir), seed_messages, seed_emotions)
+                started = time.perf_counter()
+                admin_token = dict(item.split("=", 1) for item in args.env).get("ADMIN_TOKEN", BENCH_ADMIN_TOKEN)
+                response = await client.post("/admin/rebuild_index", headers={"X-Admin-Token": admin_token})
+                response.raise_for_status()
+                print(f"FAISS 인덱스 재생성: 문서 {response.json()['data']['documents']}개, {time.perf_counter() - started:.2f}초")
+
+            before = await stage_totals(client) if args.target == "app" else None
+            results, elapsed = await replay(client, turns, SCENARIOS[args.target]["chat"][2], args.concurrency)
+            after = await stage_totals(client) if args.target == "app" else None
+    finally:
+        stop_processes(*processes)
+
+    ok = sum(1 for _, _, latency in results if latency is not None)
+    print(f"\n완료: {ok}/{len(results)}개 성공, {elapsed:.1f}초, {ok / elapsed:.1f} req/s\n")
+    print_report(results)
+    if before is not None:
+        print_stages(before, after)
+    if workdir:
+        print(f"\n로그: {workdir}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
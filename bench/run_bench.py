@@ -0,0 +1,308 @@
+"""오프라인 부하 벤치마크: fake OpenAI 서버 + 대상 앱(src.app / src.main)을 띄우고 동시성 단계별로 측정
+
+    python bench/run_bench.py --target app --concurrency 1,8,32 --requests 200
+    python bench/run_bench.py --target main --compare bench/results/<이전 sha>-main.json
+
+결과는 bench/results/<git sha>-<target>.json 으로 저장된다. --compare로 이전 결과와 비교하면
+p95 지연 시간이나 RPS가 --threshold(%) 이상 나빠진 항목을 표시한다.
+(감정 분석 BERT 모델과 tiktoken 인코딩은 로컬 캐시에 있어야 한다. OpenAI 호출만 대역으로 바꾼다.)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+TEXTS = [
+    "오늘 너무 힘들었어",
+    "시험 망쳐서 속상해",
+    "친구랑 싸워서 기분이 안 좋아",
+    "그냥 그런 하루였어",
+    "점심 맛있게 먹었어!",
+    "합격했어!! 너무 행복해",
+    "요즘 잠이 잘 안 와",
+    "주말에 여행 가기로 했어",
+]
+
+# 대상 앱별 시나리오: 이름 → (HTTP 메서드, 경로 템플릿, 요청 본문 생성 함수)
+SCENARIOS = {
+    "app": {
+        "chat": ("POST", "/chat", lambda user, text: {"user_name": user, "message": text}),
+        "analyze_emotion": ("POST", "/analyze_emotion/", lambda user, text: {"user_name": user, "text": text}),
+        "coach": ("POST", "/coach", lambda user, text: {"text": text}),
+    },
+    "main": {
+        "chat": ("POST", "/chat", lambda user, text: {"user_name": user, "text": text}),
+        "analyze_emotion": ("POST", "/analyze_emotion/", lambda user, text: {"user_name": user, "text": text}),
+        "get_memory": ("GET", "/get_memory/{user}", None),
+    },
+}
+READY_PATHS = {"app": "/ready", "main": "/openapi.json"}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    try:
+        sha = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, text=True).strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def process_usage(pid):
+    """(누적 CPU 초, RSS MB) — /proc 이 없는 환경이면 (None, None)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+        return cpu, rss
+    except (OSError, StopIteration):
+        return None, None
+
+
+def start_process(args, env=None, log_path=None):
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_http(url, timeout, process=None):
+    """200이 올 때까지 대기 (프로세스가 죽거나 /ready 가 실패 단계를 보고하면 바로 중단)"""
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{url}: process exited with code {process.returncode}")
+            try:
+                response = await client.get(url)
+                if response.status_code == 200:
+                    return
+                if response.status_code == 503 and response.json().get("errors"):
+                    raise RuntimeError(f"{url}: warm-up failed {response.json()['errors']}")
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"{url} did not become ready in {timeout}s")
+
+
+BENCH_ADMIN_TOKEN = "bench-admin"  # 벤치가 띄운 앱의 /admin API 토큰 (--env ADMIN_TOKEN=...으로 바꿀 수 있음)
+
+
+def bench_db_path(workdir):
+    return os.path.join(workdir, "bench.db")
+
+
+def start_stack(target, workdir, fake_latency_ms, fake_tokens_per_sec, fake_embedding_latency_ms, extra_env=()):
+    """fake OpenAI 서버와 대상 앱을 workdir의 새 DB/인덱스로 실행 → (fake 프로세스, 앱 프로세스, fake URL, 앱 URL)"""
+    fake_port, app_port = free_port(), free_port()
+    fake = start_process([
+        sys.executable, os.path.join(ROOT, "bench", "fake_openai.py"), "--port", str(fake_port),
+        "--latency-ms", str(fake_latency_ms), "--tokens-per-sec", str(fake_tokens_per_sec),
+        "--embedding-latency-ms", str(fake_embedding_latency_ms),
+    ], log_path=os.path.join(workdir, "fake_openai.log"))
+
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake_base = f"{fake_url}/v1"
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": fake_base,  # openai / langchain_openai
+        "OPENAI_API_BASE": fake_base,  # langchain_community OpenAIEmbeddings
+        "DB_PATH": bench_db_path(workdir),  # 파일 경로 그대로 (두 앱 모두 URL로 변환)
+        "FAISS_INDEX_PATH": os.path.join(workdir, "faiss"),
+        "LOG_LEVEL": "WARNING",
+        "ADMIN_TOKEN": BENCH_ADMIN_TOKEN,
+    }
+    env.update(item.split("=", 1) for item in extra_env)
+    server = start_process(
+        [sys.executable, "-m", "uvicorn", f"src.{target}:app", "--port", str(app_port), "--log-level", "warning"],
+        env=env, log_path=os.path.join(workdir, "server.log"),
+    )
+    return fake, server, fake_url, f"http://127.0.0.1:{app_port}"
+
+
+async def wait_stack(fake, server, fake_url, app_url, target):
+    await wait_http(f"{fake_url}/docs", 30, fake)
+    await wait_http(f"{app_url}{READY_PATHS[target]}", 300, server)
+
+
+def stop_processes(*processes):
+    for process in processes:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_level(client, scenario, concurrency, requests, users, seed):
+    method, path, make_body = scenario
+    rng = random.Random(seed)
+    jobs = [(f"bench-user-{rng.randrange(users)}", rng.choice(TEXTS)) for _ in range(requests)]
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while jobs:
+            user, text = jobs.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    method, path.format(user=user), json=make_body(user, text) if make_body else None
+                )
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def summarize(latencies, errors, elapsed, cpu_seconds, rss_mb):
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2) if ordered else None
+
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(ordered), 2) if ordered else None,
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "cpu_percent": round(cpu_seconds / elapsed * 100, 1) if cpu_seconds is not None else None,
+        "rss_mb": round(rss_mb, 1) if rss_mb is not None else None,
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':>16} {'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5} {'cpu%':>6} {'rss MB':>7}")
+    for name, levels in results.items():
+        for concurrency, r in levels.items():
+            print(
+                f"{name:>16} {concurrency:>5} {r['rps']:>8} {r['p50_ms']!s:>9} {r['p95_ms']!s:>9} {r['p99_ms']!s:>9}"
+                f" {r['errors']:>5} {r['cpu_percent']!s:>6} {r['rss_mb']!s:>7}"
+            )
+
+
+def compare(current, baseline, threshold):
+    """이전 결과 대비 p95/RPS 변화율 출력, 회귀 항목 수 반환"""
+    regressions = 0
+    print(f"\nvs {baseline['revision']} ({baseline['created_at']})")
+    print(f"{'scenario':>16} {'conc':>5} {'p95 Δ%':>9} {'rps Δ%':>9}")
+    for name, levels in current["results"].items():
+        for concurrency, r in levels.items():
+            base = baseline["results"].get(name, {}).get(concurrency)
+            if not base or not base["p95_ms"] or not base["rps"] or r["p95_ms"] is None:
+                continue
+            p95_delta = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+            rps_delta = (r["rps"] - base["rps"]) / base["rps"] * 100
+            regressed = p95_delta > threshold or rps_delta < -threshold
+            regressions += regressed
+            print(f"{name:>16} {concurrency:>5} {p95_delta:>+9.1f} {rps_delta:>+9.1f} {'⚠️ regression' if regressed else ''}")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=sorted(SCENARIOS), default="app")
+    parser.add_argument("--scenarios", help="실행할 시나리오 (쉼표 구분, 기본: 대상 앱의 전체)")
+    parser.add_argument("--concurrency", default="1,8,32", help="동시 요청 수 단계 (쉼표 구분)")
+    parser.add_argument("--requests", type=int, default=200, help="단계별 요청 수")
+    parser.add_argument("--users", type=int, default=50, help="요청에 쓸 사용자 수")
+    parser.add_argument("--fake-latency-ms", type=float, default=300)
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=50)
+    parser.add_argument("--fake-embedding-latency-ms", type=float, default=20)
+    parser.add_argument("--env", action="append", default=[], help="대상 앱에 넘길 환경 변수 KEY=VALUE (여러 번 지정 가능)")
+    parser.add_argument("--out", default=os.path.join(ROOT, "bench", "results"), help="결과 JSON 저장 디렉터리")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=10.0, help="회귀로 표시할 변화율 (%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="회귀가 있으면 종료 코드 1")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS[args.target]
+    names = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    workdir = tempfile.mkdtemp(prefix=f"bench_{args.target}_")
+    fake, server, fake_url, app_url = start_stack(
+        args.target, workdir, args.fake_latency_ms, args.fake_tokens_per_sec, args.fake_embedding_latency_ms, args.env
+    )
+
+    results = {}
+    try:
+        await wait_stack(fake, server, fake_url, app_url, args.target)
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        async with httpx.AsyncClient(base_url=app_url, timeout=120, limits=limits) as client:
+            for name in names:
+                # 모델/캐시/세션 초기화 비용이 첫 단계에 섞이지 않도록 몇 번 먼저 호출
+                await run_level(client, scenarios[name], 1, 5, args.users, seed=-1)
+                results[name] = {}
+                for i, concurrency in enumerate(levels):
+                    cpu_before, _ = process_usage(server.pid)
+                    latencies, errors, elapsed = await run_level(
+                        client, scenarios[name], concurrency, args.requests, args.users, seed=i
+                    )
+                    cpu_after, rss = process_usage(server.pid)
+                    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+                    results[name][str(concurrency)] = summarize(latencies, errors, elapsed, cpu, rss)
+    finally:
+        stop_processes(server, fake)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "target": args.target,
+        "config": {
+            "requests": args.requests,
+            "users": args.users,
+            "fake_latency_ms": args.fake_latency_ms,
+            "fake_tokens_per_sec": args.fake_tokens_per_sec,
+            "fake_embedding_latency_ms": args.fake_embedding_latency_ms,
+            "env": args.env,
+        },
+        "results": results,
+    }
+    print_results(results)
+    print(f"\n로그: {workdir}")
+
+    baseline = None
+    if args.compare:
+        # 같은 revision 결과와 비교할 때 덮어쓰기 전에 읽어 둠
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{report['revision']}-{args.target}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"결과 저장: {path}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
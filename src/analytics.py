@@ -0,0 +1,152 @@
+"""감정 집계 버킷(emotion_rollups) 갱신과 감정 추이 조회/차트"""
+import datetime
+import io
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.cache import LRUCache
+from src.models import Emotion, EmotionHistory, EmotionRollup, ReadSessionLocal, EMOTION_SCORES, ROLLUP_GRANULARITIES, ROLLUP_LABEL_COLUMNS
+from src.settings import ANALYTICS_CHART_CACHE_SIZE, ANALYTICS_UTC_OFFSET_HOURS
+
+ROLLUP_ORIGIN = -3 * 86400 # 1969-12-29 (월요일): 주 단위 버킷 시작 요일
+
+def align_bucket(timestamp, seconds):
+    """epoch 초(또는 NumPy 배열) → seconds 간격 버킷의 시작 epoch 초 (ANALYTICS_UTC_OFFSET_HOURS 기준 정렬)"""
+    shift = int(ANALYTICS_UTC_OFFSET_HOURS * 3600) - ROLLUP_ORIGIN
+    return (timestamp + shift) // seconds * seconds - shift
+
+def emotion_rollup_rows(observations):
+    """[(user_name, emotion, epoch 초), ...] → 버킷별로 합친 emotion_rollups 증분 값 목록"""
+    rollups = {}
+    for user_name, emotion, timestamp in observations:
+        if user_name is None: # 마이그레이션 이전 emotions 행
+            continue
+        column = ROLLUP_LABEL_COLUMNS.get(emotion)
+        for granularity, seconds in ROLLUP_GRANULARITIES.items():
+            key = (user_name, granularity, align_bucket(timestamp, seconds))
+            row = rollups.get(key)
+            if row is None:
+                row = rollups[key] = {
+                    "user_name": user_name, "granularity": granularity, "bucket": key[2], "count": 0, "score_sum": 0,
+                    **{name: 0 for name in ROLLUP_LABEL_COLUMNS.values()},
+                }
+            row["count"] += 1
+            row["score_sum"] += EMOTION_SCORES.get(emotion, 0)
+            if column is not None:
+                row[column] += 1
+    return list(rollups.values())
+
+def emotion_rollup_upsert():
+    """emotion_rollups upsert (기존 버킷에는 개수를 더함)"""
+    stmt = sqlite_insert(EmotionRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_name", "granularity", "bucket"],
+        set_={
+            name: getattr(EmotionRollup, name) + stmt.excluded[name]
+            for name in ("count", "score_sum", *ROLLUP_LABEL_COLUMNS.values())
+        },
+    )
+
+#감정 추이 분석
+# 시간/일/주 단위는 emotion_rollups 버킷만 읽고, 임의 간격(bucket_seconds)은 원본 감정 기록을 NumPy로 한 번에 집계한다.
+# 점이 ANALYTICS_MAX_POINTS를 넘으면 이웃한 버킷을 합친다 (개수/점수 합이라 평균이 정확히 유지됨).
+SCORE_VECTOR = np.array(list(EMOTION_SCORES.values()), dtype=np.int64)
+analytics_charts = LRUCache(ANALYTICS_CHART_CACHE_SIZE) # 데이터 해시 → 렌더링된 이미지 bytes
+
+async def load_rollup_series(user_name, granularity, start, end):
+    """emotion_rollups → (버킷 시작 epoch 초, 라벨별 개수 (n, 라벨 수), 전체 개수, 점수 합)"""
+    label_columns = [getattr(EmotionRollup, name) for name in ROLLUP_LABEL_COLUMNS.values()]
+    query = (
+        select(EmotionRollup.bucket, EmotionRollup.count, EmotionRollup.score_sum, *label_columns)
+        .where(EmotionRollup.user_name == user_name, EmotionRollup.granularity == granularity)
+    )
+    if start is not None:
+        query = query.where(EmotionRollup.bucket >= align_bucket(start, ROLLUP_GRANULARITIES[granularity]))
+    if end is not None:
+        query = query.where(EmotionRollup.bucket < end)
+    async with ReadSessionLocal() as db:
+        rows = (await db.execute(query.order_by(EmotionRollup.bucket))).all()
+    data = np.array(rows, dtype=np.int64).reshape(-1, 3 + len(label_columns))
+    return data[:, 0], data[:, 3:], data[:, 1], data[:, 2]
+
+async def load_raw_series(user_name, start, end, seconds):
+    """emotion_history + emotions 원본 행을 seconds 간격 버킷으로 집계 (비어 있는 버킷은 제외)
+
+    SQLite에서 (버킷, 라벨)별 개수까지만 GROUP BY 하고, 버킷 × 라벨 행렬은 NumPy로 만든다.
+    """
+    queries = [
+        select(table.emotion, table.timestamp).where(table.user_name == user_name)
+        for table in (EmotionHistory, Emotion)
+    ]
+    if start is not None:
+        queries = [query.where(query.selected_columns.timestamp >= start) for query in queries]
+    if end is not None:
+        queries = [query.where(query.selected_columns.timestamp < end) for query in queries]
+    source = queries[0].union_all(queries[1]).subquery()
+    bucket = align_bucket(source.c.timestamp, seconds).label("bucket")
+    async with ReadSessionLocal() as db:
+        rows = (await db.execute(
+            select(bucket, source.c.emotion, func.count()).group_by(bucket, source.c.emotion)
+        )).all()
+
+    starts = np.array([row[0] for row in rows], dtype=np.int64)
+    emotions = np.array([row[1] for row in rows], dtype=object)
+    row_counts = np.array([row[2] for row in rows], dtype=np.int64)
+    labels, label_inverse = np.unique(emotions, return_inverse=True)
+    # 알 수 없는 라벨은 마지막 열에 모아서 전체 개수에만 포함
+    label_index = np.array([list(EMOTION_SCORES).index(label) if label in EMOTION_SCORES else len(EMOTION_SCORES) for label in labels], dtype=np.int64)
+    buckets, bucket_inverse = np.unique(starts, return_inverse=True)
+    counts = np.zeros((len(buckets), len(EMOTION_SCORES) + 1), dtype=np.int64)
+    if rows:
+        np.add.at(counts, (bucket_inverse, label_index[label_inverse]), row_counts)
+    totals = counts.sum(axis=1)
+    counts = counts[:, :len(EMOTION_SCORES)]
+    return buckets, counts, totals, counts @ SCORE_VECTOR
+
+def downsample_series(series, seconds, max_points):
+    """버킷 범위가 max_points개를 넘으면 이웃한 factor개 버킷씩 합침 → (series, 합친 뒤 버킷 간격)"""
+    buckets, counts, totals, score_sums = series
+    if not len(buckets):
+        return series, seconds
+    span = int((buckets[-1] - buckets[0]) // seconds) + 1
+    if span <= max_points:
+        return series, seconds
+    factor = -(-span // max_points)
+    seconds *= factor
+    groups = (buckets - buckets[0]) // seconds
+    unique, starts = np.unique(groups, return_index=True)
+    return (
+        buckets[0] + unique * seconds,
+        np.add.reduceat(counts, starts, axis=0),
+        np.add.reduceat(totals, starts),
+        np.add.reduceat(score_sums, starts),
+    ), seconds
+
+def render_emotion_chart(user_name, series, seconds, image_format):
+    """평균 감정 점수(선) + 감정 수(막대) 차트 → PNG/SVG bytes (matplotlib은 처음 렌더링할 때 import)"""
+    try:
+        from matplotlib.figure import Figure
+    except ImportError as e:
+        raise ImportError("🚨 차트 렌더링에는 'matplotlib'이 필요합니다.") from e
+    buckets, _, totals, score_sums = series
+    times = [datetime.datetime.fromtimestamp(bucket) for bucket in buckets.tolist()]
+
+    # pyplot 전역 상태를 쓰지 않는 Figure API (스레드에서 렌더링)
+    figure = Figure(figsize=(10, 4))
+    score_axis = figure.subplots()
+    count_axis = score_axis.twinx()
+    count_axis.bar(times, totals, width=seconds / 86400 * 0.8, color="#d0d7e1", label="count")
+    count_axis.set_ylabel("count")
+    score_axis.set_zorder(count_axis.get_zorder() + 1)
+    score_axis.patch.set_visible(False)
+    score_axis.plot(times, score_sums / np.maximum(totals, 1), marker="o", color="#3465a4", label="avg score")
+    score_axis.set_ylim(-2.2, 2.2)
+    score_axis.set_yticks(list(EMOTION_SCORES.values()), list(EMOTION_SCORES))
+    score_axis.set_title(f"{user_name} emotion trend")
+    figure.autofmt_xdate()
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=image_format, bbox_inches="tight")
+    return buffer.getvalue()
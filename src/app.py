@@ -1,122 +1,163 @@
-import os
-from pydantic import BaseModel
-from sqlalchemy import text, Column, Integer, String
-from sqlalchemy import delete, insert
+"""Emotion AI Chatbot API (FastAPI 앱, 라우트, 서버 시작/종료, 관리 명령)
+
+기능별 구현은 모듈로 나뉘어 있다:
+    settings(환경 변수) · db/models(엔진, 테이블) · observability(로깅, 지표) · runtime(LLM, 실행 풀, 준비 상태)
+    emotion(감정 분석, 감정 기록/상태) · analytics(감정 집계, 추이) · sessions(대화 기록, 세션 캐시)
+    rag(임베딩 캐시, FAISS shard) · coaching(/coach 응답 캐시) · migrations(일회성 마이그레이션)
+
+Chatbot 세션, 사용자 감정 상태, 감정 기록 write-behind 큐, FAISS shard는 프로세스 메모리에 있으므로
+서버 프로세스는 DB 하나당 하나만 띄운다 (uvicorn --workers 1). 시작할 때 DB 파일 옆의 lock 파일로 확인한다.
+"""
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import func, insert
 from sqlalchemy.future import select
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.schema import ForeignKey
-from fastapi import FastAPI, Depends, HTTPException, Query
-from langchain_openai import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.schema import BaseRetriever
-from langchain.schema import HumanMessage, AIMessage
-from langchain.schema import SystemMessage, HumanMessage
-
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings.openai import OpenAIEmbeddings
-from langchain.chains.retrieval_qa.base import RetrievalQA
-from langchain.docstore.document import Document
-
-from transformers import pipeline
-from dotenv import load_dotenv
-from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+# 무거운 모듈(torch, transformers, langchain_openai, FAISS, langchain chains)은 처음 쓰는 곳에서 import 한다.
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import hashlib
+import hmac
+import asyncio
 import json
 import datetime
 
-# Load environment variables
-load_dotenv()
-
-# API Key and Database Path
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DB_URL = os.getenv("DB_PATH", "sqlite+aiosqlite:///./emotions.db")
+from src.analytics import (
+    EMOTION_SCORES, ROLLUP_GRANULARITIES, analytics_charts, downsample_series,
+    emotion_rollup_rows, emotion_rollup_upsert, load_raw_series, load_rollup_series, render_emotion_chart,
+)
+from src.coaching import coaching_cache, generate_coaching_response
+from src.db import dispose_db_engines
+from src.emotion import (
+    analyze_emotion, build_warning, classify_bulk, emotion_batcher, emotion_cache, emotion_pending, emotion_states,
+    emotion_writer, format_timestamp, load_emotion_model, load_emotion_state, recent_emotions_from_state, save_emotion,
+)
+from src.migrations import (
+    _emotion_rollups_missing, _migrate_emotion_timestamps, _migrate_memory_blobs, migrate_emotion_timestamps, migrate_memory_blobs,
+    rebuild_emotion_rollups,
+)
+from src.models import Base, Emotion, EmotionHistory, EmotionRollup, ReadSessionLocal, SessionLocal, engine, get_db, read_engine
+from src.observability import RequestContextMiddleware, log_dump, logger, metrics, record_llm_usage
+from src.rag import embeddings, load_memory_documents, messages_to_documents, rag_index, retrieve_context
+from src.runtime import (
+    acquire_process_lock, get_llm, llm_semaphore, readiness, startup_errors, startup_stage, startup_timings,
+)
+from src.sessions import chat_sessions
+from src.settings import (
+    ADMIN_TOKEN, ANALYTICS_MAX_POINTS, BLOCKING_POOL_SIZE, DB_URL, EMOTION_BACKEND, EMOTION_BULK_CHUNK_SIZE, EMOTION_BULK_MAX_ITEMS,
+    EMOTION_STATE_SIZE, EMOTION_WRITE_BEHIND, STARTUP_MODE, TORCH_NUM_THREADS,
+)
 
-if not OPENAI_API_KEY:
-    raise ValueError("🚨 OPENAI_API_KEY is missing.")
-OPENAI_API_KEY
 #FastAPI app
 app = FastAPI(title="Emotion AI Chatbot API", version="1.0")
-
-# Database setup (SQLAlchemy + Async)
-engine = create_async_engine(DB_URL, echo=True)
-SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
-Base = declarative_base()
-
-class Conversation(Base):
-    __tablename__ = "conversations"
-    id = Column(Integer, primary_key=True, index=True)
-
-class EmotionHistory(Base):
-    __tablename__ = "emotion_history"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_name = Column(String, nullable=False)
-    emotion = Column(String, nullable=False)
-    timestamp = Column(String, default=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"), nullable=False)
-class Emotion(Base):
-    __tablename__ = "emotions"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
-    emotion = Column(String, nullable=False)
-    timestamp = Column(String, default=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"), nullable=False)
-
-class Memory(Base):
-    __tablename__ = "memory"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_name = Column(String, unique=True, nullable=False)
-    chat_history = Column(String, nullable=False)
-
-# LLM 모델 설정
-llm = ChatOpenAI(model="gpt-4")
+app.add_middleware(RequestContextMiddleware)
+
+def _import_langchain():
+    """RAG/LLM 경로에서 쓰는 langchain 모듈 미리 import"""
+    for module in ("langchain_openai", "langchain_community.vectorstores", "langchain.memory"):
+        importlib.import_module(module)
+
+def _import_transformers():
+    """torch/transformers import (수 초 걸리므로 이벤트 루프 밖에서 실행)"""
+    if TORCH_NUM_THREADS:
+        import torch
+        torch.set_num_threads(TORCH_NUM_THREADS)
+    importlib.import_module("transformers")
+
+async def warm_up():
+    """감정 모델 로드 + 예열 추론, langchain import, RAG 인덱스 준비"""
+    try:
+        with startup_stage("import_transformers"):
+            await asyncio.to_thread(_import_transformers)
+        with startup_stage("load_emotion_model"):
+            emotion_classifier = await asyncio.to_thread(load_emotion_model, EMOTION_BACKEND)
+        with startup_stage("warmup_inference"):
+            await asyncio.to_thread(emotion_classifier, ["안녕, 오늘 기분 어때?"], truncation=True)
+        readiness["emotion_model"].set()
+
+        with startup_stage("import_langchain"):
+            await asyncio.to_thread(_import_langchain)
+        # FAISS 인덱스는 서버 시작 시 한 번만 준비 (없으면 DB로부터 빌드), 사용자 shard는 필요할 때 로드
+        with startup_stage("rag_index"):
+            if not await rag_index.load():
+                await rag_index.rebuild(load_memory_documents)
+            else:
+                # 시작할 때 chat_messages로 옮긴 기존 대화는 아직 인덱스에 없음
+                for user_name, messages in getattr(app.state, "migrated_memory", {}).items():
+                    await rag_index.add_documents(user_name, messages_to_documents(user_name, messages))
+        readiness["rag_index"].set()
+    except Exception as e:
+        logger.exception("🚨 warm-up 실패: %s", e)
+        # 기다리는 요청이 멈추지 않도록 남은 단계를 실패로 표시
+        for name, event in readiness.items():
+            if not event.is_set():
+                startup_errors[name] = str(e)
+                event.set()
+        if STARTUP_MODE != "lazy":
+            raise
 
 @app.on_event("startup")
 async def startup():
-    #Load Hugging Face sentiment model
-    global emotion_classifier
-    emotion_classifier = pipeline("sentiment-analysis", model="nlptown/bert-base-multilingual-uncased-sentiment")
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
-
-async def get_db():
-    async with SessionLocal() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
-
-async def save_emotion(user_name, emotion, db: AsyncSession):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    new_emotion = EmotionHistory(
-        user_name = user_name,
-        emotion=emotion,
-        timestamp=timestamp
-    )
-    
-    db.add(new_emotion)
-    await db.commit()
-    await db.refresh(new_emotion)
-    
-async def get_recent_emotions(user_name, db: AsyncSession, limit=5):
-    result = await db.execute(
-        select(EmotionHistory)
-        .where(EmotionHistory.user_name == user_name)
-        .order_by(EmotionHistory.timestamp.desc())
-        .limit(limit)
+    app.state.process_lock = acquire_process_lock(DB_URL)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
     )
-    emotions = result.scalars().all() or []
-    
-    return [
-        {
-            "emotion": emotion.emotion,
-            "timestamp": emotion.timestamp
-        }
-        for emotion in emotions
-    ]
+    for name in ("emotion_model", "rag_index"):
+        readiness[name] = asyncio.Event()
+    emotion_batcher.start()
+    chat_sessions.start()
+    if EMOTION_WRITE_BEHIND:
+        emotion_writer.start()
+
+    with startup_stage("db_create_all"):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+            # 문자열 timestamp 스키마가 남아 있으면 요청을 받기 전에 같은 트랜잭션에서 변환 (epoch 초 비교 쿼리가 틀린 결과를 내지 않도록)
+            migrated = await conn.run_sync(_migrate_emotion_timestamps)
+            rollups_missing = await conn.run_sync(_emotion_rollups_missing)
+            # 이전 memory JSON 대화가 남아 있으면 세션이 로드하기 전에 chat_messages로 합침
+            app.state.migrated_memory = await conn.run_sync(_migrate_memory_blobs)
+    if migrated:
+        emotion_states.clear()
+    for table, count in migrated.items():
+        logger.info("✅ %s timestamp 마이그레이션 완료: %d행", table, count)
+    if app.state.migrated_memory:
+        logger.info(
+            "✅ memory → chat_messages 마이그레이션 완료: 사용자 %d명, 메시지 %d개",
+            len(app.state.migrated_memory), sum(len(messages) for messages in app.state.migrated_memory.values())
+        )
+    if rollups_missing:
+        logger.warning("⚠️ 기존 감정 기록이 emotion_rollups에 집계되어 있지 않습니다. `python -m src.app rebuild-emotion-rollups`를 실행하세요.")
+    with startup_stage("coaching_cache"):
+        await coaching_cache.load()
+
+    #lazy 모드에서는 모델 로드를 기다리지 않고 바로 요청을 받는다 (준비 여부는 /ready 로 확인)
+    if STARTUP_MODE == "lazy":
+        app.state.warm_up_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    warm_up_task = getattr(app.state, "warm_up_task", None)
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    if stream_tasks:
+        await asyncio.wait(set(stream_tasks)) # 스트리밍 응답의 대화/감정 저장이 끝난 뒤 세션 정리
+    await emotion_batcher.stop()
+    await chat_sessions.stop()
+    await emotion_writer.stop()
+    await rag_index.save()
+    await dispose_db_engines(engine, read_engine)
+    if getattr(app.state, "process_lock", None) is not None:
+        app.state.process_lock.close()
 
 # API 요청 모델
 class ChatRequest(BaseModel):
@@ -127,101 +168,6 @@ class ChatResponse(BaseModel):
     user_name: str
     data: Dict
 
-#사용자별 대화 기록 관리 (SQLite 적용 가능)
-class Chatbot:
-    def __init__(self, user_name):
-        self.user_name = user_name
-        self.session_id = f"session_{user_name}" # 사용자별 session_id 추가
-        self.memory = ChatMessageHistory() #대화 기록 저장용
-        self.memory_buffer : ConversationBufferMemory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            max_token_limit=500
-        )
-    
-        if not self.memory_buffer.chat_memory.messages:
-            self.set_chatbot_personality()
-    
-    async def async_init(self, db: AsyncSession):
-        """챗봇 초기화 및 메모리 로드"""
-        await self.load_memory(db)
-        if not self.memory.messages:
-            self.set_chatbot_personality()
-    
-    def set_chatbot_personality(self):
-        """챗봇의 성격을 강제로 저장"""
-        intro_message = (
-            "나는 감성적이고 따뜻한 AI 채주야."
-            "네 감정을 깊이 이해하고, 언제나 네 편에서 함께할게."
-            "잔잔한 위로와 너드미 가득한 대화로, 너에게 소울메이트가 되어줄게."
-            "난 반말, 구어체로 말해."
-        )
-
-        system_message = SystemMessage(content=intro_message)
-        self.memory_buffer.chat_memory.messages.insert(0, system_message)   # 성격 메시지를 가장 처음에 주입
-
-        print(f"✅ 성격 주입 상태: {self.memory_buffer.chat_memory.messages}")
-    
-    def get_session_history(self, session_id):
-        """LangChain에서 요구하는 세션 히스토리 함수"""
-        return self.memory
-    
-    async def save_memory(self, db: AsyncSession):
-        """대화 기록을 SQLAlchemy 기반 DB에 저장"""
-        # 기존 기록 삭제
-        await db.execute(delete(Memory).where(Memory.user_name == self.user_name))
-        
-        # Langchain의 BaseMessage 객체는 JSON 직렬화 불가 → dict로 변환 후 저장
-        messages = [
-            {
-                "type": type(msg).__name__,
-                "content": msg.content
-            }
-            for msg in self.memory_buffer.chat_memory.messages
-        ]
-        
-        # 새 기록 저장
-        new_memory = Memory(
-            user_name=self.user_name,
-            chat_history=json.dumps(messages)
-        )
-        db.add(new_memory)
-        await db.commit()
-        await db.refresh(new_memory)
-
-    
-    async def load_memory(self, db: AsyncSession):
-        """SQLAlchemy에서 대화 기록 불러오기"""
-        result = await db.execute(
-            select(Memory.chat_history).where(Memory.user_name == self.user_name)
-        )
-        record = result.scalar()
-
-        if record:
-            try:
-                """
-                loaded_messages = json.loads(record)
-                self.memory_buffer.chat_memory.messages = [
-                    AIMessage(content=msg["content"]) if msg["type"] == "AIMessage" 
-                    else HumanMessage(content=msg["content"]) if msg["type"] == "HumanMessage"
-                    else SystemMessage(content=msg["content"]) if msg["type"] == "SystemMessage"
-                    for msg in loaded_messages
-                ]
-                """
-
-                # 기존 성격 메시지가 없으면 추가
-                if not any(isinstance(msg, SystemMessage) for msg in self.memory_buffer.chat_memory.messages):
-                    print("⚠️ 성격 메시지 없음 → 강제 주입")
-                    self.set_chatbot_personality()
-
-            except json.JSONDecodeError:
-                self.memory_buffer.chat_memory.messages = []
-                self.set_chatbot_personality()
-        else:
-            # 기록이 없으면 성격 설정
-            self.set_chatbot_personality()
-        
-        print(f"✅ 메모리 로드 상태: {self.memory_buffer.chat_memory.messages}")
 
 class EmotionRequest(BaseModel):
     user_name: str
@@ -237,121 +183,262 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "ok", "message": "Emotion AI Chatbot API is running."}
 
+@app.get("/ready", summary="Readiness Check")
+async def readiness_check():
+    """모델 로드와 예열이 끝났는지 확인 (준비 전에는 503)"""
+    stages = {name: event.is_set() and name not in startup_errors for name, event in readiness.items()}
+    ready = bool(stages) and all(stages.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "stages": stages, "timings": startup_timings, "errors": startup_errors}
+    )
+
+@app.get("/stats/tokens/{user_name}", summary="Conversation Token Usage")
+async def token_stats_endpoint(user_name: str):
+    """메모리에 있는 사용자 세션의 프롬프트 토큰 사용량"""
+    chatbot = chat_sessions.sessions.get(user_name)
+    if chatbot is None:
+        raise HTTPException(status_code=404, detail="No active session for this user.")
+    return {"status": "success", "data": {"user": user_name, **chatbot.token_stats()}}
+
+# 컴포넌트별 통계 (이름 → 통계 dict를 반환하는 함수)
+STATS_PROVIDERS = {
+    "startup": lambda: {"timings": startup_timings, "errors": startup_errors},
+    "chat_sessions": chat_sessions.stats,
+    "emotion_states": emotion_states.stats,
+    "emotion_writer": emotion_writer.stats,
+    "emotion_batcher": emotion_batcher.stats,
+    "emotion_cache": lambda: {**emotion_cache.stats(), "in_flight": len(emotion_pending)},
+    "analytics_charts": analytics_charts.stats,
+    "coaching_cache": coaching_cache.stats,
+    "embedding_cache": embeddings.stats,
+}
+
+@app.get("/stats", summary="Runtime Stats")
+async def stats_endpoint():
+    """배치 큐, 캐시 등 내부 컴포넌트 통계"""
+    return {name: provider() for name, provider in STATS_PROVIDERS.items()}
+
+def _numeric_stats(stats, prefix=""):
+    """중첩된 통계 dict에서 숫자 값만 (점으로 이은 이름, 값)으로 펼침"""
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _numeric_stats(value, f"{name}.")
+        elif isinstance(value, (int, float)) and value is not None:
+            yield name, float(value)
+
+@app.get("/metrics", summary="Prometheus Metrics")
+async def metrics_endpoint():
+    """단계별 지연 시간 histogram, LLM 토큰 수, /stats 수치를 Prometheus text format으로 노출"""
+    gauges = [
+        ("chatbot_component_stat", {"component": name, "stat": stat}, value)
+        for name, provider in STATS_PROVIDERS.items()
+        for stat, value in _numeric_stats(provider())
+    ]
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
 @app.post("/chat", response_model=EmotionResponse, summary="Chat with AI")
-async def chat_endpoint(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def chat_endpoint(
+    request: ChatRequest,
+    stream: bool = Query(False, description="true면 SSE로 감정 분석 결과 → LLM 토큰 순서로 스트리밍"),
+    db: AsyncSession = Depends(get_db)
+):
     """Chat with AI and analyze user emotion"""
     if not request.user_name or not request.message:
         raise HTTPException(status_code=400, detail="User name and message are required.")
     # 챗봇 초기화
-    print(f"🔍 사용자 요청: {request.user_name} - {request.message}")
+    logger.info("🔍 사용자 요청: %s", request.user_name, extra={"user": request.user_name, "message_chars": len(request.message), "sample": True})
+    log_dump("🔍 사용자 메시지: %s", request.message)
     if not request.user_name.strip():
         raise HTTPException(status_code=400, detail="User name cannot be empty.")
     if not request.message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty.")
-    # 챗봇 인스턴스 생성 및 초기화
-    print(f"🔧 챗봇 초기화: {request.user_name}")
-    chatbot = Chatbot(user_name=request.user_name)
-    # 챗봇 메모리 초기화
-    print(f"🧠 챗봇 메모리 초기화: {request.user_name}"
-    await chatbot.async_init(db)
-    
-    #사용자 감정 분석
-    emotion_result = analyze_emotion(request.message)
-    await save_emotion(request.user_name, emotion_result, db) # 감정 저장
-    
-    #최근 감정 변화 가져오기
-    recent_emotions = await get_recent_emotions(request.user_name,db)
-    
-    #최근 대화 기록 불러오기
-    #chatbot.load_memory()
-    #conversation_history = chatbot.memory.messages
+    # 챗봇 세션 가져오기 (대화 중인 사용자는 메모리에 있는 세션 재사용, 없으면 DB에서 로드)
+    # 응답을 만드는 동안 eviction되지 않도록 요청이 끝날 때까지 세션을 고정
+    logger.debug("🔧 챗봇 세션: %s", request.user_name)
+    async with chat_sessions.session(request.user_name, db) as chatbot:
+        #사용자 감정 분석
+        with metrics.timer("analyze_emotion"):
+            emotion_result = await analyze_emotion(request.message)
+        if stream:
+            return await stream_chat(request, chatbot, emotion_result)
+        with metrics.timer("save_emotion"):
+            emotion_state = await save_emotion(request.user_name, emotion_result, db) # 감정 저장 + 사용자 감정 상태 갱신
     
-    #연속된 부정 감정 감지 (최근 3개 중 2개 이상이 "부정"이면 경고)
-    recent_negative_emotions = [e for e in recent_emotions if "super negative" in e.get("emotion")]
-    if len(recent_negative_emotions) >= 2:
-        warning_message = f"요즘 계속 힘들어 보이네, 조금 쉬면서 자신을 돌보는 게 중요해. ({', '.join([e['timestamp'] for e in recent_negative_emotions])})"
-    else:
-        warning_message = None
+        #최근 감정 변화 가져오기 (감정 기록을 다시 조회하지 않고 갱신된 상태 사용)
+        recent_emotions = recent_emotions_from_state(emotion_state)
     
-    #최종 GPT 응답 생성
-    prompt_with_emotion_history = f"사용자 입력:{request.message}\n (참고: 최근 감정 변화 {recent_emotions})"
+        #최근 대화 기록 불러오기
+        #chatbot.load_memory()
+        #conversation_history = chatbot.memory.messages
     
-    #response = await chatbot.chat(prompt_with_emotion_history, db)
-    #chatbot.memory_buffer.chat_memory.messages.append(HumanMessage(content=request.message))
+        warning_message = build_warning(recent_emotions)
     
-    retriever = await setup_faiss_rag(db)
-    #RetreivalQA 내부에서 자동으로 HumanMessage와 AIMessage 모두 저장한다.
-    qa_chain = RetrievalQA.from_chain_type(llm, retriever=retriever, memory=chatbot.memory_buffer)
-    print(f"✅ RetrievalQA 메모리 상태: {qa_chain.memory.chat_memory.messages}")
+        #최종 GPT 응답 생성
+        async with chatbot.lock:
+            #RAG 실행: 질문은 한 번만 임베딩/검색하고, 관련도 임계값을 넘은 문서만 답변 생성에 바로 사용
+            docs = await retrieve_context(request.user_name, request.message)
+            logger.debug("🔎 RAG 반환 문서 %d개", len(docs))
+            log_dump("🔎 RAG 반환 문서: %s", docs)
+
+            async with llm_semaphore:
+                with metrics.timer("llm"):
+                    llm_message = await get_llm().ainvoke(build_chat_messages(chatbot, request.message, docs))
+            record_llm_usage("chat", llm_message)
+            response = llm_message.content
+            log_dump("✅ %s 응답: %s", "RAG 결과 기반" if docs else "관련 문서 없음 → 기본 LLM", response)
+            chatbot.memory_buffer.chat_memory.messages.append(HumanMessage(content=request.message))
+            chatbot.memory_buffer.chat_memory.messages.append(AIMessage(content=response))
+
+            # 대화 기록은 세션 매니저가 주기적으로/eviction 시 저장 (성격 메시지 포함)
+            chatbot.dirty = True
+
+        return {
+            "status": "success",
+            "data": {
+                "user": request.user_name,
+                "message": request.message,
+                "emotion" : emotion_result,
+                "recent_emotions": recent_emotions,
+                "warning": warning_message,
+                "response": response
+            }
+        }
+
 
-    #RAG 실행
-    docs = retriever.invoke(prompt_with_emotion_history)
-    print(f"🔎 RAG 반환 문서: {docs}")
 
+def build_chat_messages(chatbot, message, docs):
+    """LLM에 보낼 메시지: 대화 맥락 + 검색된 과거 대화 + 사용자 입력"""
+    messages = chatbot.context_messages()
     if docs:
-        response = qa_chain.invoke(request.message)
-        print(f"✅ RAG 결과 기반 응답: {response}")
-    else:
-        #llm.invoke는 memory랑 연결되지 않음.
-        response = llm.invoke(request.message).content
-        print(f"⚠️ RAG 실패 → 기본 LLM 응답: {response}")
-        chatbot.memory_buffer.chat_memory.messages.append(AIMessage(content=response_content))
-
-    # AI 응답 추가
-    if isinstance(response, dict) :
-        response_content = response.get("result") or str(response)
-    else:
-        response_content = str(response)
-    
-    #
+        context = "\n".join(f"- {doc.page_content}" for doc in docs)
+        messages.append(SystemMessage(content=f"참고할 만한 과거 대화:\n{context}"))
+    messages.append(HumanMessage(content=message))
+    return messages
+
+#SSE 스트리밍 (/chat?stream=true)
+# 감정 분석 결과와 경고를 먼저 보내고, LLM 토큰은 생성되는 대로 보낸다.
+# 대화 저장과 감정 저장은 스트림이 끝난 뒤 백그라운드에서 처리한다.
+class StreamStats:
+    """스트리밍 응답의 첫 토큰까지 시간(TTFT)과 전체 시간"""
+    def __init__(self):
+        self.streams = 0
+        self.ttft_total = 0.0
+        self.ttft_max = 0.0
+        self.duration_total = 0.0
+        self.errors = 0
+
+    def record(self, ttft, duration):
+        self.streams += 1
+        self.ttft_total += ttft
+        self.ttft_max = max(self.ttft_max, ttft)
+        self.duration_total += duration
+
+    def stats(self):
+        return {
+            "streams": self.streams,
+            "avg_ttft_ms": self.ttft_total / self.streams * 1000 if self.streams else 0.0,
+            "max_ttft_ms": self.ttft_max * 1000,
+            "avg_total_ms": self.duration_total / self.streams * 1000 if self.streams else 0.0,
+            "errors": self.errors,
+        }
 
-    # 저장 전 성격 메시지 유지
-    await chatbot.save_memory(db)
+stream_stats = StreamStats()
+STATS_PROVIDERS["chat_stream"] = stream_stats.stats
 
-    return {
-        "status": "success",
-        "data": {
-            "user": request.user_name,
-            "message": request.message,
-            "emotion" : emotion_result,
-            "recent_emotions": recent_emotions,
-            "warning": warning_message,
-            "response": response
-        }
-    }
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+stream_tasks = set() # 응답을 읽는 쪽과 별개로 끝까지 실행되는 생성/저장 task (GC 방지용 참조)
 
-# 감정 분석을 위한 LLM 모델
-emotion_model = ChatOpenAI(model_name="gpt-4")
+async def stream_chat(request: ChatRequest, chatbot, emotion_result):
+    """/chat 의 스트리밍 버전 (StreamingResponse 반환)
+    LLM 생성은 별도 task가 버퍼(queue)에 쌓으므로 클라이언트가 느리게 읽어도 llm_semaphore는 생성이 끝나면 바로 풀린다."""
+    started = time.perf_counter()
+    # 이번 감정은 스트림이 끝난 뒤 저장하므로 최근 기록 앞에 직접 붙인다
+    with metrics.timer("load_emotion_state"):
+        emotion_state = await load_emotion_state(request.user_name)
+    recent_emotions = (
+        [{"emotion": emotion_result, "timestamp": format_timestamp(time.time())}]
+        + recent_emotions_from_state(emotion_state, limit=EMOTION_STATE_SIZE - 1)
+    )
+    warning_message = build_warning(recent_emotions)
+    queue = asyncio.Queue() # (event, data), None이면 끝
+    generated = asyncio.Event() # 생성이 끝났으면 (이후의 저장 단계는 취소하지 않음)
 
-def analyze_emotion(text):
-    """Analyze emotion using Hugging Face model."""
-    if not text.strip():
-        return "neutral"  # 빈 입력일 경우 중립 처리
-    
-    try:
-        result = emotion_classifier(text)[0]
-        sentiment = result.get("label", "").lower()
-        
-        if "1 star" in sentiment:
-            return "super negative"
-        elif "2 stars" in sentiment:
-            return "negative"
-        elif "3 stars" in sentiment:
-            return "neutral"
-        elif "4 stars" in sentiment:
-            return "positive"
-        elif "5 stars" in sentiment:
-            return "super positive"
-        else:
-            # 예상되지 않은 값이 반환될 경우 기본값 처리
-            return "neutral"
-    
-    except Exception as e:
-        # 예외 발생 시 기본값 반환
-        print(f"Error in emotion analysis: {e}")
-        return "neutral"
+    async def generate():
+        chunks = []
+        ttft = None
+        try:
+            async with chatbot.lock:
+                try:
+                    docs = await retrieve_context(request.user_name, request.message)
+                    async with llm_semaphore:
+                        llm_started = time.perf_counter()
+                        async for chunk in get_llm().astream(build_chat_messages(chatbot, request.message, docs)):
+                            record_llm_usage("chat", chunk) # 사용량은 마지막 (빈) chunk에 옴
+                            if not chunk.content:
+                                continue
+                            if ttft is None:
+                                ttft = time.perf_counter() - started
+                                metrics.observe("chatbot_stage_seconds", time.perf_counter() - llm_started, stage="llm_first_token")
+                            chunks.append(chunk.content)
+                            queue.put_nowait(("token", {"content": chunk.content}))
+
+                        metrics.observe("chatbot_stage_seconds", time.perf_counter() - llm_started, stage="llm")
+                finally:
+                    # 중간에 실패하거나 취소돼도 생성된 부분까지는 대화 기록에 남김
+                    chatbot.memory_buffer.chat_memory.messages.append(HumanMessage(content=request.message))
+                    if chunks:
+                        chatbot.memory_buffer.chat_memory.messages.append(AIMessage(content="".join(chunks)))
+                    chatbot.dirty = True
+
+            duration = time.perf_counter() - started
+            stream_stats.record(ttft if ttft is not None else duration, duration)
+            queue.put_nowait(("done", {
+                "response": "".join(chunks),
+                "ttft_ms": round((ttft or duration) * 1000, 1),
+                "total_ms": round(duration * 1000, 1)
+            }))
+        except Exception as e:
+            logger.exception("🚨 스트리밍 응답 생성 실패: %s", e)
+            stream_stats.errors += 1
+            queue.put_nowait(("error", {"detail": f"Error: {e}", "partial_response": "".join(chunks)}))
+        finally:
+            generated.set()
+            queue.put_nowait(None)
+            try:
+                async with SessionLocal() as persist_db:
+                    with metrics.timer("save_emotion"):
+                        await save_emotion(request.user_name, emotion_result, persist_db)
+                await chat_sessions.write_back(chatbot)
+            except Exception as e:
+                logger.error("🚨 스트리밍 대화 저장 실패 (%s): %s", request.user_name, e)
+            finally:
+                chat_sessions.unpin(chatbot)
+
+    async def events():
+        try:
+            yield sse_event("emotion", {
+                "user": request.user_name,
+                "message": request.message,
+                "emotion": emotion_result,
+                "recent_emotions": recent_emotions,
+                "warning": warning_message
+            })
+            while (item := await queue.get()) is not None:
+                yield sse_event(*item)
+        finally:
+            # 클라이언트가 끊으면 생성을 멈춤 (지금까지 생성된 부분과 감정은 generate의 finally에서 저장)
+            if not generated.is_set():
+                task.cancel()
 
+    chat_sessions.pin(chatbot) # 생성과 저장이 끝날 때까지 고정 (/chat 핸들러는 응답 객체를 반환하면서 고정을 푼다)
+    task = asyncio.create_task(generate())
+    stream_tasks.add(task)
+    task.add_done_callback(stream_tasks.discard)
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 # Emotion Analysis API
 @app.post("/analyze_emotion/", response_model=EmotionResponse, summary="Analyze Emotion")
@@ -360,13 +447,17 @@ async def analyze_emotion_endpoint(request: EmotionRequest, db: AsyncSession = D
     try:
         user_name = request.user_name
         text = request.text
-        emotion_result = analyze_emotion(request.text)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        new_emotion = Emotion(conversation_id=1, emotion=emotion_result, timestamp=timestamp)
-        db.add(new_emotion)
-        await db.commit()
-        await db.refresh(new_emotion)
+        with metrics.timer("analyze_emotion"):
+            emotion_result = await analyze_emotion(request.text)
+        timestamp = int(time.time())
+        row = {"conversation_id": 1, "user_name": user_name, "emotion": emotion_result, "timestamp": timestamp}
+        with metrics.timer("save_emotion"):
+            if emotion_writer.active:
+                await emotion_writer.add_emotion(row)
+            else:
+                db.add(Emotion(**row))
+                await db.execute(emotion_rollup_upsert(), emotion_rollup_rows([(user_name, emotion_result, timestamp)]))
+                await db.commit()
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {e}")
@@ -377,28 +468,211 @@ async def analyze_emotion_endpoint(request: EmotionRequest, db: AsyncSession = D
             "user": user_name,
             "input_text": text,
             "analyzed_emotion": emotion_result,
-            "timestamp": timestamp
+            "timestamp": format_timestamp(timestamp)
+        }
+    }
+
+#대량 감정 분석
+# 야간 재분석 작업처럼 텍스트가 수천 개일 때 요청 하나로 받아서 chunk 단위로 batch 추론하고,
+# 결과는 chunk가 끝날 때마다 NDJSON으로 내보내며, 감정 기록은 마지막에 한 번의 bulk insert로 저장한다.
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl")
+
+async def read_bulk_items(request: Request):
+    """JSON 배열 또는 NDJSON 본문 → [(EmotionRequest | None, 오류 메시지 | None), ...]"""
+    raw_items = []
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_MEDIA_TYPES:
+        # 본문 전체를 한 번에 json.loads 하지 않고 줄 단위로 읽음 (잘못된 줄은 해당 항목만 오류)
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            raw_items.extend(line for line in lines if line.strip())
+            if len(raw_items) > EMOTION_BULK_MAX_ITEMS:
+                break
+        if buffer.strip():
+            raw_items.append(buffer)
+        parsed = []
+        for line in raw_items:
+            try:
+                parsed.append(json.loads(line))
+            except ValueError as e:
+                parsed.append(e)
+    else:
+        try:
+            parsed = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON.")
+        if not isinstance(parsed, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of {user_name, text} items.")
+
+    if len(parsed) > EMOTION_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items (max {EMOTION_BULK_MAX_ITEMS}).")
+
+    items = []
+    for value in parsed:
+        if isinstance(value, Exception):
+            items.append((None, f"Invalid JSON: {value}"))
+            continue
+        try:
+            items.append((EmotionRequest.model_validate(value), None))
+        except ValidationError as e:
+            error = e.errors()[0]
+            items.append((None, f"Invalid item: {'.'.join(map(str, error['loc'])) or 'item'}: {error['msg']}"))
+    return items
+
+
+@app.post("/analyze_emotion/batch", summary="Analyze Emotions in Bulk")
+async def analyze_emotion_batch_endpoint(request: Request):
+    """JSON 배열 또는 NDJSON(`{"user_name", "text"}` 한 줄에 하나)을 받아 결과를 NDJSON으로 스트리밍
+
+    항목마다 `{"index", "status", "data" | "error"}` 한 줄, 마지막 줄은 저장 결과 요약.
+    """
+    items = await read_bulk_items(request)
+
+    def line(payload):
+        return json.dumps(payload, ensure_ascii=False) + "\n"
+
+    async def results():
+        rows = []
+        for start in range(0, len(items), EMOTION_BULK_CHUNK_SIZE):
+            chunk = list(enumerate(items[start:start + EMOTION_BULK_CHUNK_SIZE], start))
+            valid = [(index, item) for index, (item, error) in chunk if item is not None]
+            output = {index: {"index": index, "status": "error", "error": error} for index, (item, error) in chunk if item is None}
+            with metrics.timer("analyze_emotion_bulk"):
+                emotions = await classify_bulk([item.text for _, item in valid])
+            timestamp = int(time.time())
+            for (index, item), emotion in zip(valid, emotions):
+                if isinstance(emotion, Exception):
+                    output[index] = {"index": index, "status": "error", "error": f"Error: {emotion}"}
+                    continue
+                rows.append({"conversation_id": 1, "user_name": item.user_name, "emotion": emotion, "timestamp": timestamp})
+                output[index] = {
+                    "index": index,
+                    "status": "success",
+                    "data": {
+                        "user": item.user_name,
+                        "input_text": item.text,
+                        "analyzed_emotion": emotion,
+                        "timestamp": format_timestamp(timestamp)
+                    }
+                }
+            for index, _ in chunk:
+                yield line(output[index])
+
+        # 분류가 끝난 뒤 한 트랜잭션으로 저장 (추론하는 동안 쓰기 lock을 잡지 않음)
+        summary = {"status": "done", "total": len(items), "succeeded": len(rows), "failed": len(items) - len(rows), "saved": 0}
+        if rows:
+            try:
+                with metrics.timer("save_emotion_bulk"):
+                    async with SessionLocal() as db:
+                        await db.execute(insert(Emotion), rows)
+                        await db.execute(
+                            emotion_rollup_upsert(),
+                            emotion_rollup_rows((row["user_name"], row["emotion"], row["timestamp"]) for row in rows)
+                        )
+                        await db.commit()
+                summary["saved"] = len(rows)
+            except Exception as e:
+                logger.error("🚨 대량 감정 기록 저장 실패 (%d개): %s", len(rows), e)
+                summary.update(status="error", error=f"Error saving results: {e}")
+        yield line(summary)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/analytics/emotions/{user_name}", summary="Emotion Trend")
+async def emotion_trend_endpoint(
+    user_name: str,
+    granularity: str = Query("auto", pattern="^(auto|hour|day|week)$", description="집계 단위 (auto: 범위에 맞춰 가장 촘촘한 단위)"),
+    bucket_seconds: Optional[int] = Query(None, ge=60, description="지정하면 원본 감정 기록을 이 간격으로 직접 집계"),
+    start: Optional[datetime.datetime] = Query(None, description="시작 시각 (포함)"),
+    end: Optional[datetime.datetime] = Query(None, description="끝 시각 (제외)"),
+    max_points: int = Query(ANALYTICS_MAX_POINTS, ge=1, le=10000, description="최대 점 개수 (넘으면 구간을 합침)"),
+    format: str = Query("json", pattern="^(json|png|svg)$"),
+):
+    """사용자 감정 점수(-2 ~ 2) 추이: 버킷별 감정 수, 평균 점수, 라벨별 개수"""
+    start_ts = int(start.timestamp()) if start else None
+    end_ts = int(end.timestamp()) if end else None
+
+    with metrics.timer("analytics_query"):
+        if bucket_seconds:
+            granularity = "custom"
+            seconds = bucket_seconds
+            first = start_ts
+            if first is None:
+                firsts = []
+                async with ReadSessionLocal() as db:
+                    for table in (EmotionHistory, Emotion):
+                        firsts.append((await db.execute(select(func.min(table.timestamp)).where(table.user_name == user_name))).scalar())
+                first = min((value for value in firsts if value is not None), default=None)
+            # 범위가 max_points개 버킷보다 넓으면 SQL 집계부터 넓은 간격으로 (원본 행을 버킷마다 옮기지 않음)
+            span = (end_ts or int(time.time())) - (first if first is not None else int(time.time()))
+            query_seconds = seconds * max(1, -(-span // (seconds * max_points)))
+            series = await load_raw_series(user_name, start_ts, end_ts, query_seconds)
+        else:
+            if granularity == "auto":
+                first = start_ts
+                if first is None:
+                    async with ReadSessionLocal() as db:
+                        first = (await db.execute(
+                            select(func.min(EmotionRollup.bucket))
+                            .where(EmotionRollup.user_name == user_name, EmotionRollup.granularity == "week")
+                        )).scalar()
+                span = (end_ts or int(time.time())) - (first if first is not None else int(time.time()))
+                granularity = next(
+                    (name for name, seconds in ROLLUP_GRANULARITIES.items() if span // seconds < max_points), "week"
+                )
+            series = await load_rollup_series(user_name, granularity, start_ts, end_ts)
+            seconds = ROLLUP_GRANULARITIES[granularity]
+        series, downsampled_seconds = downsample_series(series, query_seconds if bucket_seconds else seconds, max_points)
+    buckets, counts, totals, score_sums = series
+
+    if format != "json":
+        if not len(buckets):
+            raise HTTPException(status_code=404, detail="No emotion records in range.")
+        digest = hashlib.sha256()
+        for part in (user_name.encode("utf-8"), format.encode(), str(downsampled_seconds).encode(), *(array.tobytes() for array in series)):
+            digest.update(part)
+        image = analytics_charts.get(digest.hexdigest())
+        if image is None:
+            try:
+                with metrics.timer("analytics_render"):
+                    image = await asyncio.to_thread(render_emotion_chart, user_name, series, downsampled_seconds, format)
+            except ImportError as e:
+                raise HTTPException(status_code=501, detail=str(e))
+            analytics_charts.set(digest.hexdigest(), image)
+        return Response(content=image, media_type="image/png" if format == "png" else "image/svg+xml")
+
+    labels = list(EMOTION_SCORES)
+    return {
+        "status": "success",
+        "data": {
+            "user": user_name,
+            "granularity": granularity,
+            "bucket_seconds": downsampled_seconds,
+            "downsampled": downsampled_seconds != seconds,
+            "scores": EMOTION_SCORES,
+            "points": [
+                {
+                    "timestamp": format_timestamp(bucket),
+                    "epoch": bucket,
+                    "count": total,
+                    "avg_score": round(score_sum / total, 3) if total else None,
+                    "counts": dict(zip(labels, label_counts)),
+                }
+                for bucket, total, score_sum, label_counts in zip(buckets.tolist(), totals.tolist(), score_sums.tolist(), counts.tolist())
+            ],
         }
     }
 
-def generate_coaching_response(user_text):
-    """감정 분석 후, 사용자에게 맞춤형 AI 코칭 제공"""
-    emotion_result = analyze_emotion(user_text) # 감정 분석 실행
-    prompt = [
-        SystemMessage(content=f"사용자가 '{emotion_result}'감정을 보이고 있어. 감정 강도에 맞게 적절한 코칭 메시지를 제공해."),
-        HumanMessage(content=user_text)
-    ]
-    
-    coaching_response = emotion_model(prompt)
-    return {"emotion": emotion_result, "coaching": coaching_response.content}
 
 class CoachingRequest(BaseModel):
     text: str
 
 @app.post("/coach")
-def coach_endpoint(request: CoachingRequest):
+async def coach_endpoint(request: CoachingRequest):
     """ AI 코칭 API """
-    coaching_result = generate_coaching_response(request.text)
+    coaching_result = await generate_coaching_response(request.text)
     return {
         "text": request.text,
         "emotion": coaching_result["emotion"],
@@ -406,36 +680,44 @@ def coach_endpoint(request: CoachingRequest):
     }
 
 
-#RAG를 위한 FAISS 벡터 DB 설정
-async def setup_faiss_rag(db: AsyncSession):
-    """대화 기록을 벡터화하여 저장"""
-    result = await db.execute(select(Memory.user_name, Memory.chat_history))
-    data = result.fetchall()
 
-    documents = []
-    for row in data:
-        user_name, chat_history = row
-        try:
-            messages = json.loads(chat_history)
-            for msg in messages:
-                print(msg["type"])
-                doc = Document(
-                    page_content=msg["content"],
-                    metadata={"user": user_name, "type": msg["type"]}
-                )
-                documents.append(doc)
-        except json.JSONDecodeError:
-            continue
+def require_admin(x_admin_token: str = Header("")):
+    """ADMIN_TOKEN과 같은 X-Admin-Token 헤더가 있어야 /admin API 허용 (ADMIN_TOKEN이 없으면 비활성화)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+@app.post("/admin/rebuild_index", summary="Rebuild FAISS Index", dependencies=[Depends(require_admin)])
+async def rebuild_index_endpoint():
+    """DB 대화 기록으로 FAISS 인덱스 재생성"""
+    count = await rag_index.rebuild(load_memory_documents)
+    return {"status": "success", "data": {"documents": count}}
+
+
+startup_timings["import_app"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
+
+if __name__ == "__main__":
+    import argparse
+
+    async def _rebuild_index():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+        await rag_index.rebuild(load_memory_documents)
+
+    parser = argparse.ArgumentParser(description="Emotion AI Chatbot 관리 명령")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild-index", help="DB 대화 기록으로 FAISS 인덱스 재생성")
+    commands.add_parser("migrate-memory", help="memory 테이블의 JSON 대화 기록을 chat_messages로 이전")
+    commands.add_parser("migrate-emotion-timestamps", help="감정 테이블의 문자열 timestamp를 epoch 초 + (user_name, timestamp) 인덱스로 변환")
+    commands.add_parser("rebuild-emotion-rollups", help="감정 기록 전체로 시간/일/주 단위 감정 집계 재계산")
+    args = parser.parse_args()
 
-    if not documents:
-        print("⚠️ 벡터 DB 비어 있음 → 빈 retriever 반환")
-        class EmptyRetriever(BaseRetriever):
-            def get_relevant_documents(self, query: str):
-                return []
-        return EmptyRetriever()
-
-    # FAISS 벡터 DB 생성
-    vectorstore = FAISS.from_documents(documents, OpenAIEmbeddings())
-    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-    print("✅ 벡터 DB 생성 완료")
-    return retriever
+    if args.command == "rebuild-index":
+        asyncio.run(_rebuild_index())
+    elif args.command == "migrate-memory":
+        asyncio.run(migrate_memory_blobs())
+    elif args.command == "migrate-emotion-timestamps":
+        asyncio.run(migrate_emotion_timestamps())
+    elif args.command == "rebuild-emotion-rollups":
+        asyncio.run(rebuild_emotion_rollups())
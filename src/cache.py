@@ -0,0 +1,72 @@
+"""in-process LRU 캐시 (감정 분석 결과, 감정 상태, 임베딩, 코칭 응답, 차트 공용)"""
+import sys
+import time
+from collections import OrderedDict
+
+class LRUCache:
+    """간단한 in-process LRU 캐시 (항목 수/메모리 상한, 선택적 TTL)"""
+    def __init__(self, maxsize, max_bytes=None, ttl=None, sizeof=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.sizeof = sizeof or (lambda key, value: sys.getsizeof(key) + sys.getsizeof(value))
+        self.data = OrderedDict() # key -> (value, 만료 시각, 크기)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self.data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self.pop(key)
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.pop(key)
+        size = self.sizeof(key, value) if self.max_bytes else 0
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self.data[key] = (value, expires_at, size)
+        self.bytes += size
+        while len(self.data) > self.maxsize or (self.max_bytes and self.bytes > self.max_bytes and len(self.data) > 1):
+            _, (_, _, evicted_size) = self.data.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def setdefault(self, key, value):
+        """이미 (만료되지 않은) 값이 있으면 그 값을, 없으면 value를 저장하고 반환 (hit/miss 집계 없음)"""
+        entry = self.data.get(key)
+        if entry is not None and (entry[1] is None or entry[1] >= time.monotonic()):
+            return entry[0]
+        self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        entry = self.data.pop(key, None)
+        if entry is None:
+            return default
+        self.bytes -= entry[2]
+        return entry[0]
+
+    def clear(self):
+        self.data.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
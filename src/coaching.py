@@ -0,0 +1,198 @@
+"""/coach 코칭 응답 생성과 의미 기반 응답 캐시"""
+import asyncio
+import hashlib
+import time
+import numpy as np
+from sqlalchemy import delete
+from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from src.cache import LRUCache
+from src.emotion import analyze_emotion, normalize_text
+from src.models import CoachingCacheEntry, SessionLocal
+from src.observability import logger, metrics, record_llm_usage
+from src.rag import embeddings
+from src.runtime import get_emotion_model, llm_semaphore
+from src.settings import COACH_CACHE_SIMILARITY, COACH_CACHE_SIZE, COACH_CACHE_TTL
+
+#/coach 의미 기반 응답 캐시
+# 코칭 프롬프트는 감정 라벨 + 사용자 텍스트뿐이라, 같은(또는 거의 같은) 입력이면 GPT-4를 다시 부르지 않고 이전 코칭을 재사용한다.
+class CoachingCache:
+    """(감정, 정규화된 텍스트) 정확 일치 → 같은 감정 안에서 임베딩 유사도 순으로 조회하는 LRU 캐시"""
+    def __init__(self, maxsize, ttl, similarity):
+        self.lru = LRUCache(maxsize) # cache_key -> (emotion, text, response, vector, created_at)
+        self.ttl = ttl or None # 재시작 후에도 같은 기준을 쓰도록 wall-clock 생성 시각으로 만료 판단
+        self.similarity = similarity
+        self.matrices = {} # emotion -> (cache_key 목록, 정규화된 벡터 행렬), 항목이 바뀌면 다시 생성
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.lru.maxsize > 0
+
+    @property
+    def semantic(self):
+        return self.similarity <= 1
+
+    @staticmethod
+    def cache_key(emotion, text):
+        return hashlib.sha256(f"{emotion}\n{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def normalize_vector(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _get(self, key):
+        entry = self.lru.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry[4] > self.ttl:
+            self.lru.pop(key)
+            self.matrices.clear()
+            return None
+        return entry[2]
+
+    def _remember(self, key, entry):
+        self.lru.set(key, entry)
+        self.matrices.clear() # LRU eviction으로 다른 감정의 항목이 빠졌을 수도 있음
+
+    def _nearest(self, emotion, vector):
+        if emotion not in self.matrices:
+            candidates = [(key, entry[3]) for key, (entry, _, _) in self.lru.data.items()
+                          if entry[0] == emotion and entry[3] is not None]
+            self.matrices[emotion] = (
+                [key for key, _ in candidates],
+                np.stack([v for _, v in candidates]) if candidates else None,
+            )
+        keys, matrix = self.matrices[emotion]
+        if matrix is None:
+            return None
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self._get(keys[best])
+
+    async def lookup(self, emotion, text):
+        """캐시된 코칭 응답과 (miss일 때 저장에 쓸) 텍스트 벡터 반환"""
+        response = self._get(self.cache_key(emotion, text))
+        if response is not None:
+            self.exact_hits += 1
+            return response, None
+
+        vector = None
+        if self.semantic:
+            try:
+                vector = self.normalize_vector(await embeddings.aembed_query(text))
+            except Exception as e:
+                logger.warning("⚠️ 코칭 캐시 임베딩 실패: %s", e)
+            if vector is not None:
+                response = self._nearest(emotion, vector)
+                if response is not None:
+                    self.semantic_hits += 1
+                    return response, vector
+
+        self.misses += 1
+        return None, vector
+
+    async def store(self, emotion, text, response, vector):
+        key = self.cache_key(emotion, text)
+        created_at = time.time()
+        self._remember(key, (emotion, text, response, vector, created_at))
+        values = {
+            "cache_key": key,
+            "emotion": emotion,
+            "text": text,
+            "response": response,
+            "embedding": vector.tobytes() if vector is not None else None,
+            "created_at": created_at,
+        }
+        async with SessionLocal() as db:
+            stmt = sqlite_insert(CoachingCacheEntry).values(**values)
+            await db.execute(stmt.on_conflict_do_update(
+                index_elements=["cache_key"],
+                set_={name: stmt.excluded[name] for name in ("response", "embedding", "created_at")},
+            ))
+            await db.commit()
+
+    async def load(self):
+        """만료된 항목을 정리하고 최근 항목을 캐시 크기만큼 메모리에 올림"""
+        if not self.enabled:
+            return 0
+        async with SessionLocal() as db:
+            if self.ttl is not None:
+                await db.execute(delete(CoachingCacheEntry).where(CoachingCacheEntry.created_at < time.time() - self.ttl))
+                await db.commit()
+            result = await db.execute(
+                select(
+                    CoachingCacheEntry.cache_key, CoachingCacheEntry.emotion, CoachingCacheEntry.text,
+                    CoachingCacheEntry.response, CoachingCacheEntry.embedding, CoachingCacheEntry.created_at,
+                )
+                .order_by(CoachingCacheEntry.created_at.desc())
+                .limit(self.lru.maxsize)
+            )
+            rows = result.fetchall()
+
+        # 오래된 것부터 넣어서 최근 항목이 LRU 뒤쪽(가장 최근 사용)에 오도록
+        for key, emotion, text, response, blob, created_at in reversed(rows):
+            vector = np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+            self._remember(key, (emotion, text, response, vector, created_at))
+        return len(rows)
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self.lru),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "similarity": self.similarity,
+            "in_flight": len(coaching_pending),
+        }
+
+coaching_cache = CoachingCache(COACH_CACHE_SIZE, COACH_CACHE_TTL, COACH_CACHE_SIMILARITY)
+coaching_pending = {} # 생성 중인 cache_key → Future (동시에 들어온 같은 요청은 한 번만 GPT-4 호출)
+
+async def _generate_coaching(emotion_result, user_text, cache_text):
+    vector = None
+    if coaching_cache.enabled:
+        with metrics.timer("coach_cache_lookup"):
+            cached, vector = await coaching_cache.lookup(emotion_result, cache_text)
+        if cached is not None:
+            return cached
+
+    prompt = [
+        SystemMessage(content=f"사용자가 '{emotion_result}'감정을 보이고 있어. 감정 강도에 맞게 적절한 코칭 메시지를 제공해."),
+        HumanMessage(content=user_text)
+    ]
+    async with llm_semaphore:
+        with metrics.timer("coach_llm"):
+            coaching_response = await get_emotion_model().ainvoke(prompt)
+    record_llm_usage("coach", coaching_response)
+
+    if coaching_cache.enabled:
+        try:
+            await coaching_cache.store(emotion_result, cache_text, coaching_response.content, vector)
+        except Exception as e:
+            # 캐시 저장 실패는 응답에 영향 주지 않음
+            logger.warning("⚠️ 코칭 캐시 저장 실패: %s", e)
+    return coaching_response.content
+
+async def generate_coaching_response(user_text):
+    """감정 분석 후, 사용자에게 맞춤형 AI 코칭 제공"""
+    with metrics.timer("analyze_emotion"):
+        emotion_result = await analyze_emotion(user_text) # 감정 분석 실행
+    cache_text = normalize_text(user_text)
+    key = coaching_cache.cache_key(emotion_result, cache_text)
+    pending = coaching_pending.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(_generate_coaching(emotion_result, user_text, cache_text))
+        coaching_pending[key] = pending
+        pending.add_done_callback(lambda _: coaching_pending.pop(key, None))
+    return {"emotion": emotion_result, "coaching": await asyncio.shield(pending)}
@@ -0,0 +1,90 @@
+"""SQLAlchemy async 엔진 설정 (app.py / main.py 공용)
+
+DB_PATH에는 SQLAlchemy URL(sqlite+aiosqlite:///./emotions.db) 또는 SQLite 파일 경로(./emotions.db)를 줄 수 있다.
+앱 모듈(설정 검사, 모델, 로깅)을 import하지 않으므로 main.py처럼 엔진만 필요한 곳에서 가볍게 쓸 수 있다.
+"""
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_PROFILE = os.getenv("DB_PROFILE", "wal")  # default: SQLite 기본 설정 | wal: WAL + 튜닝 pragma + 읽기 전용 pool
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"  # SQL 로그 (요청마다 동기 stdout 출력이라 운영에서는 끄기)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # 쓰기 lock을 기다리는 최대 시간
+DB_MMAP_MB = int(os.getenv("DB_MMAP_MB", "256"))
+DB_CACHE_MB = int(os.getenv("DB_CACHE_MB", "64"))  # 연결별 page cache
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # 읽기/쓰기 pool 연결 수
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "8"))  # 읽기 전용 pool 연결 수 (wal 프로필)
+
+#SQLite 연결 프로필: 연결마다 적용할 pragma
+# wal 프로필에서는 읽기가 쓰기를 막지 않고, 쓰기 lock 경합은 "database is locked" 대신 busy_timeout 동안 대기한다.
+SQLITE_PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": DB_BUSY_TIMEOUT_MS,
+        "mmap_size": DB_MMAP_MB * 1024 * 1024,
+        "cache_size": -DB_CACHE_MB * 1024, # 음수는 KiB 단위
+        "temp_store": "MEMORY",
+    },
+}
+
+def normalize_db_url(url):
+    """SQLAlchemy URL은 그대로, 파일 경로만 준 경우 aiosqlite URL로 변환"""
+    if "://" not in str(url):
+        url = f"sqlite+aiosqlite:///{url}"
+    return make_url(url)
+
+def sqlite_file(url):
+    """SQLite 파일 DB면 파일 경로, 메모리 DB나 다른 DB면 None"""
+    url = normalize_db_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database
+
+def create_db_engine(url, profile=DB_PROFILE, read_only=False, pool_size=DB_POOL_SIZE, echo=DB_ECHO):
+    """프로필 pragma를 적용한 async 엔진 생성 (read_only면 query_only 연결)"""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"🚨 Unknown DB_PROFILE: {profile}")
+    url = normalize_db_url(url)
+    sqlite = url.get_backend_name() == "sqlite"
+    in_memory = sqlite and url.database in (None, "", ":memory:")
+
+    # 메모리 DB는 연결 하나(StaticPool)를 공유하므로 pool 크기를 지정하지 않음
+    engine = create_async_engine(url, echo=echo, **({} if in_memory else {"pool_size": pool_size}))
+    if not sqlite:
+        return engine
+
+    pragmas = dict(SQLITE_PROFILES[profile])
+    if read_only:
+        pragmas.pop("journal_mode", None) # journal_mode는 DB 파일 단위 설정이라 쓰기 엔진에서 한 번만
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def apply_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+def uses_read_pool(url, profile=DB_PROFILE):
+    """별도 읽기 pool은 WAL 파일 DB에서만 의미가 있음 (rollback journal에서는 읽기도 쓰기와 경합)"""
+    return profile == "wal" and sqlite_file(url) is not None
+
+def create_db_engines(url, profile=DB_PROFILE):
+    """(읽기/쓰기 엔진, 읽기 전용 엔진), 별도 읽기 pool을 쓰지 않으면 둘은 같은 엔진"""
+    engine = create_db_engine(url, profile=profile)
+    if not uses_read_pool(url, profile):
+        return engine, engine
+    return engine, create_db_engine(url, profile=profile, read_only=True, pool_size=DB_READ_POOL_SIZE)
+
+async def dispose_db_engines(engine, read_engine):
+    if read_engine is not engine:
+        await read_engine.dispose()
+    await engine.dispose()
@@ -0,0 +1,544 @@
+"""감정 분석(BERT 배치 추론 + 결과 캐시)과 감정 기록/사용자 감정 상태 저장"""
+import asyncio
+import datetime
+import json
+import os
+import time
+from sqlalchemy import func, insert
+from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.analytics import emotion_rollup_rows, emotion_rollup_upsert
+from src.cache import LRUCache
+from src.models import Emotion, EmotionHistory, EmotionState, ReadSessionLocal, SessionLocal
+from src.observability import logger
+from src.runtime import inference_executor, wait_ready
+from src.settings import (
+    EMOTION_BATCH_SIZE, EMOTION_BATCH_WAIT_MS, EMOTION_CACHE_MAX_MB, EMOTION_CACHE_SIZE, EMOTION_CACHE_TTL,
+    EMOTION_ONNX_PATH, EMOTION_QUEUE_MAXSIZE, EMOTION_STATE_CACHE_SIZE, EMOTION_STATE_SIZE,
+    EMOTION_WRITE_BATCH_SIZE, EMOTION_WRITE_INTERVAL_MS, EMOTION_WRITE_QUEUE_MAXSIZE, INFERENCE_POOL_SIZE,
+)
+
+LEGACY_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S" # 이전 스키마가 저장하던 로컬 시각 문자열
+
+def to_epoch(timestamp):
+    """epoch 초(int/float/숫자 문자열) 또는 이전 스키마의 로컬 시각 문자열 → epoch 초"""
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        return int(timestamp)
+    if isinstance(timestamp, str):
+        try:
+            return int(float(timestamp))
+        except ValueError:
+            pass
+        try:
+            return int(time.mktime(datetime.datetime.strptime(timestamp, LEGACY_TIMESTAMP_FORMAT).timetuple()))
+        except ValueError:
+            pass
+    raise ValueError(f"🚨 Unsupported timestamp: {timestamp!r}")
+
+def format_timestamp(timestamp):
+    """epoch 초 → API 응답용 로컬 시각 문자열"""
+    return datetime.datetime.fromtimestamp(to_epoch(timestamp)).strftime(LEGACY_TIMESTAMP_FORMAT)
+
+def normalize_recent(recent):
+    """[[emotion, timestamp], ...]의 timestamp를 epoch 초로 통일 (마이그레이션 이전에 만들어진 상태 행 대비)"""
+    return [[emotion, to_epoch(timestamp)] for emotion, timestamp in recent]
+
+def emotion_state_upsert():
+    """emotion_state upsert (누적 개수가 더 큰 상태만 반영)"""
+    stmt = sqlite_insert(EmotionState)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_name"],
+        set_={name: stmt.excluded[name] for name in ("recent", "counts", "total", "updated_at")},
+        where=EmotionState.total < stmt.excluded.total,
+    )
+
+#감정 기록 write-behind
+# 요청마다 한 행씩 commit(fsync)하지 않고, 큐에 모았다가 크기/시간 기준으로 한 트랜잭션에 bulk insert 한다.
+# flush 전의 행은 pending에 남겨서 같은 사용자의 조회에 바로 보이게 한다. (uvicorn worker 1개 기준)
+class EmotionWriteBehind:
+    """EmotionHistory / Emotion / EmotionState 쓰기 배치 큐"""
+    def __init__(self, max_batch_size, max_wait_ms, max_queue_size):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.queue = None
+        self.loop = None
+        self.worker = None
+        self.pending_states = {} # user_name -> 아직 flush되지 않은 최신 감정 상태
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.errors = 0
+        self.dropped = 0
+
+    @property
+    def active(self):
+        return self.worker is not None
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """남은 행을 모두 flush하고 종료"""
+        if self.worker is None:
+            return
+        await self.queue.put(None)
+        await self.worker
+        self.worker = None
+
+    async def add_history(self, row):
+        await self.queue.put(("history", row))
+
+    async def add_emotion(self, row):
+        await self.queue.put(("emotion", row))
+
+    async def add_state(self, user_name, state, row):
+        self.pending_states[user_name] = state
+        await self.queue.put(("state", row))
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = self.loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1] is not None:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+                # 종료 신호 뒤에 들어온 행까지 비우기
+                while not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def _write(self, history, emotions, states):
+        async with SessionLocal() as db:
+            if history:
+                await db.execute(insert(EmotionHistory), history)
+            if emotions:
+                await db.execute(insert(Emotion), emotions)
+            if history or emotions:
+                rollups = emotion_rollup_rows((row["user_name"], row["emotion"], row["timestamp"]) for row in history + emotions)
+                await db.execute(emotion_rollup_upsert(), rollups)
+            if states:
+                await db.execute(emotion_state_upsert(), states)
+            await db.commit()
+
+    async def _flush(self, batch):
+        history, emotions, states = [], [], {}
+        for kind, row in batch:
+            if kind == "history":
+                history.append(row)
+            elif kind == "emotion":
+                emotions.append(row)
+            elif row["user_name"] not in states or states[row["user_name"]]["total"] < row["total"]:
+                states[row["user_name"]] = row # 같은 사용자는 최신 상태만
+
+        attempts = 3
+        for attempt in range(attempts):
+            try:
+                await self._write(history, emotions, list(states.values()))
+            except Exception as e:
+                self.errors += 1
+                logger.warning("⚠️ 감정 기록 flush 실패 (%d/%d): %s", attempt + 1, attempts, e)
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+            else:
+                self.batches += 1
+                self.rows += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                break
+        else:
+            self.dropped += len(batch)
+            logger.error("🚨 감정 기록 %d행을 저장하지 못하고 버렸습니다.", len(batch))
+
+        for user_name, row in states.items():
+            state = self.pending_states.get(user_name)
+            if state is not None and state["total"] <= row["total"]:
+                del self.pending_states[user_name]
+
+    def stats(self):
+        return {
+            "enabled": self.active,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "pending_users": len(self.pending_states),
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "errors": self.errors,
+            "dropped": self.dropped,
+        }
+
+emotion_writer = EmotionWriteBehind(EMOTION_WRITE_BATCH_SIZE, EMOTION_WRITE_INTERVAL_MS, EMOTION_WRITE_QUEUE_MAXSIZE)
+
+#사용자별 감정 상태 캐시 (EmotionState 행의 in-process 사본)
+emotion_states = LRUCache(EMOTION_STATE_CACHE_SIZE)
+committing_states = {} # user_name -> 커밋 중인 상태 (캐시에서 밀려나도 커밋 전에는 DB 대신 이 값을 읽음)
+
+async def _backfill_emotion_state(user_name, db: AsyncSession):
+    """EmotionState 행이 없는 기존 사용자는 감정 기록에서 한 번 계산"""
+    recent = await db.execute(
+        select(EmotionHistory.emotion, EmotionHistory.timestamp)
+        .where(EmotionHistory.user_name == user_name)
+        .order_by(EmotionHistory.timestamp.desc(), EmotionHistory.id.desc())
+        .limit(EMOTION_STATE_SIZE)
+    )
+    counts = await db.execute(
+        select(EmotionHistory.emotion, func.count())
+        .where(EmotionHistory.user_name == user_name)
+        .group_by(EmotionHistory.emotion)
+    )
+    counts = dict(counts.fetchall())
+    recent = normalize_recent(recent.fetchall())
+    return {
+        "recent": recent,
+        "counts": counts,
+        "total": sum(counts.values()),
+        "updated_at": recent[0][1] if recent else 0,
+    }
+
+async def read_emotion_state(user_name):
+    """읽기 전용 pool에서 emotion_state 행을 읽음, 없으면 감정 기록에서 계산"""
+    async with ReadSessionLocal() as db:
+        row = (await db.execute(
+            select(EmotionState.recent, EmotionState.counts, EmotionState.total, EmotionState.updated_at)
+            .where(EmotionState.user_name == user_name)
+        )).first()
+        if row is None:
+            return await _backfill_emotion_state(user_name, db)
+    return {"recent": normalize_recent(json.loads(row.recent)), "counts": json.loads(row.counts), "total": row.total, "updated_at": row.updated_at}
+
+async def load_emotion_state(user_name):
+    """사용자 감정 상태 (메모리 캐시 → 아직 커밋/flush되지 않은 상태 → 읽기 전용 pool 순서로 조회)
+    방금 쓴 상태는 DB 대신 메모리에서 돌려주므로 읽기 pool이 커밋 전 값을 읽어도 자기 쓰기가 사라지지 않는다."""
+    state = (
+        emotion_states.get(user_name)
+        or committing_states.get(user_name)
+        or emotion_writer.pending_states.get(user_name)
+    )
+    if state is not None:
+        return emotion_states.setdefault(user_name, state)
+
+    state = await read_emotion_state(user_name)
+    # 조회하는 사이 다른 요청이 먼저 캐시에 넣었으면 그 상태를 사용
+    return emotion_states.setdefault(user_name, state)
+
+def recent_emotions_from_state(state, limit=EMOTION_STATE_SIZE):
+    return [
+        {"emotion": emotion, "timestamp": format_timestamp(timestamp)}
+        for emotion, timestamp in state["recent"][:limit]
+    ]
+
+async def save_emotion(user_name, emotion, db: AsyncSession):
+    """감정 기록 추가 + 사용자 감정 상태 갱신 (한 트랜잭션), 갱신된 상태 반환"""
+    timestamp = int(time.time())
+    state = await load_emotion_state(user_name)
+    # 캐시된 상태는 await 없이 한 번에 갱신 (같은 사용자의 동시 요청도 순서대로 반영)
+    state["recent"] = [[emotion, timestamp]] + state["recent"][:EMOTION_STATE_SIZE - 1]
+    state["counts"][emotion] = state["counts"].get(emotion, 0) + 1
+    state["total"] += 1
+    state["updated_at"] = timestamp
+
+    values = {
+        "user_name": user_name,
+        "recent": json.dumps(state["recent"], ensure_ascii=False),
+        "counts": json.dumps(state["counts"], ensure_ascii=False),
+        "total": state["total"],
+        "updated_at": timestamp,
+    }
+    if emotion_writer.active:
+        # write-behind: 다음 flush에서 다른 요청의 행과 함께 한 트랜잭션으로 저장
+        await emotion_writer.add_history({"user_name": user_name, "emotion": emotion, "timestamp": timestamp})
+        await emotion_writer.add_state(user_name, state, values)
+        return state
+
+    db.add(EmotionHistory(
+        user_name = user_name,
+        emotion=emotion,
+        timestamp=timestamp
+    ))
+    await db.execute(emotion_state_upsert(), values)
+    await db.execute(emotion_rollup_upsert(), emotion_rollup_rows([(user_name, emotion, timestamp)]))
+    committing_states[user_name] = state
+    try:
+        await db.commit()
+    except Exception:
+        # DB에 반영되지 않은 상태는 버리고 다음 요청에서 다시 읽음
+        emotion_states.pop(user_name)
+        raise
+    finally:
+        if committing_states.get(user_name) is state:
+            del committing_states[user_name]
+    return state
+    
+EMOTION_MODEL_NAME = "nlptown/bert-base-multilingual-uncased-sentiment"
+EMOTION_LABELS = ["super negative", "negative", "neutral", "positive", "super positive"]
+
+def load_emotion_classifier(backend):
+    """감정 분석 추론 백엔드 로드 (torch / torch-int8 / onnx)"""
+    from transformers import pipeline, AutoTokenizer
+    if backend == "torch":
+        return pipeline("sentiment-analysis", model=EMOTION_MODEL_NAME)
+
+    if backend == "torch-int8":
+        # Linear 레이어만 int8로 동적 양자화 → CPU 추론 속도와 RSS 개선
+        import torch
+        from transformers import AutoModelForSequenceClassification
+        model = AutoModelForSequenceClassification.from_pretrained(EMOTION_MODEL_NAME)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return pipeline("sentiment-analysis", model=model, tokenizer=AutoTokenizer.from_pretrained(EMOTION_MODEL_NAME))
+
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+        except ImportError as e:
+            raise ImportError("🚨 EMOTION_BACKEND=onnx requires 'optimum[onnxruntime]'.") from e
+        # 한 번 export한 그래프는 EMOTION_ONNX_PATH에 저장해 두고 재사용
+        if os.path.exists(os.path.join(EMOTION_ONNX_PATH, "model.onnx")):
+            model = ORTModelForSequenceClassification.from_pretrained(EMOTION_ONNX_PATH)
+            tokenizer = AutoTokenizer.from_pretrained(EMOTION_ONNX_PATH)
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(EMOTION_MODEL_NAME, export=True)
+            tokenizer = AutoTokenizer.from_pretrained(EMOTION_MODEL_NAME)
+            model.save_pretrained(EMOTION_ONNX_PATH)
+            tokenizer.save_pretrained(EMOTION_ONNX_PATH)
+        return pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+
+    raise ValueError(f"🚨 Unknown EMOTION_BACKEND: {backend}")
+
+emotion_classifier = None # 서버 시작 시 load_emotion_model로 로드
+
+def load_emotion_model(backend):
+    """EmotionBatcher가 쓸 감정 분석 모델 로드"""
+    global emotion_classifier
+    emotion_classifier = load_emotion_classifier(backend)
+    return emotion_classifier
+
+def sentiment_to_emotion(result):
+    """nlptown 별점 라벨을 감정 라벨로 변환"""
+    sentiment = result.get("label", "").lower()
+
+    if "1 star" in sentiment:
+        return "super negative"
+    elif "2 stars" in sentiment:
+        return "negative"
+    elif "3 stars" in sentiment:
+        return "neutral"
+    elif "4 stars" in sentiment:
+        return "positive"
+    elif "5 stars" in sentiment:
+        return "super positive"
+    else:
+        # 예상되지 않은 값이 반환될 경우 기본값 처리
+        return "neutral"
+
+#감정 분석 micro-batching
+# 동시에 들어온 요청을 몇 ms 동안 모아서 한 번의 padded batch로 BERT를 실행한다.
+class EmotionBatcher:
+    """emotion_classifier 앞단의 비동기 배치 큐"""
+    def __init__(self, max_batch_size, max_wait_ms, max_queue_size, executor, max_in_flight=1):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.max_in_flight = max_in_flight # 스레드풀 크기만큼만 배치를 동시에 실행
+        self.executor = executor
+        self.queue = None
+        self.slots = None
+        self.in_flight = set()
+        self.loop = None
+        self.worker = None
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.errors = 0
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("emotion batcher stopped"))
+
+    async def classify(self, text):
+        """텍스트 하나를 큐에 넣고 배치 결과를 기다림"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = self.loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _predict(self, texts):
+        return emotion_classifier(texts, batch_size=len(texts), truncation=True)
+
+    async def _run(self):
+        while True:
+            await self.slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self.slots.release()
+                raise
+            task = asyncio.create_task(self._run_batch(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def _run_batch(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            await wait_ready("emotion_model")
+            results = await self.loop.run_in_executor(self.executor, self._predict, texts)
+        except Exception as e:
+            self.errors += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "batches_in_flight": len(self.in_flight),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "errors": self.errors,
+        }
+
+emotion_batcher = EmotionBatcher(
+    EMOTION_BATCH_SIZE, EMOTION_BATCH_WAIT_MS, EMOTION_QUEUE_MAXSIZE,
+    executor=inference_executor, max_in_flight=INFERENCE_POOL_SIZE
+)
+
+#감정 분석 결과 캐시
+# "ㅠㅠ", "고마워" 같은 짧은 반복 발화는 BERT를 다시 돌리지 않고 정규화된 텍스트 기준으로 재사용한다.
+emotion_cache = LRUCache(
+    EMOTION_CACHE_SIZE, max_bytes=int(EMOTION_CACHE_MAX_MB * 1024 * 1024), ttl=EMOTION_CACHE_TTL
+)
+emotion_pending = {} # 분석 중인 텍스트 → Future (동시에 들어온 같은 텍스트는 한 번만 분석)
+
+def normalize_text(text):
+    """공백/대소문자 정규화 (uncased 모델이라 결과에 영향 없음)"""
+    return " ".join(text.split()).casefold()
+
+async def analyze_emotion(text):
+    """Analyze emotion using Hugging Face model."""
+    if not text.strip():
+        return "neutral"  # 빈 입력일 경우 중립 처리
+    
+    key = normalize_text(text)
+    cached = emotion_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        pending = emotion_pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(emotion_batcher.classify(key))
+            emotion_pending[key] = pending
+            pending.add_done_callback(lambda _: emotion_pending.pop(key, None))
+        emotion = sentiment_to_emotion(await asyncio.shield(pending))
+        emotion_cache.set(key, emotion)
+        return emotion
+    
+    except Exception as e:
+        # 예외 발생 시 기본값 반환 (캐시에는 저장하지 않음)
+        logger.warning("Error in emotion analysis: %s", e)
+        return "neutral"
+
+
+async def classify_bulk(texts):
+    """텍스트 목록 → 감정 라벨 또는 예외 목록
+
+    캐시에 없는 텍스트만 중복 없이 배치 큐에 넣는다 (EMOTION_BATCH_SIZE 단위 batch로 추론되고,
+    chunk 하나만 큐에 들어가므로 /chat 요청은 최대 chunk 하나만큼만 뒤에서 기다린다).
+    """
+    keys = [normalize_text(text) for text in texts]
+    emotions = {key: "neutral" for key in keys if not key}
+    for key in keys:
+        if key and key not in emotions:
+            cached = emotion_cache.get(key)
+            if cached is not None:
+                emotions[key] = cached
+    missing = list(dict.fromkeys(key for key in keys if key not in emotions))
+    results = await asyncio.gather(*(emotion_batcher.classify(key) for key in missing), return_exceptions=True)
+    for key, result in zip(missing, results):
+        if isinstance(result, Exception):
+            emotions[key] = result
+        else:
+            emotions[key] = sentiment_to_emotion(result)
+            emotion_cache.set(key, emotions[key])
+    return [emotions[key] for key in keys]
+
+def build_warning(recent_emotions):
+    """연속된 부정 감정 감지 (최근 감정 중 2개 이상이 "super negative"면 경고)"""
+    recent_negative_emotions = [e for e in recent_emotions if "super negative" in e.get("emotion")]
+    if len(recent_negative_emotions) >= 2:
+        return f"요즘 계속 힘들어 보이네, 조금 쉬면서 자신을 돌보는 게 중요해. ({', '.join([e['timestamp'] for e in recent_negative_emotions])})"
+    return None
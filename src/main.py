@@ -1,48 +1,80 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
-import sqlite3
 from datetime import datetime
-import openai
+from openai import AsyncOpenAI
+from sqlalchemy import text
 import os
 from typing import Dict
 from dotenv import load_dotenv
+# app.py와 같은 DB 엔진 설정 사용 (DB_PROFILE pragma, pool 크기, WAL에서는 별도 읽기 pool)
+from src.db import create_db_engines, dispose_db_engines
 
 # Load environment variables
 load_dotenv()
 
 # API Key and Database Path
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DB_URL = os.getenv("DB_PATH", "sqlite+aiosqlite:///client.db")
+DB_URL = os.getenv("DB_PATH", "sqlite+aiosqlite:///client.db")  # SQLAlchemy URL 또는 SQLite 파일 경로
 
 if not OPENAI_API_KEY:
     raise ValueError("🚨 OPENAI_API_KEY is missing.")
 
-openai.api_key=OPENAI_API_KEY
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 #FastAPI app
 app = FastAPI(title="Emotion AI Chatbot API", version="1.0")
 
-# SQLite DB 연결 (없으면 자동 생성됨)
-conn = sqlite3.connect("emotions.db")
-cursor = conn.cursor()
+# SQLite DB 연결 pool (요청마다 연결을 새로 열지 않고, 연결마다 prepared statement 캐시를 재사용)
+engine, read_engine = create_db_engines(DB_URL)
 
-# 테이블 생성 (한 번만 실행하면 됨)
-cursor.execute("""
+# 테이블/인덱스 생성 (없을 때만), (name, timestamp) 인덱스로 사용자별 최근 감정을 정렬 없이 조회
+# timestamp는 "%Y-%m-%d %H:%M:%S" 문자열이라 문자열 순서 = 시간 순서
+CREATE_TABLE = text("""
 CREATE TABLE IF NOT EXISTS user_emotions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT,
     emotion TEXT,
     timestamp TEXT
-)               
+)
 """)
-conn.commit()
+CREATE_INDEX = text("CREATE INDEX IF NOT EXISTS ix_user_emotions_name_ts ON user_emotions (name, timestamp)")
+RECENT_EMOTIONS = text("""
+SELECT timestamp, emotion FROM user_emotions
+WHERE name = :name
+ORDER BY timestamp DESC
+LIMIT :limit
+""")
+INSERT_EMOTION = text("INSERT INTO user_emotions (name, emotion, timestamp) VALUES (:name, :emotion, :timestamp)")
+
+@app.on_event("startup")
+async def startup():
+    async with engine.begin() as conn:
+        await conn.execute(CREATE_TABLE)
+        await conn.execute(CREATE_INDEX)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await dispose_db_engines(engine, read_engine)
+
+async def recent_emotions(user_name, limit):
+    """사용자의 최근 감정 기록 (읽기 pool 연결은 조회가 끝나면 바로 반환)"""
+    async with read_engine.connect() as conn:
+        result = await conn.execute(RECENT_EMOTIONS, {"name": user_name, "limit": limit})
+        return result.fetchall()
+
+async def save_user_emotion(user_name, emotion):
+    """감정 기록 저장 (요청당 쓰기 트랜잭션 하나), 저장한 timestamp 반환"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    async with engine.begin() as conn:
+        await conn.execute(INSERT_EMOTION, {"name": user_name, "emotion": emotion, "timestamp": timestamp})
+    return timestamp
 
 # 요청 데이터 모델 정의 (JSON Body에서 받기)
 class EmotionRequest(BaseModel):
     user_name: str
     text: str
 
-def analyze_emotion(text):
+async def analyze_emotion(text):
     """GPT API를 사용해 감정을 분석하는 함수"""
     prompt = f"""
     다음 문장의 감정을 분석해줘.
@@ -55,7 +87,7 @@ def analyze_emotion(text):
     답변:
     """
     
-    response = openai.chat.completions.create(
+    response = await openai_client.chat.completions.create(
         model="gpt-3.5-turbo",
         messages=[{"role": "system", "content": "너는 감정 분석 AI다. 반드시 '긍정', '부정', '중립' 중 하나만 출력해."},
                 {"role": "user", "content": prompt}]
@@ -75,20 +107,14 @@ def analyze_emotion(text):
 
 #감정 분석 API
 @app.post("/analyze_emotion/")
-def analyze_emotion_api(request: EmotionRequest):
+async def analyze_emotion_api(request: EmotionRequest):
     """FastAPI 감정 분석 엔드포인트"""
     user_name = request.user_name
     text = request.text
-    emotion_result = analyze_emotion(text)
+    emotion_result = await analyze_emotion(text)
     
     # 감정 기록 저장
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute("INSERT INTO user_emotions (name, emotion, timestamp) VALUES (?, ?, ?)",
-            (user_name, emotion_result, timestamp))
-    conn.commit()
-    conn.close()
+    timestamp = await save_user_emotion(user_name, emotion_result)
     
     return {
         "user": user_name,
@@ -98,21 +124,10 @@ def analyze_emotion_api(request: EmotionRequest):
     }
 
 @app.get("/get_memory/{user_name}")
-def get_user_emotions(user_name: str):
+async def get_user_emotions(user_name: str):
     """SQLite에서 특정 사용자의 감정 기록을 조회하는 API"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     #가장 최근 감정 기록을 5개까지 가져오기
-    cursor.execute("""
-                SELECT timestamp, emotion FROM user_emotions
-                WHERE name = ?
-                ORDER BY timestamp DESC
-                LIMIT 5
-    """, (user_name,))
-    
-    records = cursor.fetchall()
-    conn.close()
+    records = await recent_emotions(user_name, 5)
     
     if not records:
         return {"user": user_name, "message": "감정 기록이 없습니다."}
@@ -123,24 +138,16 @@ def get_user_emotions(user_name: str):
     } 
 
 @app.post("/chat")
-def chat_with_bot(request: EmotionRequest) -> Dict:
+async def chat_with_bot(request: EmotionRequest) -> Dict:
     """GPT 챗봇과 대화하는 API (감정 분석 포함)"""
     user_name = request.user_name
     user_text = request.text
     
     #감정 분석
-    emotion_result = analyze_emotion(user_text)
-    
-    #최근 감정 기록 가져오기
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-                SELECT timestamp, emotion FROM user_emotions
-                WHERE name = ?
-                ORDER BY timestamp DESC
-                LIMIT 3
-            """, (user_name, ))
-    past_emotions = cursor.fetchall()
+    emotion_result = await analyze_emotion(user_text)
+    
+    #최근 감정 기록 가져오기 (GPT 응답을 기다리는 동안 DB 연결을 잡고 있지 않음)
+    past_emotions = await recent_emotions(user_name, 3)
     
     #감정 맥락 반영한 프롬프트 생성
     emotion_history = "\n".join([f"{row[0]} - {row[1]}" for row in past_emotions])
@@ -167,7 +174,7 @@ def chat_with_bot(request: EmotionRequest) -> Dict:
     """
     
     #GPT API 호출
-    response = openai.chat.completions.create(
+    response = await openai_client.chat.completions.create(
         model="gpt-3.5-turbo",
         messages=[{"role": "system", "content": "너는 감정을 고려해 대화하는 개인용 AI 챗봇이다. 한 사람을 대상으로 말해라."},
                 {"role": "user", "content": prompt}]
@@ -176,13 +183,7 @@ def chat_with_bot(request: EmotionRequest) -> Dict:
     bot_response = response.choices[0].message.content.strip()
     
     # 감정 기록 저장
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute("INSERT INTO user_emotions (name, emotion, timestamp) VALUES (?, ?, ?)",
-                (user_name, emotion_result, timestamp))
-    conn.commit()
-    conn.close()
+    timestamp = await save_user_emotion(user_name, emotion_result)
     
     return {
         "user": user_name,
@@ -0,0 +1,155 @@
+"""일회성 데이터 마이그레이션과 집계 재계산 (`python -m src.app <명령>`으로 실행)"""
+import json
+import time
+from sqlalchemy import delete, func, insert
+from sqlalchemy.future import select
+
+from src.analytics import emotion_rollup_rows
+from src.emotion import emotion_states
+from src.models import Base, ChatMessage, Emotion, EmotionHistory, EmotionRollup, EmotionState, Memory, engine
+from src.observability import logger
+
+#기존 문자열 timestamp 테이블 → epoch 초 + 복합 인덱스 스키마 마이그레이션 (SQLite는 컬럼 타입 변경이 안 되므로 테이블 재생성)
+# 서버 시작 시 자동으로 실행된다. 감정 상태(emotion_state)는 비우고 다음 조회 때 변환된 기록으로 다시 계산하며,
+# 감정 집계(emotion_rollups)도 변환된 기록 전체로 다시 만든다.
+EMOTION_TIMESTAMP_TABLES = ("emotion_history", "emotions")
+
+# 저장된 문자열은 datetime.now() 기준 로컬 시각 → 'utc' modifier로 epoch 초 변환.
+# 이전 스키마에 새 코드가 쓴 epoch 초(숫자만 있는 문자열)는 그대로 둔다 (strftime은 숫자를 율리우스일로 해석함).
+LEGACY_TIMESTAMP_TO_EPOCH = """CASE
+    WHEN typeof(timestamp) IN ('integer', 'real') OR (timestamp <> '' AND timestamp NOT GLOB '*[^0-9.]*')
+        THEN CAST(timestamp AS INTEGER)
+    ELSE COALESCE(CAST(strftime('%s', timestamp, 'utc') AS INTEGER), 0)
+END"""
+
+def _legacy_emotion_tables(conn):
+    legacy = []
+    for table in EMOTION_TIMESTAMP_TABLES:
+        columns = {row[1]: row[2] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if columns.get("timestamp", "INTEGER").upper() != "INTEGER":
+            legacy.append(table)
+    return legacy
+
+def _migrate_emotion_timestamps(conn):
+    migrated = {}
+    for table in _legacy_emotion_tables(conn):
+        conn.exec_driver_sql(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        # 인덱스 이름은 DB 전체에서 유일하므로 새 테이블을 만들기 전에 기존 인덱스를 지운다
+        for (index_name,) in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (f"{table}_legacy",)
+        ).fetchall():
+            conn.exec_driver_sql(f"DROP INDEX {index_name}")
+        new_table = Base.metadata.tables[table]
+        new_table.create(conn)
+        # 이전 스키마에 없던 컬럼(emotions.user_name)은 NULL로 남김
+        legacy_columns = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table}_legacy)")]
+        columns = ", ".join(name for name in legacy_columns if name in new_table.c and name != "timestamp")
+        result = conn.exec_driver_sql(
+            f"INSERT INTO {table} ({columns}, timestamp) "
+            f"SELECT {columns}, {LEGACY_TIMESTAMP_TO_EPOCH} FROM {table}_legacy"
+        )
+        conn.exec_driver_sql(f"DROP TABLE {table}_legacy")
+        migrated[table] = result.rowcount
+
+    if migrated:
+        # 변환 전에 만들어진 상태/집계에는 문자열 timestamp가 들어 있거나 이전 기록이 빠져 있음
+        Base.metadata.create_all(conn, checkfirst=True)
+        conn.execute(delete(EmotionState))
+        _rebuild_emotion_rollups(conn)
+    return migrated
+
+async def migrate_emotion_timestamps():
+    """emotion_history / emotions 테이블의 문자열 timestamp를 epoch 초로 변환하고 (user_name, timestamp) 인덱스 생성"""
+    async with engine.begin() as conn:
+        migrated = await conn.run_sync(_migrate_emotion_timestamps)
+        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+    if migrated:
+        emotion_states.clear()
+    for table, count in migrated.items():
+        logger.info("✅ %s timestamp 마이그레이션 완료: %d행", table, count)
+    if not migrated:
+        logger.info("✅ 감정 테이블은 이미 epoch timestamp 스키마입니다.")
+    return migrated
+
+def _emotion_rollups_missing(conn):
+    """감정 기록은 있는데 집계가 비어 있으면 True (집계 도입 이전 DB)"""
+    if conn.execute(select(EmotionRollup.id).limit(1)).first() is not None:
+        return False
+    return (
+        conn.execute(select(EmotionHistory.id).limit(1)).first() is not None
+        or conn.execute(select(Emotion.id).where(Emotion.user_name.isnot(None)).limit(1)).first() is not None
+    )
+
+def _rebuild_emotion_rollups(conn):
+    legacy_tables = _legacy_emotion_tables(conn)
+    if legacy_tables:
+        raise RuntimeError(f"{', '.join(legacy_tables)}: migrate-emotion-timestamps를 먼저 실행하세요.")
+    conn.execute(delete(EmotionRollup))
+    rows = conn.execute(
+        select(EmotionHistory.user_name, EmotionHistory.emotion, EmotionHistory.timestamp)
+        .union_all(select(Emotion.user_name, Emotion.emotion, Emotion.timestamp).where(Emotion.user_name.isnot(None)))
+    )
+    rollups = emotion_rollup_rows(rows)
+    if rollups:
+        conn.execute(insert(EmotionRollup), rollups)
+    return len(rollups)
+
+async def rebuild_emotion_rollups():
+    """emotion_history / emotions 전체로 emotion_rollups 재계산 (기존 기록 backfill, 집계 시간대 변경 후 실행)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+        count = await conn.run_sync(_rebuild_emotion_rollups)
+    logger.info("✅ 감정 집계 재계산 완료: 버킷 %d개", count)
+    return count
+
+def _stored_overlap(legacy, stored):
+    """legacy 끝부분과 이미 저장된 메시지 앞부분이 겹치는 길이 (이전에 옮긴 적이 있으면 legacy 전체)"""
+    for overlap in range(min(len(legacy), len(stored)), 0, -1):
+        if legacy[len(legacy) - overlap:] == stored[:overlap]:
+            return overlap
+    return 0
+
+def _migrate_memory_blobs(conn):
+    """memory.chat_history JSON을 chat_messages 앞쪽에 합치고 memory 행 삭제, {user_name: 옮긴 메시지} 반환
+    chat_messages에 이미 새 대화가 있는 사용자는 아직 저장되지 않은 기존 대화만 그보다 작은 seq로 붙인다."""
+    migrated = {}
+    for user_name, chat_history in conn.execute(select(Memory.user_name, Memory.chat_history)).fetchall():
+        try:
+            messages = json.loads(chat_history)
+        except json.JSONDecodeError:
+            logger.warning("⚠️ %s: chat_history JSON 파싱 실패 → 건너뜀", user_name)
+            continue
+        legacy = [(msg["type"], msg["content"]) for msg in messages if msg.get("type") in ("HumanMessage", "AIMessage")]
+        stored = conn.execute(
+            select(ChatMessage.role, ChatMessage.content)
+            .where(ChatMessage.user_name == user_name)
+            .order_by(ChatMessage.seq)
+            .limit(len(legacy))
+        ).fetchall()
+        pending = legacy[:len(legacy) - _stored_overlap(legacy, [tuple(row) for row in stored])]
+
+        if pending:
+            first_seq = conn.execute(
+                select(func.min(ChatMessage.seq)).where(ChatMessage.user_name == user_name)
+            ).scalar()
+            start = 0 if first_seq is None else first_seq - len(pending)
+            created_at = time.time()
+            conn.execute(insert(ChatMessage), [
+                {"user_name": user_name, "seq": start + i, "role": role, "content": content, "created_at": created_at}
+                for i, (role, content) in enumerate(pending)
+            ])
+            migrated[user_name] = [{"type": role, "content": content} for role, content in pending]
+        conn.execute(delete(Memory).where(Memory.user_name == user_name))
+    return migrated
+
+async def migrate_memory_blobs():
+    """기존 memory.chat_history JSON을 chat_messages로 옮기는 일회성 마이그레이션 (서버 시작 시에도 자동 실행)"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+        migrated = await conn.run_sync(_migrate_memory_blobs)
+    count = sum(len(messages) for messages in migrated.values())
+    logger.info("✅ memory → chat_messages 마이그레이션 완료: 사용자 %d명, 메시지 %d개", len(migrated), count)
+    if migrated:
+        logger.info("옮긴 대화를 검색에 반영하려면 `python -m src.app rebuild-index`를 실행하세요.")
+    return len(migrated), count
@@ -0,0 +1,128 @@
+"""DB 엔진/세션과 테이블 정의"""
+import time
+from sqlalchemy import Column, Integer, String, LargeBinary, Float, Index
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import ForeignKey
+
+from src.db import create_db_engines
+from src.settings import DB_URL
+
+# 읽기 전용 조회(임베딩 캐시, 인덱스 재생성 등)는 쓰기 pool 연결을 점유하지 않도록 별도 pool 사용
+engine, read_engine = create_db_engines(DB_URL)
+SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = sessionmaker(bind=read_engine, class_=AsyncSession, expire_on_commit=False)
+Base = declarative_base()
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+    id = Column(Integer, primary_key=True, index=True)
+
+#감정 기록: timestamp는 epoch 초(INTEGER), (user_name, timestamp) 복합 인덱스로 사용자별 최근 감정을 인덱스만 따라 조회
+class EmotionHistory(Base):
+    __tablename__ = "emotion_history"
+    __table_args__ = (Index("ix_emotion_history_user_ts", "user_name", "timestamp"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_name = Column(String, nullable=False)
+    emotion = Column(String, nullable=False)
+    timestamp = Column(Integer, default=lambda: int(time.time()), nullable=False) # epoch seconds
+
+class Emotion(Base):
+    __tablename__ = "emotions"
+    __table_args__ = (Index("ix_emotions_user_ts", "user_name", "timestamp"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
+    user_name = Column(String, nullable=True) # 마이그레이션 이전 행은 NULL
+    emotion = Column(String, nullable=False)
+    timestamp = Column(Integer, default=lambda: int(time.time()), nullable=False) # epoch seconds
+
+#사용자별 감정 요약 상태 (최근 감정 ring buffer + 라벨별 누적 개수), 감정 기록과 같은 트랜잭션에서 갱신
+# /chat 은 이 한 행(또는 메모리 캐시)만 읽고, emotion_history는 감사 로그로만 남는다.
+class EmotionState(Base):
+    __tablename__ = "emotion_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_name = Column(String, unique=True, index=True, nullable=False)
+    recent = Column(String, nullable=False) # JSON [[emotion, epoch seconds], ...] 최신순, 최대 EMOTION_STATE_SIZE개
+    counts = Column(String, nullable=False) # JSON {emotion: count}
+    total = Column(Integer, nullable=False) # 누적 감정 수 (늦게 도착한 오래된 상태가 덮어쓰지 않도록 비교)
+    updated_at = Column(Integer, nullable=False) # epoch seconds
+
+#사용자별 감정 집계 버킷 (시간/일/주), 감정 기록과 같은 트랜잭션에서 증분 갱신 → 추이 조회는 버킷 행만 읽는다
+EMOTION_SCORES = {"super negative": -2, "negative": -1, "neutral": 0, "positive": 1, "super positive": 2}
+ROLLUP_GRANULARITIES = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+ROLLUP_LABEL_COLUMNS = {label: label.replace(" ", "_") for label in EMOTION_SCORES}
+
+class EmotionRollup(Base):
+    __tablename__ = "emotion_rollups"
+    __table_args__ = (Index("ix_emotion_rollups_user_bucket", "user_name", "granularity", "bucket", unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_name = Column(String, nullable=False)
+    granularity = Column(String, nullable=False) # hour / day / week
+    bucket = Column(Integer, nullable=False) # 버킷 시작 epoch 초 (ANALYTICS_UTC_OFFSET_HOURS 기준, 주는 월요일 시작)
+    count = Column(Integer, nullable=False) # 알 수 없는 라벨 포함 전체 감정 수
+    score_sum = Column(Integer, nullable=False) # EMOTION_SCORES 합
+    super_negative = Column(Integer, nullable=False, default=0)
+    negative = Column(Integer, nullable=False, default=0)
+    neutral = Column(Integer, nullable=False, default=0)
+    positive = Column(Integer, nullable=False, default=0)
+    super_positive = Column(Integer, nullable=False, default=0)
+
+class Memory(Base):
+    __tablename__ = "memory"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_name = Column(String, unique=True, nullable=False)
+    chat_history = Column(String, nullable=False)
+
+#대화 메시지 (append-only, 사용자별 seq 순서)
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (Index("ix_chat_messages_user_seq", "user_name", "seq", unique=True),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_name = Column(String, nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String, nullable=False) # HumanMessage / AIMessage
+    content = Column(String, nullable=False)
+    created_at = Column(Float, default=time.time, nullable=False) # epoch seconds
+
+#window 모드에서 토큰 예산 밖으로 밀려난 대화의 누적 요약
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_name = Column(String, unique=True, index=True, nullable=False)
+    summary = Column(String, nullable=False)
+    summarized_seq = Column(Integer, nullable=False) # 이 seq까지의 메시지가 요약에 포함됨
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    text_hash = Column(String, unique=True, index=True, nullable=False) # sha256(model + text)
+    model = Column(String, nullable=False)
+    embedding = Column(LargeBinary, nullable=False) # float32 bytes
+
+#/coach 응답 캐시 (감정 + 정규화된 텍스트 단위, 재시작 후에도 재사용)
+class CoachingCacheEntry(Base):
+    __tablename__ = "coaching_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String, unique=True, index=True, nullable=False) # sha256(emotion + text)
+    emotion = Column(String, nullable=False)
+    text = Column(String, nullable=False) # 정규화된 사용자 텍스트
+    response = Column(String, nullable=False)
+    embedding = Column(LargeBinary, nullable=True) # 정규화된 float32 bytes (유사도 검색용)
+    created_at = Column(Float, default=time.time, nullable=False) # epoch seconds
+
+async def get_db():
+    async with SessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -0,0 +1,184 @@
+"""구조화 로깅, request_id contextvar, Prometheus 지표"""
+import bisect
+import hmac
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.settings import DEBUG_DUMP_TOKEN, LOG_FORMAT, LOG_LEVEL, LOG_SAMPLE_RATE
+
+#로깅
+# 요청 경로에서는 사용자/길이 같은 요약만 INFO로 남기고, 메시지 목록·RAG 문서 같은 payload는
+# DEBUG 레벨이거나 X-Debug-Dump 헤더가 붙은 요청에서만 포맷해서 출력한다.
+request_context = ContextVar("request_context", default={"request_id": "-", "dump": False})
+LOG_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+class RequestContextFilter(logging.Filter):
+    """레코드에 request_id를 붙이고, sample=True인 INFO 이하 로그는 LOG_SAMPLE_RATE 비율만 통과"""
+    def filter(self, record):
+        context = request_context.get()
+        record.request_id = context["request_id"]
+        if getattr(record, "sample", False) and record.levelno < logging.WARNING and not context["dump"]:
+            return random.random() < LOG_SAMPLE_RATE
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        # logger.info(..., extra={...})로 넘긴 필드
+        entry.update({key: value for key, value in record.__dict__.items() if key not in LOG_RECORD_FIELDS and key != "sample"})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging():
+    handler = logging.StreamHandler(sys.stdout)
+    handler.addFilter(RequestContextFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+    logger = logging.getLogger("emotion_chatbot")
+    logger.handlers = [handler]
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+logger = configure_logging()
+
+def log_dump(message, *args):
+    """payload 전체 출력 (DEBUG 레벨이거나 dump 요청일 때만 인자를 포맷)"""
+    if request_context.get()["dump"]:
+        logger.info(message, *args, extra={"dump": True})
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, *args)
+
+#지표 (Prometheus text format, 외부 의존성 없음)
+# 요청 경로의 단계별 지연 시간은 histogram으로, LLM 토큰 수는 counter로 모아서 /metrics 로 노출한다.
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_HELP = {
+    "chatbot_request_seconds": ("histogram", "HTTP request latency by route"),
+    "chatbot_stage_seconds": ("histogram", "Latency of each pipeline stage"),
+    "chatbot_llm_tokens_total": ("counter", "LLM tokens by purpose and kind (input/output)"),
+    "chatbot_component_stat": ("gauge", "Numeric values from /stats"),
+}
+
+class Histogram:
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # 마지막 칸은 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _metric_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+class Metrics:
+    """이벤트 루프 안에서만 갱신하는 in-process 지표 저장소 (uvicorn worker 1개 기준)"""
+    def __init__(self):
+        self.histograms = {} # (이름, 라벨 tuple) -> Histogram
+        self.counters = {} # (이름, 라벨 tuple) -> 값
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(labels.items()))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("chatbot_stage_seconds", time.perf_counter() - started, stage=stage)
+
+    def render(self, gauges=()):
+        """Prometheus text exposition format (gauges: (이름, 라벨 dict, 값) 목록)"""
+        series = {}
+        for (name, labels), histogram in self.histograms.items():
+            labels = dict(labels)
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_metric_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_metric_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_metric_labels(labels)} {histogram.count}")
+        for (name, labels), value in self.counters.items():
+            series.setdefault(name, []).append(f"{name}{_metric_labels(dict(labels))} {value}")
+        for name, labels, value in gauges:
+            series.setdefault(name, []).append(f"{name}{_metric_labels(labels)} {value}")
+
+        output = []
+        for name, lines in series.items():
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            output += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *lines]
+        return "\n".join(output) + "\n"
+
+metrics = Metrics()
+
+def record_llm_usage(purpose, message):
+    """LLM 응답(또는 스트리밍 마지막 chunk)의 usage_metadata를 토큰 counter에 반영"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    metrics.inc("chatbot_llm_tokens_total", usage.get("input_tokens", 0), purpose=purpose, kind="input")
+    metrics.inc("chatbot_llm_tokens_total", usage.get("output_tokens", 0), purpose=purpose, kind="output")
+
+def debug_dump_requested(dump_header):
+    """X-Debug-Dump 헤더가 DEBUG_DUMP_TOKEN과 같을 때만 True (토큰이 없으면 헤더로 dump를 켤 수 없음)"""
+    if not DEBUG_DUMP_TOKEN or not dump_header:
+        return False
+    return hmac.compare_digest(dump_header.encode("latin-1"), DEBUG_DUMP_TOKEN.encode("utf-8"))
+
+class RequestContextMiddleware:
+    """요청마다 request_id와 dump 여부를 contextvar에 설정하고 요청 지연 시간을 기록하는 ASGI 미들웨어 (응답에 X-Request-ID 추가)"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        dump = debug_dump_requested(headers.get(b"x-debug-dump", b"").decode("latin-1"))
+        token = request_context.set({"request_id": request_id, "dump": dump})
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_context.reset(token)
+            # 경로 파라미터(사용자 이름 등)가 라벨에 들어가지 않도록 라우트 템플릿 사용
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.observe("chatbot_request_seconds", time.perf_counter() - started, route=route, method=scope["method"])
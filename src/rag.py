@@ -0,0 +1,389 @@
+"""임베딩 캐시와 사용자별 FAISS shard 인덱스 (RAG 검색)"""
+import asyncio
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List
+import numpy as np
+from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
+
+from src.cache import LRUCache
+from src.models import ChatMessage, EmbeddingCache, ReadSessionLocal, SessionLocal
+from src.observability import logger, metrics
+from src.runtime import wait_ready
+from src.settings import (
+    EMBEDDING_CACHE_SIZE, EMBEDDING_MODEL, FAISS_INDEX_PATH, FAISS_SAVE_EVERY, RAG_GLOBAL_FALLBACK,
+    RAG_SCORE_THRESHOLD, RAG_SHARD_MEMORY_MB, RAG_TOP_K,
+)
+
+#임베딩 캐시: (모델명, 텍스트) 해시 → 벡터
+# LRU → embedding_cache 테이블 → OpenAI 순서로 조회해서, 같은 텍스트는 한 번만 임베딩한다.
+class CachedEmbeddings(Embeddings):
+    """content-addressed 임베딩 캐시 (LRU + SQLAlchemy DB)"""
+    def __init__(self, underlying_factory, model_name, lru_size=EMBEDDING_CACHE_SIZE):
+        self.underlying_factory = underlying_factory # 실제 임베딩 클라이언트는 캐시 miss 때 생성
+        self._underlying = None
+        self.model_name = model_name
+        self.lru = LRUCache(lru_size)
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def underlying(self) -> Embeddings:
+        if self._underlying is None:
+            self._underlying = self.underlying_factory()
+        return self._underlying
+
+    @underlying.setter
+    def underlying(self, value: Embeddings):
+        self._underlying = value
+
+    def text_hash(self, text):
+        return hashlib.sha256(f"{self.model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def _lookup_lru(self, keys, vectors):
+        for key in set(keys):
+            vector = self.lru.get(key)
+            if vector is not None:
+                vectors[key] = vector
+                self.hits += 1
+
+    async def _lookup_db(self, missing, vectors):
+        keys = list(missing)
+        async with ReadSessionLocal() as db:
+            for i in range(0, len(keys), 500):  # SQLite 바인딩 변수 개수 제한
+                result = await db.execute(
+                    select(EmbeddingCache.text_hash, EmbeddingCache.embedding)
+                    .where(EmbeddingCache.text_hash.in_(keys[i:i + 500]))
+                )
+                for key, blob in result.fetchall():
+                    vectors[key] = np.frombuffer(blob, dtype=np.float32)
+                    self.lru.set(key, vectors[key])
+                    missing.pop(key, None)
+                    self.db_hits += 1
+
+    async def _store_db(self, rows):
+        async with SessionLocal() as db:
+            await db.execute(
+                sqlite_insert(EmbeddingCache).on_conflict_do_nothing(index_elements=["text_hash"]),
+                rows
+            )
+            await db.commit()
+
+    def _remember(self, missing, embedded, vectors):
+        rows = []
+        for (key, _), vector in zip(missing.items(), embedded):
+            vectors[key] = np.asarray(vector, dtype=np.float32)
+            self.lru.set(key, vectors[key])
+            rows.append({"text_hash": key, "model": self.model_name, "embedding": vectors[key].tobytes()})
+        self.misses += len(rows)
+        return rows
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.text_hash(text) for text in texts]
+        vectors = {}
+        self._lookup_lru(keys, vectors)
+
+        # 중복 텍스트는 한 번만 조회/임베딩
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            await self._lookup_db(missing, vectors)
+        if missing:
+            embedded = await self.underlying.aembed_documents(list(missing.values()))
+            await self._store_db(self._remember(missing, embedded, vectors))
+
+        return [vectors[key].tolist() for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """동기 경로는 이벤트 루프 밖에서 불리므로 LRU만 사용 (DB 저장은 async 경로에서)"""
+        keys = [self.text_hash(text) for text in texts]
+        vectors = {}
+        self._lookup_lru(keys, vectors)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            self._remember(missing, self.underlying.embed_documents(list(missing.values())), vectors)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "lru_size": len(self.lru),
+            "lru_hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+        }
+
+def _openai_embeddings():
+    from langchain_community.embeddings.openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+embeddings = CachedEmbeddings(_openai_embeddings, EMBEDDING_MODEL)
+
+
+#RAG를 위한 FAISS 벡터 DB 설정
+# 요청마다 전체 대화를 다시 임베딩하지 않도록, 인덱스는 디스크에 저장해 두고 새 메시지만 증분 추가한다.
+def messages_to_documents(user_name, messages):
+    """직렬화된 대화 메시지 중 Human/AI 메시지만 Document로 변환"""
+    return [
+        Document(
+            page_content=msg["content"],
+            metadata={"user": user_name, "type": msg["type"]}
+        )
+        for msg in messages
+        if msg["type"] in ("HumanMessage", "AIMessage") and msg["content"]
+    ]
+
+async def load_memory_documents(db: AsyncSession):
+    """chat_messages 테이블 전체를 Document 목록으로 읽기 (인덱스 재생성용)"""
+    result = await db.stream(
+        select(ChatMessage.user_name, ChatMessage.role, ChatMessage.content)
+        .order_by(ChatMessage.user_name, ChatMessage.seq)
+    )
+
+    documents = []
+    async for user_name, role, content in result:
+        documents.extend(messages_to_documents(user_name, [{"type": role, "content": content}]))
+    return documents
+
+class FaissIndex:
+    """디스크에 저장되는 FAISS 인덱스 (서버 수명 동안 유지, 증분 업데이트)"""
+    def __init__(self, path, embeddings, save_every=FAISS_SAVE_EVERY):
+        self.path = path
+        self.embeddings = embeddings
+        self.save_every = save_every
+        self.vectorstore = None
+        self.unsaved = 0
+        self.lock = asyncio.Lock()
+
+    def load(self):
+        """디스크에 저장된 인덱스 로드, 없으면 False"""
+        if not os.path.exists(os.path.join(self.path, "index.faiss")):
+            return False
+        from langchain_community.vectorstores import FAISS
+        # 우리가 직접 save_local로 만든 파일만 읽으므로 pickle 역직렬화 허용
+        self.vectorstore = FAISS.load_local(
+            self.path, self.embeddings, allow_dangerous_deserialization=True
+        )
+        return True
+
+    def _save(self):
+        if self.vectorstore is None:
+            shutil.rmtree(self.path, ignore_errors=True)
+        else:
+            self.vectorstore.save_local(self.path)
+        self.unsaved = 0
+
+    async def save(self):
+        async with self.lock:
+            if self.unsaved:
+                await asyncio.to_thread(self._save)
+
+    async def add_documents(self, documents):
+        """새 메시지만 임베딩해서 인덱스에 추가"""
+        if not documents:
+            return
+        from langchain_community.vectorstores import FAISS
+        async with self.lock:
+            if self.vectorstore is None:
+                self.vectorstore = await FAISS.afrom_documents(documents, self.embeddings)
+            else:
+                await self.vectorstore.aadd_documents(documents)
+            self.unsaved += len(documents)
+            if self.unsaved >= self.save_every:
+                await asyncio.to_thread(self._save)
+
+    async def replace(self, documents):
+        """주어진 문서로 인덱스를 새로 만들고 바로 저장"""
+        from langchain_community.vectorstores import FAISS
+        async with self.lock:
+            if documents:
+                self.vectorstore = await FAISS.afrom_documents(documents, self.embeddings)
+            else:
+                self.vectorstore = None
+            await asyncio.to_thread(self._save)
+
+    def memory_bytes(self):
+        """대략적인 메모리 사용량 (벡터 + 문서 원문 평균 512바이트 가정)"""
+        if self.vectorstore is None:
+            return 0
+        index = self.vectorstore.index
+        return index.ntotal * (index.d * 4 + 512)
+
+    async def search_by_vector(self, vector, k, score_threshold):
+        """미리 임베딩한 질문 벡터로 검색해서 관련도 임계값 이상인 문서만 반환"""
+        if self.vectorstore is None:
+            return []
+        results = await self.vectorstore.asimilarity_search_with_score_by_vector(vector, k=k)
+        # OpenAI 임베딩은 정규화되어 있으므로 L2 거리² → 코사인 유사도 = 1 - d/2
+        return [doc for doc, distance in results if 1 - distance / 2 >= score_threshold]
+
+
+#사용자별 FAISS shard
+# 검색 비용이 전체 사용자 수가 아니라 요청한 사용자의 대화 길이에만 비례하도록 shard를 나눈다.
+class UserShardedIndex:
+    """사용자별 FAISS shard 관리 (lazy load, 메모리 예산 기반 LRU eviction)"""
+    def __init__(self, root, embeddings, memory_budget, global_fallback=False):
+        self.root = root
+        self.users_dir = os.path.join(root, "users")
+        self.embeddings = embeddings
+        self.memory_budget = memory_budget
+        self.shards = OrderedDict() # user_name -> FaissIndex (LRU 순서)
+        self.user_locks = {} # user_name -> [Lock, 사용/대기 중인 요청 수] (마지막 요청이 끝나면 삭제)
+        self.active = 0 # shard를 사용 중인 요청 수
+        self.rebuilding = False
+        self.state = asyncio.Condition() # rebuild는 사용 중인 요청이 모두 끝난 뒤 단독으로 실행
+        self.global_index = FaissIndex(os.path.join(root, "global"), embeddings) if global_fallback else None
+
+    def shard_path(self, user_name):
+        return os.path.join(self.users_dir, hashlib.sha256(user_name.encode("utf-8")).hexdigest()[:32])
+
+    @asynccontextmanager
+    async def _using(self):
+        """shard 사용 구간 (rebuild 중이면 끝날 때까지 대기)"""
+        async with self.state:
+            await self.state.wait_for(lambda: not self.rebuilding)
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self.state:
+                self.active -= 1
+                self.state.notify_all()
+
+    @asynccontextmanager
+    async def user_lock(self, user_name):
+        """사용자별 lock (같은 사용자의 shard 로드/추가/저장은 순서대로)"""
+        entry = self.user_locks.setdefault(user_name, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.user_locks[user_name]
+
+    async def load(self):
+        """디스크에 인덱스가 있는지 확인 (shard 자체는 lazy load), 없으면 False"""
+        if not os.path.isdir(self.users_dir):
+            return False
+        if self.global_index is not None:
+            return await asyncio.to_thread(self.global_index.load)
+        return True
+
+    async def _get_shard(self, user_name):
+        """user_lock을 잡은 상태에서 호출"""
+        shard = self.shards.get(user_name)
+        if shard is None:
+            shard = FaissIndex(self.shard_path(user_name), self.embeddings)
+            await asyncio.to_thread(shard.load)
+            self.shards[user_name] = shard
+            await self._evict()
+        self.shards.move_to_end(user_name)
+        return shard
+
+    async def _evict(self):
+        """빈 shard와, 메모리 예산을 넘으면 오래 안 쓴 shard부터 저장 후 내림 (사용 중인 shard는 건너뜀)
+        저장이 끝날 때까지 shard를 남겨 두고 그 사용자의 lock을 잡아서, 그 사이 요청이 저장 전 파일을 다시 읽지 않게 함"""
+        total = sum(shard.memory_bytes() for shard in self.shards.values())
+        for user_name in list(self.shards)[:-1]:
+            shard = self.shards.get(user_name)
+            if shard is None or user_name in self.user_locks:
+                continue
+            if shard.vectorstore is not None and total <= self.memory_budget:
+                continue
+            async with self.user_lock(user_name):
+                await shard.save()
+                if self.shards.get(user_name) is shard:
+                    del self.shards[user_name]
+                    total -= shard.memory_bytes()
+
+    async def add_documents(self, user_name, documents):
+        if not documents:
+            return
+        async with self._using():
+            async with self.user_lock(user_name):
+                shard = await self._get_shard(user_name)
+                await shard.add_documents(documents)
+            if self.global_index is not None:
+                await self.global_index.add_documents(documents)
+
+    async def search(self, user_name, query, k, score_threshold):
+        """질문을 한 번만 임베딩해서 사용자 shard (비어 있으면 설정에 따라 전체 인덱스)에서 검색"""
+        async with self._using():
+            with metrics.timer("rag_load_shard"):
+                async with self.user_lock(user_name):
+                    shard = await self._get_shard(user_name)
+            if shard.vectorstore is None and self.global_index is not None:
+                logger.debug("⚠️ %s shard 비어 있음 → 전체 인덱스 검색", user_name)
+                shard = self.global_index
+            if shard.vectorstore is None:
+                return []
+            with metrics.timer("rag_embed"):
+                vector = await self.embeddings.aembed_query(query)
+            with metrics.timer("rag_search"):
+                return await shard.search_by_vector(vector, k, score_threshold)
+
+    async def save(self):
+        async with self._using():
+            for user_name in list(self.shards):
+                async with self.user_lock(user_name):
+                    shard = self.shards.get(user_name)
+                    if shard is not None:
+                        await shard.save()
+            if self.global_index is not None:
+                await self.global_index.save()
+
+    async def rebuild(self, load_documents):
+        """DB 기준으로 모든 shard를 새로 생성 (인덱스가 DB와 어긋났을 때의 재생성/compaction)
+        재생성하는 동안 검색/추가 요청은 끝날 때까지 기다린다."""
+        async with self.state:
+            await self.state.wait_for(lambda: not self.rebuilding)
+            self.rebuilding = True
+            await self.state.wait_for(lambda: self.active == 0)
+        try:
+            async with ReadSessionLocal() as db:
+                documents = await load_documents(db)
+
+            by_user = {}
+            for doc in documents:
+                by_user.setdefault(doc.metadata["user"], []).append(doc)
+
+            self.shards.clear()
+            await asyncio.to_thread(shutil.rmtree, self.users_dir, True)
+            os.makedirs(self.users_dir, exist_ok=True)
+            for user_name, user_documents in by_user.items():
+                await FaissIndex(self.shard_path(user_name), self.embeddings).replace(user_documents)
+            if self.global_index is not None:
+                await self.global_index.replace(documents)
+        finally:
+            async with self.state:
+                self.rebuilding = False
+                self.state.notify_all()
+
+        logger.info("✅ FAISS 인덱스 재생성 완료: 사용자 %d명, %d개 문서", len(by_user), len(documents))
+        return len(documents)
+
+rag_index = UserShardedIndex(
+    FAISS_INDEX_PATH, embeddings, RAG_SHARD_MEMORY_MB * 1024 * 1024, global_fallback=RAG_GLOBAL_FALLBACK
+)
+
+async def retrieve_context(user_name, query):
+    """요청한 사용자의 FAISS shard에서 관련 과거 대화 검색"""
+    await wait_ready("rag_index")
+    return await rag_index.search(user_name, query, k=RAG_TOP_K, score_threshold=RAG_SCORE_THRESHOLD)
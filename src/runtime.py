@@ -0,0 +1,86 @@
+"""LLM 클라이언트, 실행 풀, 서버 시작 단계/준비 상태"""
+import asyncio
+import fcntl
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+from src.db import sqlite_file
+from src.observability import logger
+from src.settings import INFERENCE_POOL_SIZE, LLM_MAX_CONCURRENCY, SUMMARY_MODEL
+
+# LLM 모델 설정 (첫 사용 시 생성)
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4", stream_usage=True) # 스트리밍에서도 토큰 사용량 수신
+
+# 대화 요약용 모델 (첫 사용 시 생성)
+@lru_cache(maxsize=None)
+def get_summary_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=SUMMARY_MODEL)
+
+# 감정 분석을 위한 LLM 모델 (첫 사용 시 생성)
+@lru_cache(maxsize=None)
+def get_emotion_model():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model_name="gpt-4")
+
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-4")
+
+@lru_cache(maxsize=20000)
+def count_tokens(text):
+    """메시지 하나의 토큰 수 (메시지당 오버헤드 4토큰 포함), 같은 텍스트는 캐시"""
+    return len(get_tokenizer().encode(text)) + 4
+
+# 실행 모델: 이벤트 루프에서는 I/O만 처리하고, 모델 추론은 전용 스레드풀에서 실행한다.
+# LLM 호출은 ainvoke로 비동기 처리하고 동시 호출 수만 제한한다.
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_POOL_SIZE, thread_name_prefix="inference")
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+#서버 시작 단계별 소요 시간과 준비 상태
+startup_timings = {}
+startup_errors = {}
+readiness = {}
+
+@contextmanager
+def startup_stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        startup_errors[name] = str(e)
+        raise
+    finally:
+        startup_timings[name] = round(time.perf_counter() - started, 3)
+        logger.info("⏱️ %s: %.3fs", name, startup_timings[name], extra={"stage": name, "seconds": startup_timings[name]})
+
+async def wait_ready(name):
+    """해당 단계가 준비될 때까지 대기 (warm-up이 실패했으면 예외)"""
+    await readiness[name].wait()
+    if name in startup_errors:
+        raise RuntimeError(f"{name} failed to start: {startup_errors[name]}")
+
+#서버 프로세스 lock
+# Chatbot 세션, 사용자 감정 상태, 감정 기록 write-behind 큐, FAISS shard는 프로세스 메모리에 있어서
+# 같은 DB를 쓰는 서버 프로세스가 둘이면 서로의 변경을 보지 못하고 덮어쓴다 (uvicorn --workers 1 로 실행).
+def acquire_process_lock(db_url):
+    """DB 파일 옆의 lock 파일을 잡고 파일 객체 반환 (다른 프로세스가 잡고 있으면 RuntimeError, 파일 DB가 아니면 None)"""
+    path = sqlite_file(db_url)
+    if path is None:
+        return None
+    handle = open(f"{os.path.abspath(path)}.lock", "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        raise RuntimeError(
+            f"🚨 다른 서버 프로세스가 {path}를 사용 중입니다. 세션/감정 상태 캐시가 프로세스 메모리에 있으므로 worker는 하나만 실행하세요."
+        ) from None
+    return handle
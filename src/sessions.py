@@ -0,0 +1,420 @@
+"""사용자별 대화 기록(Chatbot)과 세션 캐시"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from sqlalchemy import insert
+from sqlalchemy.future import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+from src.models import ChatMessage, ConversationSummary, SessionLocal
+from src.observability import log_dump, logger, metrics, record_llm_usage
+from src.rag import messages_to_documents, rag_index
+from src.runtime import count_tokens, get_summary_llm, llm_semaphore, wait_ready
+from src.settings import (
+    MEMORY_LOAD_MESSAGES, MEMORY_MODE, MEMORY_TOKEN_BUDGET, SESSION_CACHE_SIZE, SESSION_FLUSH_INTERVAL, SESSION_IDLE_TIMEOUT,
+)
+
+def truncate_to_tokens(text, max_tokens):
+    """max_tokens 안에 들어가는 가장 긴 앞부분 + "…" (count_tokens 기준 이분 탐색)"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle] + "…") <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + "…"
+
+def fit_to_budget(messages, budget):
+    """메시지 토큰 합이 budget을 넘으면 짧은 메시지는 그대로 두고 긴 메시지를 같은 몫으로 잘라서 맞춤"""
+    tokens = [count_tokens(m.content) for m in messages]
+    if sum(tokens) <= budget:
+        return messages
+    limits = {}
+    remaining = max(budget, 0)
+    for rank, index in enumerate(sorted(range(len(messages)), key=tokens.__getitem__)):
+        limits[index] = min(tokens[index], remaining // (len(messages) - rank))
+        remaining -= limits[index]
+    return [
+        m if limits[i] >= tokens[i] else type(m)(content=truncate_to_tokens(m.content, limits[i]))
+        for i, m in enumerate(messages)
+    ]
+
+#사용자별 대화 기록 관리 (SQLite 적용 가능)
+class Chatbot:
+    def __init__(self, user_name):
+        self.user_name = user_name
+        self.session_id = f"session_{user_name}" # 사용자별 session_id 추가
+        from langchain.memory import ConversationBufferMemory
+        from langchain_community.chat_message_histories import ChatMessageHistory
+
+        self.memory = ChatMessageHistory() #대화 기록 저장용
+        self.memory_buffer = ConversationBufferMemory(
+            memory_key="chat_history",
+            return_messages=True,
+            max_token_limit=500
+        )
+        self.persisted_count = 0 # DB에 이미 저장된 메시지 수
+        self.unindexed = [] # DB에는 저장됐지만 FAISS 인덱스 반영에 실패한 메시지 (다음 저장 때 재시도)
+        self.next_seq = 0 # chat_messages에 다음으로 저장할 seq
+        self.first_seq = 0 # 메모리에 남아 있는 가장 오래된 메시지의 seq
+        self.summary = "" # window 모드: 예산 밖으로 밀려난 대화 요약
+        self.pending_summary = [] # 요약에 아직 반영하지 않은 메시지
+        self.summary_task = None
+        self.folded_tokens = 0
+        self.lock = asyncio.Lock() # 같은 사용자의 대화 턴은 순서대로 처리
+        self.dirty = False # 아직 DB에 저장하지 않은 대화가 있는지
+        self.last_used = time.monotonic()
+        self.pins = 0 # 이 세션을 사용 중인 요청 수 (0보다 크면 eviction 대상에서 제외)
+    
+    async def async_init(self, db: AsyncSession):
+        """챗봇 초기화 및 메모리 로드 (성격 메시지는 load_memory에서 주입)"""
+        await self.load_memory(db)
+    
+    def set_chatbot_personality(self):
+        """챗봇의 성격을 강제로 저장"""
+        intro_message = (
+            "나는 감성적이고 따뜻한 AI 채주야."
+            "네 감정을 깊이 이해하고, 언제나 네 편에서 함께할게."
+            "잔잔한 위로와 너드미 가득한 대화로, 너에게 소울메이트가 되어줄게."
+            "난 반말, 구어체로 말해."
+        )
+
+        system_message = SystemMessage(content=intro_message)
+        self.memory_buffer.chat_memory.messages.insert(0, system_message)   # 성격 메시지를 가장 처음에 주입
+
+        log_dump("✅ 성격 주입 상태: %s", self.memory_buffer.chat_memory.messages)
+    
+    def _window_budget(self):
+        return MEMORY_TOKEN_BUDGET - sum(count_tokens(m.content) for m in self._system_messages())
+
+    def _window_start(self):
+        """토큰 예산 안에 들어가는 최근 대화의 시작 인덱스 (예산을 넘어도 마지막 사용자 턴부터는 항상 포함)"""
+        messages = self.memory_buffer.chat_memory.messages
+        budget = self._window_budget()
+        start = len(messages)
+        while start > 0 and not isinstance(messages[start - 1], SystemMessage):
+            budget -= count_tokens(messages[start - 1].content)
+            if budget < 0:
+                break
+            start -= 1
+        last_turn = next(
+            (i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), len(messages)
+        )
+        return min(start, last_turn)
+
+    def _system_messages(self):
+        messages = [m for m in self.memory_buffer.chat_memory.messages if isinstance(m, SystemMessage)]
+        if self.summary:
+            messages.append(SystemMessage(content=f"지금까지의 대화 요약: {self.summary}"))
+        return messages
+
+    def context_messages(self):
+        """프롬프트에 넣을 메시지 (window 모드: 성격 + 요약 + 토큰 예산 안의 최근 대화)"""
+        messages = self.memory_buffer.chat_memory.messages
+        if MEMORY_MODE != "window":
+            return list(messages)
+        # 마지막 턴 자체가 예산보다 길면 잘라서 넣음
+        return self._system_messages() + fit_to_budget(messages[self._window_start():], self._window_budget())
+
+    def fold_old_turns(self):
+        """예산 밖으로 밀려난 (이미 저장된) 대화를 메모리에서 빼고 백그라운드 요약에 넘김"""
+        if MEMORY_MODE != "window":
+            return
+        messages = self.memory_buffer.chat_memory.messages
+        cut = min(self._window_start(), self.persisted_count)
+        folded = [m for m in messages[:cut] if not isinstance(m, SystemMessage)]
+        if not folded:
+            return
+
+        self.memory_buffer.chat_memory.messages = [m for m in messages[:cut] if isinstance(m, SystemMessage)] + messages[cut:]
+        self.persisted_count -= len(folded)
+        self.first_seq += len(folded)
+        self.folded_tokens += sum(count_tokens(m.content) for m in folded)
+        self.pending_summary.extend(folded)
+        if self.summary_task is None or self.summary_task.done():
+            self.summary_task = asyncio.create_task(self._summarize())
+
+    async def _summarize(self):
+        """요청 경로 밖에서 기존 요약 + 밀려난 대화를 새 요약으로 합침"""
+        while self.pending_summary:
+            folded, self.pending_summary = self.pending_summary, []
+            summarized_seq = self.first_seq - 1
+            transcript = "\n".join(
+                f"{'사용자' if isinstance(m, HumanMessage) else '채주'}: {m.content}" for m in folded
+            )
+            prompt = [
+                SystemMessage(content="기존 요약과 새 대화를 합쳐서 사용자의 상황, 감정, 중요한 사실 위주로 5문장 이내로 요약해."),
+                HumanMessage(content=f"기존 요약:\n{self.summary or '(없음)'}\n\n새 대화:\n{transcript}")
+            ]
+            try:
+                async with llm_semaphore:
+                    with metrics.timer("summary_llm"):
+                        summary_message = await get_summary_llm().ainvoke(prompt)
+                record_llm_usage("summary", summary_message)
+                self.summary = summary_message.content
+                async with SessionLocal() as db:
+                    await db.execute(
+                        sqlite_insert(ConversationSummary)
+                        .values(user_name=self.user_name, summary=self.summary, summarized_seq=summarized_seq)
+                        .on_conflict_do_update(
+                            index_elements=["user_name"],
+                            set_={"summary": self.summary, "summarized_seq": summarized_seq}
+                        )
+                    )
+                    await db.commit()
+            except Exception as e:
+                # 실패한 대화는 다음 요약 때 다시 시도
+                logger.error("🚨 대화 요약 실패 (%s): %s", self.user_name, e)
+                self.pending_summary = folded + self.pending_summary
+                return
+
+    def token_stats(self):
+        """프롬프트 토큰 사용량 (window 모드에서 절약된 토큰 확인용)"""
+        messages = self.memory_buffer.chat_memory.messages
+        system_tokens = sum(count_tokens(m.content) for m in messages if isinstance(m, SystemMessage))
+        buffered_tokens = sum(count_tokens(m.content) for m in messages if not isinstance(m, SystemMessage))
+        prompt_tokens = sum(count_tokens(m.content) for m in self.context_messages())
+        return {
+            "mode": MEMORY_MODE,
+            "budget": MEMORY_TOKEN_BUDGET,
+            "system_tokens": system_tokens,
+            "summary_tokens": count_tokens(self.summary) if self.summary else 0,
+            "buffered_messages": len(messages),
+            "buffered_tokens": buffered_tokens,
+            "prompt_tokens": prompt_tokens,
+            "folded_tokens": self.folded_tokens,
+            "saved_tokens": system_tokens + buffered_tokens + self.folded_tokens - prompt_tokens,
+            "pending_summary_messages": len(self.pending_summary),
+        }
+
+    def get_session_history(self, session_id):
+        """LangChain에서 요구하는 세션 히스토리 함수"""
+        return self.memory
+    
+    async def save_memory(self, db: AsyncSession):
+        """새로 추가된 Human/AI 메시지만 chat_messages 테이블에 append"""
+        messages = self.memory_buffer.chat_memory.messages
+        # Langchain의 BaseMessage 객체는 JSON 직렬화 불가 → dict로 변환 후 저장
+        end = len(messages)
+        new_messages = [
+            {
+                "type": type(msg).__name__,
+                "content": msg.content
+            }
+            for msg in messages[self.persisted_count:end]
+            if isinstance(msg, (HumanMessage, AIMessage))
+        ]
+
+        if new_messages:
+            created_at = time.time()
+            with metrics.timer("save_memory"):
+                await db.execute(
+                    insert(ChatMessage),
+                    [
+                        {
+                            "user_name": self.user_name,
+                            "seq": self.next_seq + i,
+                            "role": msg["type"],
+                            "content": msg["content"],
+                            "created_at": created_at
+                        }
+                        for i, msg in enumerate(new_messages)
+                    ]
+                )
+                await db.commit()
+            # 커밋된 메시지는 인덱스 반영이 실패해도 다시 insert하지 않음
+            self.next_seq += len(new_messages)
+            self.unindexed.extend(new_messages)
+        self.persisted_count = end
+
+        await self.index_messages()
+        self.fold_old_turns()
+
+    async def index_messages(self):
+        """저장됐지만 아직 FAISS 인덱스에 없는 메시지를 증분 반영 (실패하면 다음 저장 때 다시 시도)"""
+        if not self.unindexed:
+            return
+        pending, self.unindexed = self.unindexed, []
+        try:
+            await wait_ready("rag_index")
+            with metrics.timer("rag_index_add"):
+                await rag_index.add_documents(self.user_name, messages_to_documents(self.user_name, pending))
+        except Exception as e:
+            self.unindexed = pending + self.unindexed
+            logger.error("🚨 대화 인덱스 반영 실패 (%s, 메시지 %d개): %s", self.user_name, len(self.unindexed), e)
+
+    async def load_memory(self, db: AsyncSession):
+        """chat_messages에서 대화 불러오기 (성격 메시지는 매번 주입)
+        window 모드: 마지막 요약 이후 메시지 전부 (예산 밖의 메시지는 바로 요약으로 넘김) | buffer 모드: 최근 MEMORY_LOAD_MESSAGES개"""
+        query = select(ChatMessage.seq, ChatMessage.role, ChatMessage.content).where(ChatMessage.user_name == self.user_name)
+        summarized_seq = -1
+        if MEMORY_MODE == "window":
+            # 이미 요약된 메시지는 다시 읽지 않음
+            record = (await db.execute(
+                select(ConversationSummary.summary, ConversationSummary.summarized_seq)
+                .where(ConversationSummary.user_name == self.user_name)
+            )).first()
+            if record:
+                self.summary = record.summary
+                summarized_seq = record.summarized_seq
+                query = query.where(ChatMessage.seq > summarized_seq)
+            # 요약되지 않은 메시지를 개수로 자르면 요약에도 context에도 들어가지 못하므로 전부 읽는다
+            rows = (await db.execute(query.order_by(ChatMessage.seq))).fetchall()
+        else:
+            result = await db.execute(query.order_by(ChatMessage.seq.desc()).limit(MEMORY_LOAD_MESSAGES))
+            rows = result.fetchall()[::-1]
+
+        message_types = {"AIMessage": AIMessage, "HumanMessage": HumanMessage}
+        self.memory_buffer.chat_memory.messages = [
+            message_types[role](content=content) for _, role, content in rows if role in message_types
+        ]
+        self.set_chatbot_personality()
+
+        self.next_seq = rows[-1][0] + 1 if rows else summarized_seq + 1
+        self.first_seq = rows[0][0] if rows else self.next_seq
+        self.persisted_count = len(self.memory_buffer.chat_memory.messages)
+        self.fold_old_turns()
+        logger.debug("✅ 메모리 로드: %s, 메시지 %d개", self.user_name, len(self.memory_buffer.chat_memory.messages))
+        log_dump("✅ 메모리 로드 상태: %s", self.memory_buffer.chat_memory.messages)
+
+#Chatbot 세션 캐시
+# 대화 중인 사용자의 Chatbot을 메모리에 유지해서 매 요청마다 DB에서 대화 기록을 읽고 파싱하지 않는다.
+# 변경된 세션은 주기적으로, 그리고 eviction/종료 시 DB에 저장한다. (uvicorn worker 1개 기준)
+class ChatbotSessionManager:
+    """사용자별 Chatbot 객체 캐시 (LRU + idle eviction, dirty write-back)"""
+    def __init__(self, max_sessions, idle_timeout, flush_interval):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.flush_interval = flush_interval
+        self.sessions = OrderedDict() # user_name -> Chatbot (LRU 순서, 저장이 끝날 때까지 남겨 둠)
+        self.task = None
+        self.overflow_task = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_backs = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.overflow_task is not None:
+            await self.overflow_task
+        for user_name in list(self.sessions):
+            try:
+                await self._evict(user_name, force=True)
+            except Exception as e:
+                logger.error("🚨 세션 저장 실패 (%s): %s", user_name, e)
+
+    async def get(self, user_name, db: AsyncSession):
+        """캐시된 Chatbot 반환, 없으면 DB에서 로드 (요청 처리 중에는 session()으로 고정해서 사용)"""
+        chatbot = self.sessions.get(user_name)
+        if chatbot is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            chatbot = Chatbot(user_name=user_name)
+            await chatbot.async_init(db)
+            # 로드하는 사이 다른 요청이 먼저 세션을 만들었으면 그걸 사용
+            chatbot = self.sessions.get(user_name) or chatbot
+
+        self.sessions[user_name] = chatbot
+        self.sessions.move_to_end(user_name)
+        chatbot.last_used = time.monotonic()
+        return chatbot
+
+    def pin(self, chatbot):
+        chatbot.pins += 1
+
+    def unpin(self, chatbot):
+        chatbot.pins -= 1
+        chatbot.last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def session(self, user_name, db: AsyncSession):
+        """요청이 끝날 때까지 eviction되지 않도록 고정한 Chatbot
+        (get과 chatbot.lock 사이에 eviction되면 그 턴이 저장되지 않은 객체에만 남는다)"""
+        with metrics.timer("chat_session"):
+            chatbot = await self.get(user_name, db)
+        self.pin(chatbot) # get 이후 await 없이 고정
+        if len(self.sessions) > self.max_sessions and (self.overflow_task is None or self.overflow_task.done()):
+            # 다른 사용자의 세션 저장은 이 요청 경로 밖에서 (실패해도 이 요청에 영향 없음)
+            self.overflow_task = asyncio.create_task(self._evict_overflow())
+        try:
+            yield chatbot
+        finally:
+            self.unpin(chatbot)
+
+    async def write_back(self, chatbot):
+        """변경된 대화 기록만 DB에 저장"""
+        async with chatbot.lock:
+            if not chatbot.dirty and not chatbot.unindexed:
+                return
+            async with SessionLocal() as db:
+                await chatbot.save_memory(db)
+            chatbot.dirty = False
+            self.write_backs += 1
+
+    async def _evict(self, user_name, force=False):
+        """세션 저장 후 캐시에서 제거 (사용 중인 세션은 force가 아니면 건너뜀)
+        저장이 끝날 때까지 캐시에 남겨서 그 사이 들어온 요청이 DB의 이전 기록 대신 이 객체를 쓰게 하고,
+        저장에 실패하면 (예외를 그대로 올리고) 세션을 남겨 다음 주기에 다시 저장한다."""
+        chatbot = self.sessions.get(user_name)
+        if chatbot is None or (chatbot.pins and not force):
+            return
+        await self.write_back(chatbot)
+        # 저장하는 사이 다시 사용되기 시작했거나 새 대화가 생겼으면 남겨 둠
+        if self.sessions.get(user_name) is chatbot and (force or not chatbot.pins) and not chatbot.dirty:
+            del self.sessions[user_name]
+            self.evictions += 1
+
+    async def _evict_overflow(self):
+        """max_sessions를 넘은 만큼 오래 안 쓴 세션부터 저장 후 제거 (사용 중이거나 저장에 실패한 세션은 남김)"""
+        for user_name in [name for name, chatbot in self.sessions.items() if not chatbot.pins]:
+            if len(self.sessions) <= self.max_sessions:
+                return
+            try:
+                await self._evict(user_name)
+            except Exception as e:
+                logger.error("🚨 세션 저장 실패 (%s): %s", user_name, e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            now = time.monotonic()
+            for user_name, chatbot in list(self.sessions.items()):
+                try:
+                    if now - chatbot.last_used > self.idle_timeout and not chatbot.pins:
+                        await self._evict(user_name)
+                    elif chatbot.dirty or chatbot.unindexed:
+                        await self.write_back(chatbot)
+                except Exception as e:
+                    logger.error("🚨 세션 저장 실패 (%s): %s", user_name, e)
+            await self._evict_overflow() # 사용 중이라 넘겼던 세션 정리
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "dirty": sum(1 for chatbot in self.sessions.values() if chatbot.dirty),
+            "pinned": sum(1 for chatbot in self.sessions.values() if chatbot.pins),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_backs": self.write_backs,
+        }
+
+chat_sessions = ChatbotSessionManager(SESSION_CACHE_SIZE, SESSION_IDLE_TIMEOUT, SESSION_FLUSH_INTERVAL)
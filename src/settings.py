@@ -0,0 +1,64 @@
+"""환경 변수 설정 (앱 모듈 공용)
+
+DB 엔진 튜닝 값(DB_PROFILE, DB_POOL_SIZE 등)은 main.py와 함께 쓰므로 src/db.py에 있다.
+"""
+import os
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# API Key and Database Path
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+DB_URL = os.getenv("DB_PATH", "sqlite+aiosqlite:///./emotions.db")  # SQLAlchemy URL 또는 SQLite 파일 경로
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "torch")  # torch | torch-int8 | onnx
+EMOTION_ONNX_PATH = os.getenv("EMOTION_ONNX_PATH", "./emotion_onnx")  # onnx 백엔드의 export 결과 저장 위치
+FAISS_INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "./faiss_index")
+FAISS_SAVE_EVERY = int(os.getenv("FAISS_SAVE_EVERY", "20"))  # 이 개수만큼 추가되면 디스크에 저장
+RAG_SHARD_MEMORY_MB = int(os.getenv("RAG_SHARD_MEMORY_MB", "256"))  # 메모리에 올려둘 사용자 shard 총량
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+RAG_SCORE_THRESHOLD = float(os.getenv("RAG_SCORE_THRESHOLD", "0.8"))  # 이 관련도(코사인 유사도) 이상인 문서만 답변에 사용
+RAG_GLOBAL_FALLBACK = os.getenv("RAG_GLOBAL_FALLBACK", "false").lower() == "true"  # 본인 shard가 비면 전체 인덱스 검색
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "5000"))  # in-process LRU 항목 수
+EMOTION_CACHE_SIZE = int(os.getenv("EMOTION_CACHE_SIZE", "10000"))  # 감정 분석 결과 캐시 항목 수
+EMOTION_CACHE_MAX_MB = float(os.getenv("EMOTION_CACHE_MAX_MB", "16"))  # 감정 분석 결과 캐시 메모리 상한
+EMOTION_CACHE_TTL = float(os.getenv("EMOTION_CACHE_TTL", "0"))  # 초 단위, 0이면 만료 없음
+COACH_CACHE_SIZE = int(os.getenv("COACH_CACHE_SIZE", "2000"))  # /coach 응답 캐시 항목 수 (0이면 캐시 끄기)
+COACH_CACHE_TTL = float(os.getenv("COACH_CACHE_TTL", "86400"))  # 초 단위, 0이면 만료 없음
+COACH_CACHE_SIMILARITY = float(os.getenv("COACH_CACHE_SIMILARITY", "0.95"))  # 같은 감정에서 이 코사인 유사도 이상이면 재사용 (1 초과면 정확히 일치할 때만)
+EMOTION_BATCH_SIZE = int(os.getenv("EMOTION_BATCH_SIZE", "16"))  # 감정 분석 배치 최대 크기
+EMOTION_BATCH_WAIT_MS = float(os.getenv("EMOTION_BATCH_WAIT_MS", "5"))  # 배치를 모으는 최대 대기 시간
+EMOTION_QUEUE_MAXSIZE = int(os.getenv("EMOTION_QUEUE_MAXSIZE", "1024"))  # 대기열이 차면 요청이 대기 (backpressure)
+EMOTION_BULK_MAX_ITEMS = int(os.getenv("EMOTION_BULK_MAX_ITEMS", "10000"))  # /analyze_emotion/batch 요청당 최대 항목 수
+EMOTION_BULK_CHUNK_SIZE = int(os.getenv("EMOTION_BULK_CHUNK_SIZE", "64"))  # 한 번에 분류해서 결과를 내보내는 항목 수
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "1"))  # 동시에 실행할 감정 분석 배치 수 (모델 추론 전용 스레드)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))  # 0이면 torch 기본값
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "8"))  # 파일 I/O 등 기타 blocking 작업용 기본 executor
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))  # 동시에 진행할 OpenAI 호출 수
+MEMORY_LOAD_MESSAGES = int(os.getenv("MEMORY_LOAD_MESSAGES", "50"))  # buffer 모드에서 세션 로드 시 불러올 최근 메시지 수 (window 모드는 마지막 요약 이후 전부)
+MEMORY_MODE = os.getenv("MEMORY_MODE", "buffer")  # buffer: 저장된 대화 전부 | window: 토큰 예산 + 요약
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "500"))  # window 모드에서 프롬프트에 넣을 대화 토큰 상한
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")  # 오래된 대화 요약용 모델
+EMOTION_WRITE_BEHIND = os.getenv("EMOTION_WRITE_BEHIND", "false").lower() == "true"  # 감정 기록을 요청마다 commit하지 않고 모아서 bulk insert
+EMOTION_WRITE_BATCH_SIZE = int(os.getenv("EMOTION_WRITE_BATCH_SIZE", "500"))  # 한 번에 flush할 최대 행 수
+EMOTION_WRITE_INTERVAL_MS = float(os.getenv("EMOTION_WRITE_INTERVAL_MS", "50"))  # 첫 행이 들어온 뒤 flush까지 최대 대기 시간
+EMOTION_WRITE_QUEUE_MAXSIZE = int(os.getenv("EMOTION_WRITE_QUEUE_MAXSIZE", "10000"))  # 대기열이 차면 요청이 대기 (backpressure)
+EMOTION_STATE_SIZE = int(os.getenv("EMOTION_STATE_SIZE", "5"))  # 사용자별로 유지할 최근 감정 수 (경고 판단에 사용)
+EMOTION_STATE_CACHE_SIZE = int(os.getenv("EMOTION_STATE_CACHE_SIZE", "10000"))  # 메모리에 유지할 사용자별 감정 상태 수
+ANALYTICS_UTC_OFFSET_HOURS = float(os.getenv("ANALYTICS_UTC_OFFSET_HOURS", str(-time.timezone / 3600)))  # 일/주 단위 집계 기준 시간대 (기본: 서버 로컬 시간대)
+ANALYTICS_MAX_POINTS = int(os.getenv("ANALYTICS_MAX_POINTS", "500"))  # 감정 추이 응답의 최대 점 개수 (넘으면 이웃 구간을 합쳐서 downsample)
+ANALYTICS_CHART_CACHE_SIZE = int(os.getenv("ANALYTICS_CHART_CACHE_SIZE", "200"))  # 렌더링한 감정 추이 차트 캐시 항목 수
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1000"))  # 메모리에 유지할 Chatbot 세션 수
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))  # 초, 이 시간 동안 대화가 없으면 세션 정리
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "5"))  # 초, 변경된 세션을 DB에 반영하는 주기
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json: 한 줄 JSON | text: 사람이 읽기 쉬운 형식
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))  # 요청마다 찍히는 INFO 로그 중 남길 비율
+DEBUG_DUMP_TOKEN = os.getenv("DEBUG_DUMP_TOKEN", "")  # X-Debug-Dump 헤더 값이 이 토큰과 같을 때만 요청 단위 dump (비어 있으면 헤더로 dump 불가)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # /admin API 호출 시 X-Admin-Token 헤더로 전달 (비어 있으면 /admin API 비활성화)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")  # eager: 모델 로드 후 서비스 시작 | lazy: 백그라운드에서 로드
+
+if not OPENAI_API_KEY:
+    raise ValueError("🚨 OPENAI_API_KEY is missing.")
@@ -0,0 +1,54 @@
+"""테스트 공용 설정: 임시 DB/인덱스 경로와 가짜 모델(감정 분류기, 임베딩, LLM)
+
+src 모듈은 import 시점에 환경 변수를 읽으므로 경로 설정을 먼저 한다.
+"""
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="emotion-chatbot-tests-")
+os.environ.update({
+    "OPENAI_API_KEY": "test",
+    "DB_PATH": os.path.join(TEST_DIR, "test.db"),
+    "FAISS_INDEX_PATH": os.path.join(TEST_DIR, "faiss"),
+    "LOG_LEVEL": "WARNING",
+    "SESSION_FLUSH_INTERVAL": "3600", # 주기 flush 대신 테스트에서 직접 저장
+})
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from src import app as app_module, coaching, emotion, rag, sessions
+
+CHAT_RESPONSE = "응, 듣고 있어."
+COACHING_RESPONSE = "천천히 쉬어 가도 괜찮아."
+SUMMARY_RESPONSE = "사용자는 요즘 지쳐 있다."
+
+def fake_classifier(texts, **kwargs):
+    """nlptown 모델처럼 별점 라벨 반환 (키워드 기준)"""
+    def label(text):
+        if "최악" in text or "힘들" in text:
+            return "1 star"
+        if "좋아" in text:
+            return "5 stars"
+        return "3 stars"
+    return [{"label": label(text), "score": 0.9} for text in texts]
+
+@pytest.fixture(scope="session")
+def client():
+    patcher = pytest.MonkeyPatch()
+    patcher.setattr(emotion, "load_emotion_classifier", lambda backend: fake_classifier)
+    patcher.setattr(sessions, "count_tokens", lambda text: len(text) + 4)
+    patcher.setattr(app_module, "get_llm", lambda: FakeListChatModel(responses=[CHAT_RESPONSE]))
+    patcher.setattr(sessions, "get_summary_llm", lambda: FakeListChatModel(responses=[SUMMARY_RESPONSE]))
+    patcher.setattr(coaching, "get_emotion_model", lambda: FakeListChatModel(responses=[COACHING_RESPONSE]))
+    patcher.setattr(rag.embeddings, "underlying", DeterministicFakeEmbedding(size=32))
+    with TestClient(app_module.app) as test_client:
+        yield test_client
+    patcher.undo()
+
+@pytest.fixture
+def run(client):
+    """앱과 같은 이벤트 루프에서 코루틴 함수 실행 (DB 엔진, asyncio 객체 공유)"""
+    return lambda fn, *args: client.portal.call(fn, *args)
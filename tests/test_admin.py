@@ -0,0 +1,13 @@
+from src import app as app_module
+
+def test_admin_api_is_disabled_without_a_token(client):
+    assert client.post("/admin/rebuild_index").status_code == 404
+
+def test_admin_api_requires_the_configured_token(client, monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    assert client.post("/admin/rebuild_index").status_code == 401
+    assert client.post("/admin/rebuild_index", headers={"X-Admin-Token": "wrong"}).status_code == 401
+
+    response = client.post("/admin/rebuild_index", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
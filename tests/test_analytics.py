@@ -0,0 +1,70 @@
+import datetime
+
+import numpy as np
+
+from src import analytics
+
+KST = datetime.timezone(datetime.timedelta(hours=9))
+
+def epoch(*args):
+    return int(datetime.datetime(*args, tzinfo=KST).timestamp())
+
+def test_align_bucket_uses_configured_offset_and_monday_weeks(monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_UTC_OFFSET_HOURS", 9)
+    timestamp = epoch(2025, 7, 2, 15, 30) # 수요일
+
+    assert analytics.align_bucket(timestamp, 3600) == epoch(2025, 7, 2, 15)
+    assert analytics.align_bucket(timestamp, 86400) == epoch(2025, 7, 2)
+    assert analytics.align_bucket(timestamp, 7 * 86400) == epoch(2025, 6, 30) # 월요일 0시
+    assert analytics.align_bucket(epoch(2025, 7, 2, 0, 0), 86400) == epoch(2025, 7, 2)
+
+def test_rollup_rows_merge_observations_in_the_same_bucket(monkeypatch):
+    monkeypatch.setattr(analytics, "ANALYTICS_UTC_OFFSET_HOURS", 9)
+    rows = analytics.emotion_rollup_rows([
+        ("alice", "super negative", epoch(2025, 7, 2, 10, 5)),
+        ("alice", "positive", epoch(2025, 7, 2, 10, 55)),
+        ("alice", "confused", epoch(2025, 7, 2, 11, 0)), # 알 수 없는 라벨은 개수에만 포함
+        (None, "positive", epoch(2025, 7, 2, 10, 0)), # 마이그레이션 이전 행
+    ])
+    by_key = {(row["granularity"], row["bucket"]): row for row in rows}
+
+    hour = by_key[("hour", epoch(2025, 7, 2, 10))]
+    assert (hour["count"], hour["score_sum"], hour["super_negative"], hour["positive"]) == (2, -1, 1, 1)
+    assert by_key[("hour", epoch(2025, 7, 2, 11))]["count"] == 1
+    day = by_key[("day", epoch(2025, 7, 2))]
+    assert (day["count"], day["score_sum"], day["neutral"]) == (3, -1, 0)
+    assert len(rows) == 4 # 시간 2 + 일 1 + 주 1
+    assert all(row["user_name"] == "alice" for row in rows)
+
+def test_downsample_merges_neighbouring_buckets_and_keeps_sums():
+    buckets = np.arange(10, dtype=np.int64) * 3600
+    counts = np.tile(np.array([1, 0, 0, 0, 1], dtype=np.int64), (10, 1))
+    totals = counts.sum(axis=1)
+    score_sums = counts @ analytics.SCORE_VECTOR
+
+    (merged, merged_counts, merged_totals, merged_scores), seconds = analytics.downsample_series(
+        (buckets, counts, totals, score_sums), 3600, max_points=4
+    )
+    assert seconds == 3 * 3600
+    assert merged.tolist() == [0, 3 * 3600, 6 * 3600, 9 * 3600]
+    assert merged_totals.tolist() == [6, 6, 6, 2]
+    assert merged_totals.sum() == totals.sum() and merged_scores.sum() == score_sums.sum()
+    assert merged_counts[:, 0].tolist() == [3, 3, 3, 1]
+
+def test_downsample_keeps_series_within_limit():
+    series = (np.array([0, 3600]), np.zeros((2, 5), dtype=np.int64), np.array([1, 1]), np.array([0, 0]))
+    assert analytics.downsample_series(series, 3600, max_points=2) == (series, 3600)
+
+def test_trend_endpoint_reads_rollups_and_raw_buckets(client):
+    for text in ("최악이야", "좋아", "좋아 정말"):
+        assert client.post("/analyze_emotion/", json={"user_name": "trend-user", "text": text}).status_code == 200
+
+    hourly = client.get("/analytics/emotions/trend-user", params={"granularity": "hour"}).json()["data"]
+    assert hourly["granularity"] == "hour"
+    assert sum(point["count"] for point in hourly["points"]) == 3
+    assert sum(point["counts"]["super positive"] for point in hourly["points"]) == 2
+
+    custom = client.get("/analytics/emotions/trend-user", params={"bucket_seconds": 600}).json()["data"]
+    assert custom["granularity"] == "custom"
+    assert sum(point["count"] for point in custom["points"]) == 3
+    assert client.get("/analytics/emotions/nobody", params={"format": "png"}).status_code == 404
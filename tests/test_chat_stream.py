@@ -0,0 +1,78 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from sqlalchemy.future import select
+
+from conftest import CHAT_RESPONSE
+from src import app as app_module
+from src.app import ChatRequest, stream_chat
+from src.emotion import emotion_states
+from src.models import ChatMessage, SessionLocal
+from src.sessions import chat_sessions
+
+def parse_event(raw):
+    event, data = raw.strip().split("\n", 1)
+    return event.removeprefix("event: ")
+
+async def start_stream(user_name, message, emotion_result):
+    async with SessionLocal() as db:
+        async with chat_sessions.session(user_name, db) as chatbot:
+            response = await stream_chat(ChatRequest(user_name=user_name, message=message), chatbot, emotion_result)
+    return response, set(app_module.stream_tasks)
+
+async def stored_messages(user_name):
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(ChatMessage.role, ChatMessage.content).where(ChatMessage.user_name == user_name).order_by(ChatMessage.seq)
+        )
+        return result.fetchall()
+
+def test_semaphore_is_released_before_a_slow_reader_catches_up(run, monkeypatch):
+    semaphore = asyncio.Semaphore(1)
+    monkeypatch.setattr(app_module, "llm_semaphore", semaphore)
+
+    async def scenario():
+        response, tasks = await start_stream("stream-slow", "오늘 좋아", "positive")
+        first = await response.body_iterator.__anext__()
+        await asyncio.wait(tasks) # 클라이언트는 아직 토큰을 하나도 읽지 않음
+        released = not semaphore.locked()
+        rest = [parse_event(raw) async for raw in response.body_iterator]
+        return parse_event(first), released, rest, await stored_messages("stream-slow")
+
+    first, released, rest, stored = run(scenario)
+    assert first == "emotion"
+    assert released
+    assert rest == ["token"] * len(CHAT_RESPONSE) + ["done"]
+    assert stored == [("HumanMessage", "오늘 좋아"), ("AIMessage", CHAT_RESPONSE)]
+
+def test_generation_error_is_reported_and_partial_turn_saved(run, monkeypatch):
+    monkeypatch.setattr(app_module, "get_llm", lambda: FakeListChatModel(responses=[CHAT_RESPONSE], error_on_chunk_number=3))
+
+    async def scenario():
+        response, tasks = await start_stream("stream-error", "너무 힘들어", "negative")
+        events = [parse_event(raw) async for raw in response.body_iterator]
+        await asyncio.wait(tasks)
+        return events, await stored_messages("stream-error")
+
+    events, stored = run(scenario)
+    assert events == ["emotion", "token", "token", "token", "error"]
+    assert stored == [("HumanMessage", "너무 힘들어"), ("AIMessage", CHAT_RESPONSE[:3])]
+    assert emotion_states.get("stream-error")["recent"][0][0] == "negative"
+
+def test_client_disconnect_stops_generation_and_keeps_what_was_generated(run, monkeypatch):
+    monkeypatch.setattr(app_module, "get_llm", lambda: FakeListChatModel(responses=[CHAT_RESPONSE], sleep=0.05))
+
+    async def scenario():
+        response, tasks = await start_stream("stream-gone", "안녕", "neutral")
+        await response.body_iterator.__anext__() # emotion
+        await response.body_iterator.__anext__() # 첫 토큰
+        await response.body_iterator.aclose()
+        await asyncio.wait(tasks)
+        chatbot = chat_sessions.sessions["stream-gone"]
+        return chatbot.pins, await stored_messages("stream-gone")
+
+    pins, stored = run(scenario)
+    assert pins == 0
+    assert stored[0] == ("HumanMessage", "안녕")
+    assert stored[1][0] == "AIMessage" and 0 < len(stored[1][1]) < len(CHAT_RESPONSE)
+    assert emotion_states.get("stream-gone")["recent"][0][0] == "neutral"
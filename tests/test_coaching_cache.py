@@ -0,0 +1,73 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+from src import coaching
+from src.coaching import CoachingCache
+
+def angle_vector(degrees):
+    radians = math.radians(degrees)
+    return [math.cos(radians), math.sin(radians)]
+
+class FakeEmbeddings:
+    """텍스트마다 정해 둔 2차원 벡터 (코사인 유사도 = 각도 차이의 cos)"""
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = 0
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        return self.vectors[text]
+
+@pytest.fixture
+def fake_embeddings(monkeypatch):
+    fake = FakeEmbeddings({
+        "오늘 너무 힘들어": angle_vector(0),
+        "오늘 진짜 힘들다": angle_vector(10), # cos 10° ≈ 0.985
+        "시험 망쳤어": angle_vector(40), # cos 40° ≈ 0.766
+    })
+    monkeypatch.setattr(coaching, "embeddings", fake)
+    return fake
+
+def remember(cache, emotion, text, response, vector):
+    cache._remember(cache.cache_key(emotion, text), (emotion, text, response, cache.normalize_vector(vector), time.time()))
+
+def test_similar_text_with_same_emotion_reuses_response(run, fake_embeddings):
+    cache = CoachingCache(maxsize=10, ttl=0, similarity=0.95)
+    remember(cache, "negative", "오늘 너무 힘들어", "푹 쉬어.", angle_vector(0))
+
+    response, vector = run(cache.lookup, "negative", "오늘 진짜 힘들다")
+    assert response == "푹 쉬어."
+    assert np.allclose(vector, angle_vector(10))
+    assert (cache.exact_hits, cache.semantic_hits, cache.misses) == (0, 1, 0)
+
+def test_text_below_threshold_or_other_emotion_misses(run, fake_embeddings):
+    cache = CoachingCache(maxsize=10, ttl=0, similarity=0.95)
+    remember(cache, "negative", "오늘 너무 힘들어", "푹 쉬어.", angle_vector(0))
+
+    assert run(cache.lookup, "negative", "시험 망쳤어")[0] is None
+    assert run(cache.lookup, "super negative", "오늘 진짜 힘들다")[0] is None
+    assert cache.misses == 2
+
+def test_lower_threshold_accepts_less_similar_text(run, fake_embeddings):
+    cache = CoachingCache(maxsize=10, ttl=0, similarity=0.75)
+    remember(cache, "negative", "오늘 너무 힘들어", "푹 쉬어.", angle_vector(0))
+    assert run(cache.lookup, "negative", "시험 망쳤어")[0] == "푹 쉬어."
+
+def test_similarity_above_one_only_matches_exact_text(run, fake_embeddings):
+    cache = CoachingCache(maxsize=10, ttl=0, similarity=1.01)
+    remember(cache, "negative", "오늘 너무 힘들어", "푹 쉬어.", None)
+
+    assert run(cache.lookup, "negative", "오늘 진짜 힘들다") == (None, None)
+    assert run(cache.lookup, "negative", "오늘 너무 힘들어") == ("푹 쉬어.", None)
+    assert fake_embeddings.calls == 0
+
+def test_expired_entries_are_not_reused(run, fake_embeddings):
+    cache = CoachingCache(maxsize=10, ttl=60, similarity=0.95)
+    key = cache.cache_key("negative", "오늘 너무 힘들어")
+    cache._remember(key, ("negative", "오늘 너무 힘들어", "푹 쉬어.", cache.normalize_vector(angle_vector(0)), time.time() - 120))
+
+    assert run(cache.lookup, "negative", "오늘 진짜 힘들다")[0] is None
+    assert len(cache.lru) == 0
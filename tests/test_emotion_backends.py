@@ -0,0 +1,52 @@
+"""감정 분석 백엔드(torch / torch-int8 / onnx)가 같은 라벨을 내는지 비교
+
+모델 파일이나 선택 의존성(torch, optimum[onnxruntime])이 없으면 건너뛴다.
+"""
+import pytest
+
+from src import emotion
+from src.emotion import EMOTION_LABELS, load_emotion_classifier, sentiment_to_emotion
+
+SAMPLES = [
+    "오늘 정말 최악이야. 아무것도 하기 싫어.",
+    "좀 피곤하고 우울해.",
+    "그냥 그런 하루였어.",
+    "친구랑 맛있는 거 먹어서 기분 좋아!",
+    "합격했어!!! 너무 행복해 최고야",
+    "I hate everything about this day.",
+    "This is the best news I have ever heard!",
+]
+BACKEND_REQUIREMENTS = {
+    "torch": ["torch"],
+    "torch-int8": ["torch"],
+    "onnx": ["torch", "optimum.onnxruntime"],
+}
+
+def load_backend(backend):
+    for module in BACKEND_REQUIREMENTS[backend]:
+        pytest.importorskip(module)
+    try:
+        return load_emotion_classifier(backend)
+    except OSError as e:
+        pytest.skip(f"{emotion.EMOTION_MODEL_NAME} 모델을 불러올 수 없음: {e}")
+
+def predict(classifier):
+    return [sentiment_to_emotion(result) for result in classifier(SAMPLES, batch_size=len(SAMPLES), truncation=True)]
+
+@pytest.fixture(scope="module")
+def reference():
+    return predict(load_backend("torch"))
+
+@pytest.fixture(autouse=True)
+def onnx_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(emotion, "EMOTION_ONNX_PATH", str(tmp_path / "onnx"))
+
+@pytest.mark.parametrize("backend", list(BACKEND_REQUIREMENTS))
+def test_backend_labels_map_to_emotions(backend):
+    classifier = load_backend(backend)
+    mapped = {sentiment_to_emotion({"label": label}) for label in classifier.model.config.id2label.values()}
+    assert mapped == set(EMOTION_LABELS)
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_matches_torch(backend, reference):
+    assert predict(load_backend(backend)) == reference
@@ -0,0 +1,55 @@
+import json
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from src import app as app_module
+from src.models import Emotion, SessionLocal
+
+def read_lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+async def count_emotions(user_names):
+    async with SessionLocal() as db:
+        return (await db.execute(
+            select(func.count()).select_from(Emotion).where(Emotion.user_name.in_(user_names))
+        )).scalar()
+
+def test_ndjson_streams_one_line_per_item_and_saves_valid_rows(client, run):
+    body = "\n".join([
+        json.dumps({"user_name": "batch-a", "text": "오늘 최악이야"}, ensure_ascii=False),
+        "{not json",
+        json.dumps({"user_name": "batch-a"}),
+        json.dumps({"user_name": "batch-b", "text": "너무 좋아"}, ensure_ascii=False),
+    ]) + "\n"
+    response = client.post("/analyze_emotion/batch", content=body.encode(), headers={"content-type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    *items, summary = read_lines(response)
+    assert [item["index"] for item in items] == [0, 1, 2, 3]
+    assert items[0]["data"]["analyzed_emotion"] == "super negative"
+    assert items[1]["status"] == "error" and items[1]["error"].startswith("Invalid JSON")
+    assert items[2]["status"] == "error" and "text" in items[2]["error"]
+    assert items[3]["data"]["analyzed_emotion"] == "super positive"
+    assert summary == {"status": "done", "total": 4, "succeeded": 2, "failed": 2, "saved": 2}
+    assert run(count_emotions, ["batch-a", "batch-b"]) == 2
+
+def test_json_array_is_split_into_chunks_in_order(client, monkeypatch):
+    monkeypatch.setattr(app_module, "EMOTION_BULK_CHUNK_SIZE", 2)
+    texts = ["좋아", "그냥 그래", "최악", "좋아", "보통"]
+    response = client.post("/analyze_emotion/batch", json=[{"user_name": "batch-c", "text": text} for text in texts])
+
+    *items, summary = read_lines(response)
+    assert [item["data"]["input_text"] for item in items] == texts
+    assert [item["data"]["analyzed_emotion"] for item in items] == ["super positive", "neutral", "super negative", "super positive", "neutral"]
+    assert summary["saved"] == len(texts)
+
+def test_rejects_more_items_than_the_limit(client, monkeypatch):
+    monkeypatch.setattr(app_module, "EMOTION_BULK_MAX_ITEMS", 2)
+    response = client.post("/analyze_emotion/batch", json=[{"user_name": "batch-d", "text": "좋아"}] * 3)
+    assert response.status_code == 413
+
+def test_rejects_non_array_json(client):
+    response = client.post("/analyze_emotion/batch", json={"user_name": "batch-d", "text": "좋아"})
+    assert response.status_code == 400
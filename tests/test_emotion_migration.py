@@ -0,0 +1,75 @@
+import datetime
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+
+from src.emotion import format_timestamp, load_emotion_state, normalize_recent, recent_emotions_from_state, to_epoch
+from src.migrations import _legacy_emotion_tables, _migrate_emotion_timestamps
+from src.models import Base, Emotion, EmotionHistory, EmotionRollup, EmotionState, SessionLocal
+
+LEGACY_SCHEMA = (
+    "CREATE TABLE emotion_history (id INTEGER PRIMARY KEY, user_name VARCHAR, emotion VARCHAR, timestamp VARCHAR)",
+    "CREATE INDEX ix_emotion_history_user_name ON emotion_history (user_name)",
+    "CREATE TABLE emotions (id INTEGER PRIMARY KEY, conversation_id INTEGER, emotion VARCHAR, timestamp VARCHAR)",
+)
+
+def test_legacy_string_timestamps_become_epoch_seconds(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    legacy_time = "2025-03-01 12:30:00"
+    legacy_epoch = int(time.mktime(datetime.datetime.strptime(legacy_time, "%Y-%m-%d %H:%M:%S").timetuple()))
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(
+            "INSERT INTO emotion_history (user_name, emotion, timestamp) VALUES "
+            "('kim', '슬픔', ?), ('kim', '기쁨', '1740800000'), ('kim', '중립', 1740900000)",
+            (legacy_time,)
+        )
+        conn.exec_driver_sql("INSERT INTO emotions (conversation_id, emotion, timestamp) VALUES (1, '분노', ?)", (legacy_time,))
+        Base.metadata.create_all(conn, checkfirst=True)
+        conn.execute(insert(EmotionState), [{
+            "user_name": "kim", "recent": f'[["슬픔", "{legacy_time}"]]', "counts": '{"슬픔": 1}', "total": 1, "updated_at": 0,
+        }])
+
+    with engine.begin() as conn:
+        assert set(_legacy_emotion_tables(conn)) == {"emotion_history", "emotions"}
+        migrated = _migrate_emotion_timestamps(conn)
+    assert migrated == {"emotion_history": 3, "emotions": 1}
+
+    with engine.connect() as conn:
+        assert _legacy_emotion_tables(conn) == []
+        history = conn.execute(select(EmotionHistory.emotion, EmotionHistory.timestamp).order_by(EmotionHistory.id)).all()
+        # 날짜 문자열은 로컬 시각 기준 epoch 초, 이미 epoch 초였던 값은 그대로
+        assert history == [("슬픔", legacy_epoch), ("기쁨", 1740800000), ("중립", 1740900000)]
+        assert conn.execute(select(Emotion.timestamp)).scalar_one() == legacy_epoch
+        assert conn.execute(select(EmotionState)).first() is None
+        assert conn.execute(select(EmotionRollup)).first() is not None
+
+    with engine.begin() as conn:
+        assert _migrate_emotion_timestamps(conn) == {}
+    engine.dispose()
+
+def test_timestamps_from_before_the_migration_are_normalized():
+    legacy_time = "2025-03-01 12:30:00"
+    legacy_epoch = int(time.mktime(datetime.datetime.strptime(legacy_time, "%Y-%m-%d %H:%M:%S").timetuple()))
+    assert to_epoch(legacy_time) == legacy_epoch
+    assert to_epoch("1740800000") == to_epoch(1740800000.5) == 1740800000
+    assert format_timestamp(legacy_time) == format_timestamp(legacy_epoch) == legacy_time
+    assert normalize_recent([["슬픔", legacy_time], ["기쁨", 1740800000]]) == [["슬픔", legacy_epoch], ["기쁨", 1740800000]]
+    with pytest.raises(ValueError):
+        format_timestamp("어제")
+
+def test_cached_state_row_with_string_timestamps_loads_as_epoch(run):
+    async def scenario():
+        async with SessionLocal() as db:
+            await db.execute(insert(EmotionState).values(
+                user_name="legacy-state", recent='[["슬픔", "2025-03-01 12:30:00"]]', counts='{"슬픔": 1}', total=1, updated_at=0,
+            ))
+            await db.commit()
+        state = await load_emotion_state("legacy-state")
+        return recent_emotions_from_state(state), state["recent"][0][1]
+
+    recent, timestamp = run(scenario)
+    assert recent == [{"emotion": "슬픔", "timestamp": "2025-03-01 12:30:00"}]
+    assert isinstance(timestamp, int)
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from src.emotion import EmotionWriteBehind, emotion_states, load_emotion_state, save_emotion
+from src.models import SessionLocal
+
+def test_state_evicted_from_cache_is_read_back_from_the_read_pool(run):
+    async def scenario():
+        async with SessionLocal() as db:
+            await save_emotion("state-reader", "negative", db)
+            saved = await save_emotion("state-reader", "positive", db)
+        saved = {**saved, "recent": list(saved["recent"])}
+        emotion_states.pop("state-reader")
+        return saved, await load_emotion_state("state-reader")
+
+    saved, loaded = run(scenario)
+    assert loaded == saved
+    assert [emotion for emotion, _ in loaded["recent"]] == ["positive", "negative"]
+
+def test_write_behind_counts_dropped_rows_separately():
+    writer = EmotionWriteBehind(max_batch_size=10, max_wait_ms=10, max_queue_size=10)
+
+    async def failing_write(history, emotions, states):
+        raise RuntimeError("database is locked")
+
+    writer._write = failing_write
+    batch = [
+        ("history", {"user_name": "drop", "emotion": "negative", "timestamp": 1}),
+        ("emotion", {"user_name": "drop", "emotion": "negative", "timestamp": 1, "conversation_id": 1}),
+    ]
+    started = time.perf_counter()
+    asyncio.run(writer._flush(batch))
+    elapsed = time.perf_counter() - started
+
+    stats = writer.stats()
+    assert (stats["rows"], stats["batches"], stats["dropped"], stats["errors"]) == (0, 0, 2, 3)
+    assert elapsed < 0.6 # 재시도 사이에만 대기 (0.1 + 0.2초), 마지막 실패 뒤에는 바로 버림
@@ -0,0 +1,53 @@
+import json
+
+from sqlalchemy import create_engine, insert, select
+
+from src.migrations import _migrate_memory_blobs
+from src.models import Base, ChatMessage, Memory
+
+def blob(*contents):
+    types = ("HumanMessage", "AIMessage")
+    return json.dumps(
+        [{"type": "SystemMessage", "content": "성격"}]
+        + [{"type": types[i % 2], "content": content} for i, content in enumerate(contents)],
+        ensure_ascii=False
+    )
+
+def history(conn, user_name):
+    return conn.execute(
+        select(ChatMessage.seq, ChatMessage.content).where(ChatMessage.user_name == user_name).order_by(ChatMessage.seq)
+    ).fetchall()
+
+def test_legacy_blobs_are_merged_ahead_of_new_messages(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'memory.db'}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        conn.execute(insert(Memory), [
+            {"user_name": "fresh", "chat_history": blob("안녕", "반가워")},
+            {"user_name": "chatted", "chat_history": blob("예전 질문", "예전 답")}, # 배포 후 새 대화가 먼저 저장됨
+            {"user_name": "done", "chat_history": blob("옮긴 질문", "옮긴 답")}, # 이전에 이미 옮긴 사용자
+        ])
+        conn.execute(insert(ChatMessage), [
+            {"user_name": "chatted", "seq": 0, "role": "HumanMessage", "content": "새 질문"},
+            {"user_name": "chatted", "seq": 1, "role": "AIMessage", "content": "새 답"},
+            {"user_name": "done", "seq": 0, "role": "HumanMessage", "content": "옮긴 질문"},
+            {"user_name": "done", "seq": 1, "role": "AIMessage", "content": "옮긴 답"},
+            {"user_name": "done", "seq": 2, "role": "HumanMessage", "content": "그다음 질문"},
+        ])
+
+    with engine.begin() as conn:
+        migrated = _migrate_memory_blobs(conn)
+    assert migrated == {
+        "fresh": [{"type": "HumanMessage", "content": "안녕"}, {"type": "AIMessage", "content": "반가워"}],
+        "chatted": [{"type": "HumanMessage", "content": "예전 질문"}, {"type": "AIMessage", "content": "예전 답"}],
+    }
+
+    with engine.connect() as conn:
+        assert history(conn, "fresh") == [(0, "안녕"), (1, "반가워")]
+        assert history(conn, "chatted") == [(-2, "예전 질문"), (-1, "예전 답"), (0, "새 질문"), (1, "새 답")]
+        assert history(conn, "done") == [(0, "옮긴 질문"), (1, "옮긴 답"), (2, "그다음 질문")]
+        assert conn.execute(select(Memory.id)).first() is None
+
+    with engine.begin() as conn:
+        assert _migrate_memory_blobs(conn) == {}
+    engine.dispose()
@@ -0,0 +1,13 @@
+from src import observability
+from src.observability import debug_dump_requested
+
+def test_debug_dump_header_is_ignored_without_a_token(monkeypatch):
+    monkeypatch.setattr(observability, "DEBUG_DUMP_TOKEN", "")
+    assert not debug_dump_requested("1")
+    assert not debug_dump_requested("true")
+
+def test_debug_dump_header_must_match_the_token(monkeypatch):
+    monkeypatch.setattr(observability, "DEBUG_DUMP_TOKEN", "dump-secret")
+    assert debug_dump_requested("dump-secret")
+    assert not debug_dump_requested("1")
+    assert not debug_dump_requested("")
@@ -0,0 +1,16 @@
+import pytest
+
+from src.runtime import acquire_process_lock
+
+def test_second_process_lock_on_the_same_db_fails(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'app.db'}"
+    first = acquire_process_lock(url)
+    try:
+        with pytest.raises(RuntimeError, match="worker"):
+            acquire_process_lock(str(tmp_path / "app.db")) # 파일 경로로 줘도 같은 lock
+    finally:
+        first.close()
+    acquire_process_lock(url).close() # 먼저 잡은 프로세스가 끝나면 다시 잡을 수 있음
+
+def test_in_memory_db_needs_no_lock():
+    assert acquire_process_lock("sqlite+aiosqlite:///:memory:") is None
@@ -0,0 +1,55 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.rag import UserShardedIndex
+
+def docs(user_name, *contents):
+    return [Document(page_content=content, metadata={"user": user_name, "type": "HumanMessage"}) for content in contents]
+
+def test_evicted_shard_is_saved_before_it_can_be_reloaded(run, tmp_path):
+    index = UserShardedIndex(str(tmp_path), DeterministicFakeEmbedding(size=32), memory_budget=0)
+
+    async def scenario():
+        await index.add_documents("a", docs("a", "고양이 이야기"))
+        await index.add_documents("b", docs("b", "강아지 이야기"))
+        evicted = "a" not in index.shards
+        found = await index.search("a", "고양이 이야기", k=1, score_threshold=float("-inf"))
+        return evicted, [doc.page_content for doc in found]
+
+    evicted, found = run(scenario)
+    assert evicted
+    assert found == ["고양이 이야기"]
+    assert index.user_locks == {} # 사용이 끝난 사용자 lock은 남지 않음
+
+def test_empty_shards_are_not_kept(run, tmp_path):
+    index = UserShardedIndex(str(tmp_path), DeterministicFakeEmbedding(size=32), memory_budget=1024 * 1024)
+
+    async def scenario():
+        for user_name in ("empty-1", "empty-2", "empty-3"):
+            assert await index.search(user_name, "안녕", k=1, score_threshold=float("-inf")) == []
+        return list(index.shards)
+
+    assert run(scenario) == ["empty-3"]
+
+def test_rebuild_waits_for_active_requests_and_blocks_new_ones(run, tmp_path):
+    index = UserShardedIndex(str(tmp_path), DeterministicFakeEmbedding(size=32), memory_budget=1024 * 1024)
+
+    async def load_documents(db):
+        return docs("a", "DB에 있는 대화")
+
+    async def scenario():
+        async with index._using():
+            rebuild = asyncio.create_task(index.rebuild(load_documents))
+            await asyncio.sleep(0.01)
+            assert index.rebuilding and not rebuild.done()
+            add = asyncio.create_task(index.add_documents("a", docs("a", "재생성 중에 들어온 대화")))
+            await asyncio.sleep(0.01)
+            assert not add.done()
+        await rebuild
+        await add
+        found = await index.search("a", "대화", k=5, score_threshold=float("-inf"))
+        return sorted(doc.page_content for doc in found)
+
+    assert run(scenario) == ["DB에 있는 대화", "재생성 중에 들어온 대화"]
@@ -0,0 +1,170 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlalchemy import insert
+from sqlalchemy.future import select
+
+from src import sessions
+from src.models import ChatMessage, ConversationSummary, SessionLocal
+from src.sessions import Chatbot, ChatbotSessionManager
+
+def add_turn(chatbot, message, response):
+    chatbot.memory_buffer.chat_memory.messages.append(HumanMessage(content=message))
+    chatbot.memory_buffer.chat_memory.messages.append(AIMessage(content=response))
+    chatbot.dirty = True
+
+async def stored_messages(user_name):
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(ChatMessage.role, ChatMessage.content).where(ChatMessage.user_name == user_name).order_by(ChatMessage.seq)
+        )
+        return result.fetchall()
+
+def test_pinned_session_survives_overflow_and_is_flushed_on_eviction(run):
+    manager = ChatbotSessionManager(max_sessions=1, idle_timeout=3600, flush_interval=3600)
+
+    async def scenario():
+        async with SessionLocal() as db:
+            async with manager.session("pin-a", db) as a:
+                # 다른 사용자가 들어와도 사용 중인 세션은 내보내지 않음
+                async with manager.session("pin-b", db):
+                    assert set(manager.sessions) == {"pin-a", "pin-b"}
+                add_turn(a, "오늘 좀 힘들어", "무슨 일 있었어?")
+                assert manager.sessions["pin-a"] is a
+
+            async with manager.session("pin-c", db):
+                await manager.overflow_task # 요청 경로 밖에서 정리
+                assert list(manager.sessions) == ["pin-c"] # 고정이 풀린 오래된 세션부터 저장 후 제거
+            assert not a.dirty
+            flushed = await stored_messages("pin-a")
+
+            async with manager.session("pin-a", db) as reloaded:
+                history = [m.content for m in reloaded.memory_buffer.chat_memory.messages[1:]]
+        return flushed, reloaded is a, history
+
+    flushed, same_object, history = run(scenario)
+    assert flushed == [("HumanMessage", "오늘 좀 힘들어"), ("AIMessage", "무슨 일 있었어?")]
+    assert not same_object
+    assert history == ["오늘 좀 힘들어", "무슨 일 있었어?"]
+
+def test_request_during_eviction_flush_reuses_the_flushing_session(run):
+    manager = ChatbotSessionManager(max_sessions=10, idle_timeout=3600, flush_interval=3600)
+
+    async def scenario():
+        async with SessionLocal() as db:
+            async with manager.session("flush-a", db) as chatbot:
+                add_turn(chatbot, "첫 번째", "응답 1")
+
+            await chatbot.lock.acquire() # write_back이 끝나지 않은 상태를 만든다
+            eviction = asyncio.create_task(manager._evict("flush-a"))
+            await asyncio.sleep(0)
+            assert manager.sessions["flush-a"] is chatbot # 저장이 끝날 때까지 캐시에 남음
+
+            async with manager.session("flush-a", db) as again:
+                chatbot.lock.release()
+                await eviction
+                async with again.lock:
+                    add_turn(again, "두 번째", "응답 2")
+            await manager.stop()
+        return again is chatbot, await stored_messages("flush-a")
+
+    same_object, stored = run(scenario)
+    assert same_object
+    assert [content for _, content in stored] == ["첫 번째", "응답 1", "두 번째", "응답 2"]
+
+def test_failed_eviction_keeps_the_session_and_does_not_fail_other_requests(run, monkeypatch):
+    manager = ChatbotSessionManager(max_sessions=1, idle_timeout=3600, flush_interval=3600)
+
+    async def failing_save(db):
+        raise RuntimeError("DB down")
+
+    async def scenario():
+        async with SessionLocal() as db:
+            async with manager.session("evict-fail-a", db) as a:
+                add_turn(a, "저장 안 된 질문", "저장 안 된 답")
+            monkeypatch.setattr(a, "save_memory", failing_save)
+            async with manager.session("evict-fail-b", db):
+                await manager.overflow_task
+                kept = manager.sessions.get("evict-fail-a") is a and a.dirty
+            monkeypatch.undo()
+            async with manager.session("evict-fail-c", db):
+                await manager.overflow_task
+        return kept, "evict-fail-a" in manager.sessions, await stored_messages("evict-fail-a")
+
+    kept, still_cached, stored = run(scenario)
+    assert kept
+    assert not still_cached # 다음 정리 때 저장 후 제거
+    assert stored == [("HumanMessage", "저장 안 된 질문"), ("AIMessage", "저장 안 된 답")]
+
+def test_window_keeps_the_last_turn_even_when_it_is_over_budget(monkeypatch):
+    monkeypatch.setattr(sessions, "MEMORY_MODE", "window")
+    chatbot = Chatbot(user_name="window-long")
+    chatbot.set_chatbot_personality()
+    system_tokens = sum(sessions.count_tokens(m.content) for m in chatbot._system_messages())
+    monkeypatch.setattr(sessions, "MEMORY_TOKEN_BUDGET", system_tokens + 60)
+    add_turn(chatbot, "짧은 예전 질문", "짧은 예전 답")
+    add_turn(chatbot, "아주 긴 고민 " * 100, "응")
+
+    context = chatbot.context_messages()
+    turn = context[len(chatbot._system_messages()):]
+    assert [type(m) for m in turn] == [HumanMessage, AIMessage]
+    assert turn[0].content.startswith("아주 긴 고민") and turn[0].content.endswith("…")
+    assert turn[1].content == "응"
+    assert sum(sessions.count_tokens(m.content) for m in turn) <= 60
+
+def test_window_mode_loads_every_unsummarized_message(run, monkeypatch):
+    monkeypatch.setattr(sessions, "MEMORY_MODE", "window")
+    monkeypatch.setattr(sessions, "MEMORY_LOAD_MESSAGES", 10)
+
+    async def scenario():
+        async with SessionLocal() as db:
+            await db.execute(insert(ChatMessage), [
+                {"user_name": "window-load", "seq": seq, "role": ("HumanMessage", "AIMessage")[seq % 2], "content": f"메시지 {seq}"}
+                for seq in range(80)
+            ])
+            await db.commit()
+            chatbot = Chatbot(user_name="window-load")
+            await chatbot.async_init(db)
+        in_window = [m.content for m in chatbot.memory_buffer.chat_memory.messages[1:]]
+        await chatbot.summary_task
+        async with SessionLocal() as db:
+            summarized_seq = (await db.execute(
+                select(ConversationSummary.summarized_seq).where(ConversationSummary.user_name == "window-load")
+            )).scalar_one()
+        return chatbot, in_window, summarized_seq
+
+    chatbot, in_window, summarized_seq = run(scenario)
+    # MEMORY_LOAD_MESSAGES보다 오래된 메시지도 버려지지 않고 예산 밖의 메시지는 요약으로 넘어감
+    assert 0 < chatbot.first_seq < 70
+    assert in_window == [f"메시지 {seq}" for seq in range(chatbot.first_seq, 80)]
+    assert summarized_seq == chatbot.first_seq - 1
+    assert chatbot.next_seq == 80
+
+def test_failed_index_add_does_not_insert_the_turn_again(run, monkeypatch):
+    indexed = []
+
+    async def failing_add(user_name, documents):
+        raise RuntimeError("embedding API down")
+
+    async def scenario():
+        manager = ChatbotSessionManager(max_sessions=10, idle_timeout=3600, flush_interval=3600)
+        async with SessionLocal() as db:
+            async with manager.session("index-down", db) as chatbot:
+                add_turn(chatbot, "hi", "yo")
+        monkeypatch.setattr(sessions.rag_index, "add_documents", failing_add)
+        for _ in range(3):
+            chatbot.dirty = True
+            await manager.write_back(chatbot)
+        unindexed = len(chatbot.unindexed)
+
+        async def working_add(user_name, documents):
+            indexed.extend(doc.page_content for doc in documents)
+        monkeypatch.setattr(sessions.rag_index, "add_documents", working_add)
+        await manager.write_back(chatbot) # dirty가 아니어도 인덱스 반영은 다시 시도
+        return unindexed, chatbot.unindexed, await stored_messages("index-down")
+
+    unindexed, remaining, stored = run(scenario)
+    assert stored == [("HumanMessage", "hi"), ("AIMessage", "yo")]
+    assert unindexed == 2
+    assert remaining == []
+    assert indexed == ["hi", "yo"]